@@ -2,10 +2,35 @@
 # DASHBOARD COMERCIAL BRASFORMA – VERSÃO FINAL CORPORATIVA
 # ============================================================
 
+import json
+import os
+import time
+import tracemalloc
+
 import streamlit as st
 import pandas as pd
-import numpy as np
-import plotly.express as px
+
+# Copy-on-Write (padrão a partir do pandas 3): recortes da base compartilhada
+# nunca escrevem nela e seleções de colunas não copiam dados
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+from instrumentacao import (
+    iniciar_execucao,
+    registros,
+    configurar_log,
+    medir,
+    marco,
+    encerrar_marcos,
+    ModuloPreguicoso,
+    TEMPOS_IMPORTACAO
+)
+
+# Módulos pesados só são importados no primeiro uso (depois dos cartões
+# executivos já estarem na tela)
+px = ModuloPreguicoso("plotly.express")
+compra_conjunta = ModuloPreguicoso("compra_conjunta")
+consulta_parquet = ModuloPreguicoso("consulta_parquet")
 
 # ===========================================================
 # FORMATAÇÃO GLOBAL PADRONIZADA – válido para o dashboard inteiro
@@ -84,9 +109,101 @@ from inteligencia_comercial import (
     clientes_em_queda,
     skus_em_tendencia,
     cesta_por_regiao,
-    detectar_anomalias
+    detectar_anomalias,
+    calcular_rfm,
+    indice_pertencimento,
+    filtrar_por_pertencimento,
+    classificar_skus,
+    LIMITES_CLASSIFICACAO_SKU,
+    alertas_carteira,
+    LIMITES_ALERTA,
+    SEVERIDADES,
+    primeira_compra,
+    coortes_clientes
+)
+from previsao_comercial import DIMENSOES_PREVISAO, HORIZONTE_PADRAO, previsoes_faturamento
+from pipeline_brasforma import load_brasforma
+from versoes_base import PASTA_VERSOES, diferencas_versoes, listar_versoes
+from simulador_cenarios import (
+    COLUNAS_CUBO,
+    TIPOS_CHOQUE,
+    cubo_cenarios,
+    simular_cenario,
+    resumo_cenario,
+    cenario_por
+)
+from atualizador_base import ARQUIVO_PADRAO, obter_atualizador
+from calculos_comerciais import (
+    opcoes_filtros,
+    limites_periodo,
+    contar_linhas,
+    aplicar_filtros,
+    kpis_gerais,
+    variacao_periodo_anterior,
+    concentracao_top_clientes,
+    saldo_clientes_por_representante,
+    serie_mensal,
+    GRAOS_TEMPO,
+    rollups_tempo,
+    serie_por_grao,
+    comparativo_ano_anterior,
+    resumo_recorte,
+    ranking_clientes,
+    ranking_representantes,
+    ranking_ufs,
+    ranking_skus,
+    ranking_representantes_completo,
+    CORTES_ABC,
+    curva_abc,
+    resumo_abc,
+    clientes_novos_perdidos,
+    COMPONENTES_IMPOSTO,
+    analise_tributaria,
+    composicao_tributaria,
+    desvios_tributarios,
+    faturamento_por,
+    top_faturamento,
+    DIMENSOES_ATRASO,
+    metricas_atraso,
+    QUANTIS_LEADTIME,
+    QUEBRAS_LEADTIME,
+    histogramas_leadtime,
+    percentis_leadtime,
+    pedidos_fora_da_curva
 )
 
+SIGLAS_UF = {
+    "Acre": "AC", "Alagoas": "AL", "Amapá": "AP", "Amazonas": "AM", "Bahia": "BA",
+    "Ceará": "CE", "Distrito Federal": "DF", "Espírito Santo": "ES", "Goiás": "GO",
+    "Maranhão": "MA", "Mato Grosso": "MT", "Mato Grosso do Sul": "MS", "Minas Gerais": "MG",
+    "Pará": "PA", "Paraíba": "PB", "Paraná": "PR", "Pernambuco": "PE", "Piauí": "PI",
+    "Rio de Janeiro": "RJ", "Rio Grande do Norte": "RN", "Rio Grande do Sul": "RS",
+    "Rondônia": "RO", "Roraima": "RR", "Santa Catarina": "SC", "São Paulo": "SP",
+    "Sergipe": "SE", "Tocantins": "TO",
+}
+
+# Cortes dos rankings "Top N" (cesta regional e análises individuais)
+TOP_CESTA_UF = 5
+TOP_CLIENTES_UF = 15
+TOP_MIX_UF = 20
+TOP_CLIENTES_SKU = 20
+TOP_RELACIONADOS = 20
+
+# SLA de entrega sugerido na aba de atrasos (dias de lead time)
+SLA_LEADTIME_PADRAO = 30
+
+# Limites dos caches por visão filtrada: cada combinação de filtros é uma
+# entrada nova, e sem limite o processo guardaria todas as visões já abertas
+MAX_VISOES_CACHE = 32
+TTL_VISOES_CACHE = 3600  # segundos
+# O índice de compra conjunta (matrizes cliente × SKU) é o maior deles
+MAX_INDICES_COMPRA = 4
+# Bases enviadas por upload (e derivados), do arquivo mais recente para trás
+MAX_BASES_UPLOAD = 3
+
+# Pasta da base Parquet (consulta_parquet.py); definida, a sidebar oferece o modo DuckDB
+PASTA_PARQUET = os.environ.get("BRASFORMA_PASTA_PARQUET")
+
 
 # ============================================================
 # CONFIGURAÇÃO INICIAL
@@ -95,12 +212,22 @@ st.set_page_config(
     page_title="Brasforma – Dashboard Comercial",
     layout="wide",
 )
+
+# Instrumentação: registros desta execução + log estruturado (JSON por linha)
+iniciar_execucao()
+configurar_log(os.environ.get("BRASFORMA_LOG_DESEMPENHO"))
 st.markdown("""
 <style>
 
-    /* reduz topo do app */
+    /* reduz o espaço em cima e embaixo do app */
     .block-container {
-        padding-top: 1.2rem;
+        padding-top: 1rem;
+        padding-bottom: 2rem;
+    }
+
+    /* evita título gigante estourando layout */
+    h1 {
+        font-size: 1.8rem !important;
     }
 
     /* cartões executivos */
@@ -126,25 +253,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Ajuste global de layout (padding e títulos)
-st.markdown(
-    """
-    <style>
-        /* reduz o espaço em cima e embaixo do app */
-        .block-container {
-            padding-top: 1rem;
-            padding-bottom: 2rem;
-        }
-
-        /* evita título gigante estourando layout */
-        h1 {
-            font-size: 1.8rem !important;
-        }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
-
 
 # LOGO
 try:
@@ -153,110 +261,245 @@ except:
     pass
 
 # ============================================================
-# FUNÇÕES AUXILIARES
+# PIPELINE OFICIAL – BRASFORMA (pipeline_brasforma.py)
 # ============================================================
 
-def to_num(x):
-    if pd.isna(x): 
-        return np.nan
-    if isinstance(x, (int, float)): 
-        return float(x)
-    s = str(x).replace(".", "").replace(",", ".")
-    try:
-        return float(s)
-    except:
-        return np.nan
+@st.cache_resource(show_spinner="Carregando base...", max_entries=MAX_BASES_UPLOAD)
+def carregar_base(path, sheet="BD DASH"):
+    """
+    Base tratada, única por processo e compartilhada entre as sessões.
+
+    Colunas derivadas (Transação, lead time, mês do pedido) são criadas na
+    ingestão; as abas só leem a base e trabalham sobre recortes dela.
+    """
+    return load_brasforma(path, sheet)
 
 
-# ============================================================
-# PIPELINE OFICIAL – BRASFORMA
-# ============================================================
+@st.cache_resource(show_spinner=False, max_entries=MAX_BASES_UPLOAD)
+def rollups_base(path, sheet="BD DASH"):
+    """Rollups por grão de tempo da base enviada (uma vez por arquivo)"""
+    return rollups_tempo(carregar_base(path, sheet))
 
-@st.cache_data
-def load_brasforma(path: str, sheet="BD DASH"):
-    df = pd.read_excel(path, sheet_name=sheet)
-    df.columns = [c.strip() for c in df.columns]
 
-    # Datas
-    date_cols = [
-        "Data / Mês","Data Final","Data do Pedido",
-        "Data da Entrega","Data Inserção"
-    ]
-    for col in date_cols:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce")
-
-    # Numéricos base
-    numeric_base = ["Valor Pedido R$", "Custo", "Quant. Pedidos"]
-    for col in numeric_base:
-        if col in df.columns:
-            df[col] = df[col].apply(to_num)
-
-    # Impostos
-    impostos_cols = [
-        "cofins","pis","ipi","icms","ipiReturned-T","icmsSt",
-        "ipi-T","aproxtribFed","aproxtribState","cofinsDeson",
-        "pisDeson","icmsDeson","icmsStFCP","icmsDifaRemet",
-        "icmsDifaDest","icmsDifaFCP"
+@st.cache_resource(show_spinner=False, max_entries=MAX_BASES_UPLOAD)
+def histogramas_base(path, sheet="BD DASH"):
+    """Histogramas de lead time da base enviada (uma vez por arquivo)"""
+    return histogramas_leadtime(carregar_base(path, sheet))
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_BASES_UPLOAD)
+def previsoes_base(path, sheet="BD DASH"):
+    """Previsões de faturamento por cliente e SKU da base enviada (uma vez por arquivo)"""
+    return previsoes_faturamento(carregar_base(path, sheet))
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_BASES_UPLOAD)
+def primeiras_compras_base(path, sheet="BD DASH"):
+    """Mês da primeira compra de cada cliente da base enviada (uma vez por arquivo)"""
+    return primeira_compra(carregar_base(path, sheet))
+
+
+@st.cache_resource(show_spinner="Abrindo base Parquet...")
+def base_parquet(pasta):
+    """
+    Base Parquet consultada via DuckDB (uma conexão por processo).
+
+    Só os agregados voltam ao Python; a memória das consultas fica limitada
+    pelo memory_limit do DuckDB (BRASFORMA_MEMORIA_DUCKDB, padrão 1GB).
+    """
+    return consulta_parquet.BaseParquet(pasta, memoria=os.environ.get("BRASFORMA_MEMORIA_DUCKDB", "1GB"))
+
+
+@st.cache_resource(show_spinner=False)
+def opcoes_base_parquet(pasta):
+    """Opções dos filtros da base Parquet (uma vez por processo)"""
+    return opcoes_filtros(base_parquet(pasta))
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_VISOES_CACHE, ttl=TTL_VISOES_CACHE)
+def coortes_visao(df, primeiras):
+    """Coortes de clientes da visão filtrada (refeitas só quando os filtros mudam)"""
+    return coortes_clientes(df, primeiras)
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_VISOES_CACHE, ttl=TTL_VISOES_CACHE)
+def cubo_cenarios_visao(df):
+    """Cubo SKU × UF do simulador para a visão filtrada (refeito só quando os filtros mudam)"""
+    return cubo_cenarios(df)
+
+
+def choques_do_editor(tabela):
+    """Linhas do editor de choques no formato de simular_cenario (células vazias = sem recorte)"""
+    def texto(v):
+        return "" if pd.isna(v) else str(v).strip()
+
+    return [
+        {
+            "tipo": linha["Tipo"],
+            "pct": 0.0 if pd.isna(linha["%"]) else float(linha["%"]),
+            "uf": [uf.strip().upper() for uf in texto(linha["UFs"]).split(",") if uf.strip()],
+            "item": texto(linha["SKU contém"]),
+            "componente": texto(linha["Componente"]) or None,
+        }
+        for linha in tabela.to_dict("records")
+        if texto(linha["Tipo"]) in TIPOS_CHOQUE
     ]
 
-    for col in impostos_cols:
-        if col not in df.columns:
-            df[col] = 0
-        df[col] = df[col].apply(to_num)
 
-    df["Imposto Total"] = df[impostos_cols].sum(axis=1)
+@st.cache_resource(show_spinner=False, max_entries=MAX_INDICES_COMPRA, ttl=TTL_VISOES_CACHE)
+def indice_compra_conjunta(df):
+    """
+    Índice cliente × SKU da visão filtrada (refeito só quando os filtros mudam).
 
-    # Faturamento Líquido
-    df["Faturamento Líquido"] = df["Valor Pedido R$"] - df["Imposto Total"]
+    Em cache_resource: o índice é só lido, então as reexecuções o reusam
+    sem serializar as matrizes a cada acerto de cache. Poucas entradas e
+    com validade: cada filtro novo montaria mais um índice no processo.
+    """
+    return compra_conjunta.IndiceCompraConjunta.construir(df)
 
-    # Custo Total
-    df["Custo Total"] = df["Custo"] * df["Quant. Pedidos"]
 
-    # Lucro Bruto
-    df["Lucro Bruto"] = df["Valor Pedido R$"] - df["Custo Total"]
+@st.cache_resource(show_spinner=False)
+def geojson_estados():
+    """Geojson dos estados (lido uma vez por processo), com a sigla da UF como id"""
+    caminho = os.path.join(os.path.dirname(os.path.abspath(__file__)), "brasil_estados.geojson")
+    with open(caminho, "r", encoding="utf-8") as f:
+        geojson = json.load(f)
+    for feature in geojson["features"]:
+        feature["id"] = SIGLAS_UF.get(feature["properties"]["name"])
+    return geojson
 
-    df["Margem %"] = np.where(
-        df["Valor Pedido R$"] > 0,
-        100 * df["Lucro Bruto"] / df["Valor Pedido R$"],
-        np.nan
-    )
 
-    # Ano / Mês
-    df["Ano"] = df["Data / Mês"].dt.year
-    df["Mes"] = df["Data / Mês"].dt.month
-    df["Ano-Mes"] = df["Data / Mês"].dt.to_period("M").astype(str)
+@st.cache_data(show_spinner=False, max_entries=MAX_VISOES_CACHE, ttl=TTL_VISOES_CACHE)
+def tributos_visao(df):
+    """Análise tributária por SKU e UF da visão filtrada (refeita só quando os filtros mudam)"""
+    return analise_tributaria(df, {"SKU": "ITEM", "UF": "UF"})
 
-    # Lead Time
-    df["LeadTime (dias)"] = (
-        df["Data da Entrega"] - df["Data do Pedido"]
-    ).dt.days
 
-    # Atraso
-    df["AtrasadoFlag"] = df["Atrasado / No prazo"].astype(str).str.contains(
-        "Atr", case=False, na=False
+@st.cache_data(show_spinner=False, max_entries=MAX_VISOES_CACHE, ttl=TTL_VISOES_CACHE)
+def metricas_atraso_visao(df):
+    """Métricas de atraso da visão filtrada por dimensão (refeitas só quando os filtros mudam)"""
+    return metricas_atraso(df, DIMENSOES_ATRASO)
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_VISOES_CACHE, ttl=TTL_VISOES_CACHE)
+def curva_abc_visao(ranking, metrica, cortes):
+    """Curva ABC de um ranking da visão filtrada (em cache; o Top N só fatia a curva)"""
+    return curva_abc(ranking, metrica, cortes)
+
+
+def tabela_resumo_abc(curva):
+    """Quantidade e participação no faturamento de cada classe ABC"""
+    st.dataframe(
+        format_dataframe(
+            resumo_abc(curva),
+            money_cols=["FatLiq"],
+            pct_cols=["% Qtd", "% FatLiq"],
+            int_cols=["Qtd"],
+        ),
+        use_container_width=True,
+        hide_index=True,
     )
 
-    # Chave Única
-    df["PedidoItemKey"] = df["Pedido"].astype(str) + "-" + df["ITEM"].astype(str)
 
-    return df
+@st.cache_data(show_spinner=False, max_entries=MAX_VISOES_CACHE, ttl=TTL_VISOES_CACHE)
+def mudancas_versoes(pasta, antes, depois, assinaturas):
+    """Diferenças entre duas versões gravadas (as assinaturas só entram na chave do cache)"""
+    return diferencas_versoes(antes, depois, pasta)
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_VISOES_CACHE, ttl=TTL_VISOES_CACHE)
+def classificacao_skus(sku, limites):
+    """Categoria IA por SKU, em cache por visão filtrada e conjunto de limites"""
+    return classificar_skus(sku, limites)
+
+
+# ============================================================
+# PAINEL DE DESEMPENHO (ADMIN) E RODAPÉ
+# ============================================================
+def usuario_admin():
+    """Admin = ?admin=<token> igual a BRASFORMA_ADMIN_TOKEN (sem token, ninguém)"""
+    token = os.environ.get("BRASFORMA_ADMIN_TOKEN")
+    return bool(token) and st.query_params.get("admin") == token
+
+
+def painel_desempenho():
+    """Tempos e memória das seções da execução corrente (sidebar, só admin)"""
+    with st.sidebar.expander("⏱️ Desempenho da Última Execução", expanded=False):
+        medir_memoria = st.checkbox(
+            "Medir memória (tracemalloc)",
+            value=tracemalloc.is_tracing(),
+            help="Vale para o processo inteiro a partir da próxima execução; deixa tudo mais lento."
+        )
+        # O tracemalloc não separa threads: a memória de uma seção inclui o que
+        # outras sessões alocaram ao mesmo tempo (medida isolada: benchmark_brasforma.py)
+        if medir_memoria and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not medir_memoria and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        desempenho = pd.DataFrame(registros())
+        if desempenho.empty:
+            st.info("Nenhuma seção medida nesta execução.")
+        else:
+            topo = desempenho[desempenho["nivel"] == 0]
+            st.metric("Tempo total (s)", f"{topo['tempo_s'].sum():.2f}".replace(".", ","))
+            st.dataframe(
+                desempenho.sort_values("tempo_s", ascending=False)[
+                    ["secao", "tempo_s", "linhas_entrada", "linhas_saida", "memoria_mb", "nivel"]
+                ].rename(columns={"memoria_mb": "memoria_processo_mb"}),
+                use_container_width=True,
+                hide_index=True
+            )
+            if tracemalloc.is_tracing():
+                st.caption(
+                    "memoria_processo_mb: alocação líquida do processo inteiro durante a "
+                    "seção, incluindo outras sessões abertas. Para a memória de uma seção "
+                    "isolada, use o benchmark_brasforma.py."
+                )
+
+        if TEMPOS_IMPORTACAO:
+            st.caption("Importações sob demanda (primeira vez no processo)")
+            st.dataframe(
+                pd.DataFrame(
+                    sorted(TEMPOS_IMPORTACAO.items(), key=lambda x: -x[1]),
+                    columns=["modulo", "tempo_s"]
+                ),
+                use_container_width=True,
+                hide_index=True
+            )
+
+
+def encerrar_pagina():
+    """Fecha as medições, mostra o painel do admin e o rodapé (fim normal ou st.stop)"""
+    encerrar_marcos()
+    if usuario_admin():
+        painel_desempenho()
+
+    st.markdown("---")
+    st.caption("Powered by Brasforma • Arquitetura Comercial Inteligente • IA aplicada a dados corporativos.")
 
 
 # ============================================================
 # CARREGAR BASE (NOVO – via uploader ou arquivos internos)
 # ============================================================
 
+marco("carregar_base")
+
 st.sidebar.title("Carregamento da Base")
 
+modos_base = ["Arquivo padrão", "Upload manual (.xlsx)"]
+if PASTA_PARQUET:
+    modos_base.append("Base Parquet (DuckDB)")
+
 modo_base = st.sidebar.radio(
     "Como deseja carregar a base?",
-    ["Arquivo padrão", "Upload manual (.xlsx)"],
+    modos_base,
     index=0
 )
+modo_parquet = modo_base == "Base Parquet (DuckDB)"
 
 # Caminho padrão na estrutura atual do projeto:
-arquivo_padrao = "Dashboard - Comite Semanal - Brasforma IA (1).xlsx"
+arquivo_padrao = ARQUIVO_PADRAO
 
 data_path = None
 
@@ -271,20 +514,54 @@ elif modo_base == "Upload manual (.xlsx)":
         st.warning("Envie um arquivo para continuar.")
         st.stop()
 
+elif modo_parquet:
+    data_path = PASTA_PARQUET
+
 st.sidebar.caption(f"📄 Arquivo selecionado: **{data_path}**")
 
-# Carregar base usando sua função atual
-df = load_brasforma(data_path)
+if modo_parquet:
+    # Histórico grande: filtros e agregações rodam no DuckDB, sem a base em
+    # memória. Rollups, histogramas e previsões (que varrem a base inteira)
+    # não existem neste modo; as séries saem direto das linhas filtradas
+    df = base_parquet(data_path)
+    opcoes = opcoes_base_parquet(data_path)
+    rollups = None
+elif data_path == arquivo_padrao:
+    # Versão vigente da planilha padrão (recarregada em segundo plano; já
+    # carregada ao subir o servidor quando iniciado por iniciar_dashboard.py)
+    with st.spinner("Carregando base..."):
+        atualizador = obter_atualizador(arquivo_padrao)
+    versao_base = atualizador.atual()
+    df = versao_base.df
+    opcoes = versao_base.extras["opcoes_filtros"]
+    rollups = versao_base.extras["rollups_tempo"]
+    hist_leadtime = versao_base.extras["histogramas_leadtime"]
+    previsoes = versao_base.extras["previsoes_faturamento"]
+    primeiras = versao_base.extras["primeira_compra"]
+    st.sidebar.caption(
+        f"🔄 Versão {versao_base.numero} · carregada às "
+        f"{time.strftime('%d/%m %H:%M', time.localtime(versao_base.carregada_em))}"
+    )
+    if atualizador.ultimo_erro:
+        st.sidebar.warning(f"Nova planilha não pôde ser lida; mantendo a versão atual. ({atualizador.ultimo_erro})")
+else:
+    df = carregar_base(data_path)
+    opcoes = opcoes_filtros(df)
+    rollups = rollups_base(data_path)
+    hist_leadtime = histogramas_base(data_path)
+    previsoes = previsoes_base(data_path)
+    primeiras = primeiras_compras_base(data_path)
 
 # ============================================================
 # SIDEBAR – FILTROS (VERSÃO CORRIGIDA E 100% VÁLIDA)
 # ============================================================
 
+marco("filtros", contar_linhas(df))
+
 st.sidebar.header("Filtros")
 
 # ---- Período ----
-min_d = df["Data / Mês"].min()
-max_d = df["Data / Mês"].max()
+min_d, max_d = limites_periodo(df)
 
 periodo = st.sidebar.date_input(
     "Período",
@@ -293,113 +570,56 @@ periodo = st.sidebar.date_input(
     max_value=max_d,
 )
 
-df_f = df[
-    (df["Data / Mês"] >= pd.to_datetime(periodo[0])) &
-    (df["Data / Mês"] <= pd.to_datetime(periodo[1]))
-].copy()
+filtros = {"periodo": periodo}
 
 # ---- Transação (COLUNA C DA BASE) ----
-# Garante nome correto mesmo que o arquivo venha diferente
-col_trans = None
-for c in df.columns:
-    if c.strip().lower() in ["transacao", "transação", "transaction", "transacao ", "transação "]:
-        col_trans = c
-        break
-
-# Se não encontrou, assume coluna 3 da base original
-if col_trans is None:
-    col_trans = df.columns[2]
-    df.rename(columns={col_trans: "Transação"}, inplace=True)
-    col_trans = "Transação"
-
-transacoes = sorted(df[col_trans].dropna().unique())
-trans_sel = st.sidebar.multiselect("Transação", transacoes)
-
-if trans_sel:
-    df_f = df_f[df_f[col_trans].isin(trans_sel)]
+filtros["transacao"] = st.sidebar.multiselect("Transação", opcoes["transacao"])
 
 # ---- Regional ----
-if "Regional" in df.columns:
-    regionais = sorted(df["Regional"].dropna().unique())
-    reg_sel = st.sidebar.multiselect("Regional", regionais)
-    if reg_sel:
-        df_f = df_f[df_f["Regional"].isin(reg_sel)]
+if "regional" in opcoes:
+    filtros["regional"] = st.sidebar.multiselect("Regional", opcoes["regional"])
 
 # ---- Representante ----
-if "Representante" in df.columns:
-    reps = sorted(df["Representante"].dropna().unique())
-    rep_sel = st.sidebar.multiselect("Representante", reps)
-    if rep_sel:
-        df_f = df_f[df_f["Representante"].isin(rep_sel)]
+if "representante" in opcoes:
+    filtros["representante"] = st.sidebar.multiselect("Representante", opcoes["representante"])
 
 # ---- UF ----
-if "UF" in df.columns:
-    ufs = sorted(df["UF"].dropna().unique())
-    uf_sel = st.sidebar.multiselect("UF", ufs)
-    if uf_sel:
-        df_f = df_f[df_f["UF"].isin(uf_sel)]
+if "uf" in opcoes:
+    filtros["uf"] = st.sidebar.multiselect("UF", opcoes["uf"])
 
 # ---- Status ----
-if "Status de Produção / Faturamento" in df.columns:
-    status = sorted(df["Status de Produção / Faturamento"].dropna().unique())
-    status_sel = st.sidebar.multiselect("Status Prod./Fat.", status)
-    if status_sel:
-        df_f = df_f[df_f["Status de Produção / Faturamento"].isin(status_sel)]
+if "status" in opcoes:
+    filtros["status"] = st.sidebar.multiselect("Status Prod./Fat.", opcoes["status"])
 
 # ---- Cliente ----
 if "Nome Cliente" in df.columns:
-    cliente_txt = st.sidebar.text_input("Cliente (contém):")
-    if cliente_txt.strip():
-        df_f = df_f[
-            df_f["Nome Cliente"].astype(str).str.contains(cliente_txt, case=False, na=False)
-        ]
+    filtros["cliente"] = st.sidebar.text_input("Cliente (contém):")
 
 # ---- Item / SKU ----
 if "ITEM" in df.columns:
-    item_txt = st.sidebar.text_input("SKU/Item (contém):")
-    if item_txt.strip():
-        df_f = df_f[
-            df_f["ITEM"].astype(str).str.contains(item_txt, case=False, na=False)
-        ]
+    filtros["item"] = st.sidebar.text_input("SKU/Item (contém):")
+
+# ---- Cortes da curva ABC (clientes, UFs e SKUs) ----
+with st.sidebar.expander("Cortes da Curva ABC"):
+    corte_a = st.slider("Classe A até (% acumulado)", 50, 95, int(CORTES_ABC["A"]), 1)
+    # B começa acima de A: com B <= A a classe B ficaria vazia
+    cortes_abc = {
+        "A": corte_a,
+        "B": st.slider(
+            "Classe B até (% acumulado)", corte_a + 1, 99, max(int(CORTES_ABC["B"]), corte_a + 1), 1
+        ),
+    }
+
+df_f = aplicar_filtros(df, filtros)
+linhas_f = contar_linhas(df_f)
 
 # ============================================================
 # PRÉ-CÁLCULO GLOBAL (seguro) – usado pela Visão Executiva
 # ============================================================
+marco("pre_calculo_global", linhas_f)
 
-# Histórico antes do período filtrado
-df_historico_global = df[df["Data / Mês"] < df_f["Data / Mês"].min()]
-
-# Clientes históricos por representante
-hist_global = (
-    df_historico_global.groupby("Representante")["Nome Cliente"]
-    .nunique()
-    .rename("ClientesHistoricos")
-)
-
-# Clientes atendidos no período atual
-periodo_global = (
-    df_f.groupby("Representante")["Nome Cliente"]
-    .nunique()
-    .rename("ClientesAtuais")
-)
-
-# Junta tudo corretamente, alinhando índices
-rep_global = pd.concat([hist_global, periodo_global], axis=1)
-
-# Preenche faltas com zero
-rep_global = rep_global.fillna(0)
-
-# Converte tudo para inteiro
-rep_global = rep_global.astype(int)
-
-# Calcula novos e não atendidos
-rep_global["QtdClientesNovos"] = (
-    rep_global["ClientesAtuais"] - rep_global["ClientesHistoricos"]
-).clip(lower=0)
-
-rep_global["QtdClientesNaoAtendidos"] = (
-    rep_global["ClientesHistoricos"] - rep_global["ClientesAtuais"]
-).clip(lower=0)
+# Clientes históricos × atuais por representante
+rep_global = saldo_clientes_por_representante(df, df_f)
 
 # Somatórios globais usados pela Visão Executiva
 total_novos_global = int(rep_global["QtdClientesNovos"].sum())
@@ -410,20 +630,23 @@ total_nao_global = int(rep_global["QtdClientesNaoAtendidos"].sum())
 # VISÃO EXECUTIVA – COMPLETA, COM RESUMO E IA
 # ============================================================
 
+marco("visao_executiva", linhas_f)
+
 st.markdown("## 📊 Visão Executiva – Panorama Geral")
 
 # --------------------------
 # KPIs
 # --------------------------
-fat_liq = df_f["Faturamento Líquido"].sum()
-fat_bruto = df_f["Valor Pedido R$"].sum()
-impostos = df_f["Imposto Total"].sum()
-pedidos = df_f["Pedido"].nunique()
-clientes = df_f["Nome Cliente"].nunique()
-custo_total = df_f["Custo Total"].sum()
+kpis = kpis_gerais(df_f)
 
-margem_bruta = ((fat_bruto - custo_total) / fat_bruto * 100) if fat_bruto > 0 else 0
-ticket_medio = fat_liq / pedidos if pedidos > 0 else 0
+fat_liq = kpis["fat_liq"]
+fat_bruto = kpis["fat_bruto"]
+impostos = kpis["impostos"]
+pedidos = kpis["pedidos"]
+clientes = kpis["clientes"]
+custo_total = kpis["custo_total"]
+margem_bruta = kpis["margem_bruta"]
+ticket_medio = kpis["ticket_medio"]
 
 col1, col2, col3, col4 = st.columns(4)
 col5, col6, col7, col8 = st.columns(4)
@@ -454,13 +677,10 @@ st.markdown("---")
 
 st.markdown("### 📰 Resumo Executivo do Período")
 
-fat_liq_prev = df[df["Data / Mês"] < df_f["Data / Mês"].min()]["Faturamento Líquido"].sum()
-pedidos_prev = df[df["Data / Mês"] < df_f["Data / Mês"].min()]["Pedido"].nunique()
-clientes_prev = df[df["Data / Mês"] < df_f["Data / Mês"].min()]["Nome Cliente"].nunique()
-
-var_fat = ((fat_liq - fat_liq_prev) / fat_liq_prev * 100) if fat_liq_prev > 0 else 0
-var_ped = ((pedidos - pedidos_prev) / pedidos_prev * 100) if pedidos_prev > 0 else 0
-var_cli = ((clientes - clientes_prev) / clientes_prev * 100) if clientes_prev > 0 else 0
+variacoes = variacao_periodo_anterior(df, df_f, kpis)
+var_fat = variacoes["var_fat"]
+var_ped = variacoes["var_ped"]
+var_cli = variacoes["var_cli"]
 
 resumo = f"""
 No período analisado, o faturamento líquido foi de **{fmt_money(fat_liq)}**, 
@@ -489,7 +709,7 @@ elif margem_bruta > 45:
     insights.append(f"Margem bruta elevada ({fmt_pct(margem_bruta)}). Mix e preço estão favoráveis.")
 
 # Impostos
-perc_imp = (impostos / fat_bruto * 100) if fat_bruto > 0 else 0
+perc_imp = kpis["perc_impostos"]
 if perc_imp > 22:
     insights.append(f"Carga tributária alta ({fmt_pct(perc_imp)}). Impacto significativo no preço final.")
 else:
@@ -502,8 +722,7 @@ elif var_cli > 5:
     insights.append("Base de clientes em expansão. Oportunidade de aumentar recorrência.")
 
 # Concentração
-top5 = df_f.groupby("Nome Cliente")["Faturamento Líquido"].sum().nlargest(5)
-perc_top5 = top5.sum() / fat_liq * 100 if fat_liq > 0 else 0
+perc_top5 = concentracao_top_clientes(df_f, n=5)
 
 if perc_top5 > 45:
     insights.append(f"Concentração elevada: top 5 clientes = {fmt_pct(perc_top5)} do faturamento.")
@@ -521,66 +740,222 @@ for item in insights:
 
 st.markdown("---")
 
+# ============================================================
+# SIMULADOR DE CENÁRIOS (WHAT-IF)
+# ============================================================
+
+marco("simulador_cenarios", linhas_f)
+
+st.markdown("### 🧪 Simulador de Cenários – Preço, Desconto, Custo e Impostos")
+
+if modo_parquet:
+    st.info("O simulador precisa das linhas da visão em memória; use o arquivo padrão ou o upload.")
+else:
+    st.caption(
+        "Cada linha é um choque sobre a visão filtrada. UFs separadas por vírgula e "
+        "\"SKU contém\" (trecho do código, para uma família) restringem o choque; vazios, ele vale "
+        "para tudo. Alíquota varia o componente escolhido (ou todos) em %; preço e desconto "
+        "levam os impostos junto. Volumes ficam constantes."
+    )
+
+    choques_tab = st.data_editor(
+        pd.DataFrame([{"Tipo": "Desconto", "%": 5.0, "UFs": "", "SKU contém": "", "Componente": None}]),
+        num_rows="dynamic",
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Tipo": st.column_config.SelectboxColumn("Tipo", options=list(TIPOS_CHOQUE), required=True),
+            "%": st.column_config.NumberColumn("%", min_value=-100.0, max_value=1000.0, step=0.5, format="%.1f"),
+            "UFs": st.column_config.TextColumn("UFs"),
+            "SKU contém": st.column_config.TextColumn("SKU contém"),
+            "Componente": st.column_config.SelectboxColumn("Componente (alíquota)", options=COMPONENTES_IMPOSTO),
+        },
+        key="choques_cenario",
+    )
+
+    # O cubo (uma célula por SKU × UF) fica em cache; cada edição só refaz a conta vetorizada
+    cenario = simular_cenario(cubo_cenarios_visao(df_f[COLUNAS_CUBO]), choques_do_editor(choques_tab))
+    resumo_cen = resumo_cenario(cenario).set_index("Indicador")
+
+    colCn1, colCn2, colCn3, colCn4 = st.columns(4)
+    for coluna, indicador in zip(
+        [colCn1, colCn2, colCn3, colCn4],
+        ["Faturamento Líquido", "Impostos", "Lucro Bruto", "Margem Bruta (%)"],
+    ):
+        linha = resumo_cen.loc[indicador]
+        if indicador.endswith("(%)"):
+            coluna.metric(f"{indicador} – Cenário", fmt_pct(linha["Cenário"]),
+                          delta=f"{linha['Variação']:+.1f}".replace(".", ",") + " p.p.")
+        else:
+            coluna.metric(f"{indicador} – Cenário", fmt_money(linha["Cenário"]),
+                          delta=fmt_money(linha["Variação"]))
+
+    with st.expander("📋 Base × cenário"):
+        porcentagens = resumo_cen.index.str.endswith("(%)")
+        tabela_cen = resumo_cen.astype(object)
+        for col in ["Base", "Cenário", "Variação"]:
+            tabela_cen[col] = [
+                fmt_pct(v) if pct else fmt_money(v) for v, pct in zip(resumo_cen[col], porcentagens)
+            ]
+        tabela_cen["Variação (%)"] = resumo_cen["Variação (%)"].map(fmt_pct)
+        st.dataframe(tabela_cen, use_container_width=True)
+
+        dim_cen = st.radio("Detalhar por", ["UF", "ITEM"], horizontal=True, key="dim_cenario")
+        st.dataframe(
+            format_dataframe(
+                cenario_por(cenario, dim_cen).head(50),
+                money_cols=["FatLiq", "FatLiq Cenário", "Var FatLiq"],
+                pct_cols=["Margem Bruta (%)", "Margem Bruta Cenário (%)"]
+            ),
+            use_container_width=True,
+            hide_index=True
+        )
+
+st.markdown("---")
+
 
 
+marco("evolucao_mensal", linhas_f)
+
 st.markdown("### 📈 Evolução Mensal")
 
+# Grão das séries (vale também para as tendências das abas)
+grao = st.radio("Grão de tempo", list(GRAOS_TEMPO), index=1, horizontal=True)
+col_grao = GRAOS_TEMPO[grao]
 
-dfm = df_f.groupby("Ano-Mes", as_index=False).agg(
-    FatLiq=("Faturamento Líquido", "sum"),
-    FatBruto=("Valor Pedido R$", "sum"),
-    Impostos=("Imposto Total", "sum")
-)
+dfm = serie_por_grao(rollups, grao, filtros, df)
 
-fig = px.line(dfm, x="Ano-Mes", y="FatLiq", markers=True, title="Faturamento Líquido")
+fig = px.line(dfm, x=col_grao, y="FatLiq", markers=True, title="Faturamento Líquido")
 st.plotly_chart(fig, use_container_width=True)
 
-fig2 = px.bar(dfm, x="Ano-Mes", y="Impostos", title="Impostos por Mês")
+fig2 = px.bar(dfm, x=col_grao, y="Impostos", title=f"Impostos por {grao}")
 st.plotly_chart(fig2, use_container_width=True)
 
+# ---- Mesmo período do ano anterior (YoY) ----
+comp_yoy = comparativo_ano_anterior(rollups, grao, filtros, df)
+
+fig_yoy = px.line(
+    comp_yoy,
+    x=col_grao,
+    y=["FatLiq", "FatLiq Ano Anterior"],
+    markers=True,
+    title="Faturamento Líquido × Mesmo Período do Ano Anterior"
+)
+st.plotly_chart(fig_yoy, use_container_width=True)
+
+with st.expander("📋 Comparativo com o ano anterior"):
+    st.dataframe(
+        apply_global_formatting(comp_yoy),
+        use_container_width=True,
+        hide_index=True
+    )
+
+# ============================================================
+# BASE PARQUET – RANKINGS, ATRASOS E TRIBUTOS (AGREGADOS NO DUCKDB)
+# ============================================================
+
+if modo_parquet:
+    marco("rankings_parquet", linhas_f)
+
+    st.header("🔍 Rankings, Atrasos e Tributos")
+    st.caption(
+        "Base Parquet: só as seções que o DuckDB agrega. As análises detalhadas (carteira, "
+        "RFM, previsões, compra conjunta, versões) precisam da base em memória; use o "
+        "arquivo padrão ou o upload para vê-las."
+    )
+
+    aba_cli, aba_rep, aba_uf, aba_sku, aba_atr = st.tabs(
+        ["Clientes", "Representantes", "UF", "SKUs", "Atrasos e Tributos"]
+    )
+
+    for aba, dimensao, ranking in [
+        (aba_cli, "Nome Cliente", ranking_clientes),
+        (aba_rep, "Representante", ranking_representantes),
+        (aba_uf, "UF", ranking_ufs),
+        (aba_sku, "ITEM", ranking_skus),
+    ]:
+        with aba:
+            tab = ranking(df_f)
+            abc = curva_abc_visao(tab[[dimensao, "FatLiq"]], "FatLiq", cortes_abc)
+            tabela_resumo_abc(abc)
+            st.dataframe(
+                apply_global_formatting(tab.loc[abc.index].assign(**{"Classe ABC": abc["Classe ABC"]})),
+                use_container_width=True,
+                hide_index=True
+            )
+
+    with aba_atr:
+        atrasos = metricas_atraso(df_f, DIMENSOES_ATRASO)
+        kpis_at = atrasos["geral"]
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("📦 Pedidos no Período", fmt_int(kpis_at["total_pedidos"]))
+        col2.metric("⛔ % Atrasados", fmt_pct(kpis_at["perc_atraso"]))
+        col3.metric("⏳ Lead Time Médio (dias)", fmt_int(kpis_at["leadtime_medio"]))
+        col4.metric("💰 Impacto Financeiro dos Atrasos", fmt_money(kpis_at["impacto_financeiro"]))
+
+        dim_at = st.selectbox("Atraso por", DIMENSOES_ATRASO, key="dim_atraso_parquet")
+        st.dataframe(
+            format_dataframe(
+                atrasos[dim_at],
+                money_cols=["Fat. Atrasado"],
+                pct_cols=["% Atraso"],
+                int_cols=["Atrasados", "Total", "Linhas"]
+            ),
+            use_container_width=True,
+            hide_index=True
+        )
+
+        st.markdown("### 🧾 Carga Tributária por UF")
+        st.dataframe(
+            format_dataframe(
+                analise_tributaria(df_f, {"UF": "UF"})["UF"],
+                money_cols=["FatBruto", "Impostos", *COMPONENTES_IMPOSTO],
+                pct_cols=["Alíquota Efetiva (%)"],
+                int_cols=["Linhas"]
+            ),
+            use_container_width=True,
+            hide_index=True
+        )
+
+    encerrar_pagina()
+    st.stop()
+
 # ============================================================
 # ABAS DE ANÁLISE
 # ============================================================
 
+marco("analises_detalhadas", linhas_f)
+
 st.header("🔍 Análises Detalhadas")
 
-aba1, aba2, aba3, aba4, aba5, aba6 = st.tabs([
+aba1, aba2, aba3, aba4, aba5, aba6, aba7 = st.tabs([
     "Clientes",
     "Representantes",
     "UF / Geografia",
     "Produtos / Rentabilidade",
     "Atrasos e Lead Time",
-    "RFM"
+    "RFM",
+    "Mudanças entre Versões"
 ])
 
 
 # ============================================================
 # CLIENTES – NOVA VERSÃO CORPORATIVA COMPLETA
 # ============================================================
-with aba1:
+with aba1, medir("aba.clientes", linhas_f):
     st.subheader("📌 Inteligência de Clientes – Carteira, Tendências e Risco")
 
     # ============================
     # KPI PRINCIPAIS
     # ============================
     clientes_ativos = df_f["Nome Cliente"].nunique()
-    clientes_periodo = set(df_f["Nome Cliente"].unique())
-
-    # Datas para calcular novos e perdidos
-    data_ini = df_f["Data / Mês"].min()
-    janela_previa_ini = data_ini - pd.DateOffset(months=12)
-
-    df_hist_12m = df[
-        (df["Data / Mês"] >= janela_previa_ini) &
-        (df["Data / Mês"] < data_ini)
-    ]
-
-    clientes_prev = set(df_hist_12m["Nome Cliente"].unique())
 
-    clientes_novos = sorted(clientes_periodo - clientes_prev)
-    clientes_perdidos = sorted(clientes_prev - clientes_periodo)
+    # Novos e perdidos frente aos 12 meses anteriores ao período
+    clientes_novos, clientes_perdidos = clientes_novos_perdidos(df, df_f, meses=12)
 
-    ticket_medio_cliente = df_f.groupby("Nome Cliente")["Faturamento Líquido"].sum().mean()
+    cli = ranking_clientes(df_f)
+    ticket_medio_cliente = cli["FatLiq"].mean()
 
     colA, colB, colC, colD = st.columns(4)
     colA.metric("Clientes Ativos", fmt_int(clientes_ativos))
@@ -595,20 +970,11 @@ with aba1:
     # ============================================================
     st.markdown("### 📊 Ranking Completo de Clientes (Faturamento, Ticket, Margem)")
 
-    cli = df_f.groupby("Nome Cliente", as_index=False).agg(
-        FatLiq=("Faturamento Líquido","sum"),
-        FatBruto=("Valor Pedido R$","sum"),
-        Impostos=("Imposto Total","sum"),
-        Lucro=("Lucro Bruto","sum"),
-        Pedidos=("Pedido","nunique"),
-        Qtd=("Quant. Pedidos","sum")
-    )
-
-    cli["Ticket Médio"] = cli["FatLiq"] / cli["Pedidos"]
-    cli["Margem (%)"] = np.where(cli["FatBruto"] > 0, 100 * cli["Lucro"] / cli["FatBruto"], np.nan)
+    # Curva ABC em cache: dá a ordem e a classe do ranking e alimenta o gráfico abaixo
+    abc = curva_abc_visao(cli[["Nome Cliente", "FatLiq"]], "FatLiq", cortes_abc)
 
     cli_fmt = format_dataframe(
-        cli.sort_values("FatLiq", ascending=False),
+        cli.loc[abc.index].assign(**{"Classe ABC": abc["Classe ABC"]}),
         money_cols=["FatLiq","FatBruto","Lucro","Impostos","Ticket Médio"],
         pct_cols=["Margem (%)"],
         int_cols=["Pedidos","Qtd"]
@@ -631,9 +997,6 @@ with aba1:
         step=5
     )
 
-    abc = cli.sort_values("FatLiq", ascending=False).copy()
-    abc["% do Total"] = abc["FatLiq"] / abc["FatLiq"].sum() * 100
-    abc["% Acum"] = abc["% do Total"].cumsum()
     abc_plot = abc.head(top_n)
 
     fig_abc = px.line(
@@ -646,6 +1009,95 @@ with aba1:
     fig_abc.update_layout(xaxis_title=None, yaxis_title="% Acumulado")
 
     st.plotly_chart(fig_abc, use_container_width=True)
+    tabela_resumo_abc(abc)
+
+    st.markdown("---")
+
+    # ============================================================
+    # ALERTAS DA CARTEIRA (TODOS OS CLIENTES)
+    # ============================================================
+    st.subheader("🚨 Alertas da Carteira")
+
+    with st.expander("⚙️ Limites dos alertas"):
+        colAl1, colAl2, colAl3 = st.columns(3)
+        limites_alerta = {
+            "queda_pct": colAl1.number_input(
+                "Queda vs. histórico (%)", -100.0, 0.0, LIMITES_ALERTA["queda_pct"], 5.0
+            ),
+            "crescimento_pct": colAl1.number_input(
+                "Crescimento vs. histórico (%)", 0.0, 1000.0, LIMITES_ALERTA["crescimento_pct"], 5.0
+            ),
+            "margem_critica": colAl2.number_input(
+                "Margem crítica (%)", 0.0, 100.0, LIMITES_ALERTA["margem_critica"], 1.0
+            ),
+            "concentracao_pct": colAl2.number_input(
+                "Concentração (% do faturamento)", 0.0, 100.0, LIMITES_ALERTA["concentracao_pct"], 1.0
+            ),
+            "dias_sem_pedido": colAl3.number_input(
+                "Dias sem pedido", 0, 3650, LIMITES_ALERTA["dias_sem_pedido"], 15
+            ),
+        }
+
+    # Todas as regras para todos os clientes numa passada; o alerta individual lê daqui
+    alertas_cli = alertas_carteira(df, df_f, limites=limites_alerta)
+
+    colSv = st.columns(len(SEVERIDADES))
+    for coluna, severidade in zip(colSv, SEVERIDADES):
+        coluna.metric(
+            f"Alertas – {severidade}",
+            fmt_int((alertas_cli["Severidade"] == severidade).sum())
+        )
+
+    tipos_sel = st.multiselect("Tipos de alerta", sorted(alertas_cli["Alerta"].unique()))
+    alertas_tab = alertas_cli[alertas_cli["Alerta"].isin(tipos_sel)] if tipos_sel else alertas_cli
+
+    st.dataframe(
+        format_dataframe(
+            alertas_tab.drop(columns=["Mensagem", "Valor"]),
+            money_cols=["FatLiq"],
+            pct_cols=["Var %", "Margem (%)", "% do Total"]
+        ),
+        use_container_width=True
+    )
+
+    st.markdown("---")
+
+    # ============================================================
+    # COORTES DE CLIENTES – RETENÇÃO E RECEITA
+    # ============================================================
+    st.subheader("👥 Coortes de Clientes – Retenção e Receita")
+
+    coortes = coortes_visao(df_f[["Nome Cliente", "Data / Mês", "Faturamento Líquido"]], primeiras)
+
+    if coortes["Coortes"].empty:
+        st.info("Nenhum cliente com primeira compra dentro do período filtrado.")
+    else:
+        st.caption(
+            "Coorte = mês da primeira compra do cliente na base inteira; "
+            "entram os clientes adquiridos dentro do período filtrado."
+        )
+        matriz_sel = st.radio("Matriz", ["Retenção (%)", "Faturamento"], horizontal=True)
+        matriz = coortes[matriz_sel]
+
+        fig_coorte = px.imshow(
+            matriz,
+            aspect="auto",
+            color_continuous_scale="Blues",
+            labels={"x": "Meses desde a primeira compra", "y": "Coorte", "color": matriz_sel},
+            title=f"{matriz_sel} por Coorte de Primeira Compra"
+        )
+        st.plotly_chart(fig_coorte, use_container_width=True)
+
+        with st.expander("Tamanho e faturamento das coortes"):
+            st.dataframe(
+                format_dataframe(
+                    coortes["Coortes"],
+                    money_cols=["Faturamento", "Fat. por Cliente"],
+                    int_cols=["Clientes"]
+                ),
+                use_container_width=True,
+                hide_index=True
+            )
 
     st.markdown("---")
 
@@ -660,51 +1112,20 @@ with aba1:
     )
 
     df_c = df_f[df_f["Nome Cliente"] == cliente_sel]
+    resumo_c = resumo_recorte(df_c)
 
     # KPIs individuais
     col1, col2, col3 = st.columns(3)
-    col1.metric("Faturamento Líquido", fmt_money(df_c["Faturamento Líquido"].sum()))
-    col2.metric("Ticket Médio", fmt_money(df_c["Faturamento Líquido"].sum() / df_c["Pedido"].nunique()))
-    col3.metric("Margem (%)", fmt_pct(
-        100 * df_c["Lucro Bruto"].sum() / df_c["Valor Pedido R$"].sum()
-        if df_c["Valor Pedido R$"].sum() > 0 else 0
-    ))
+    col1.metric("Faturamento Líquido", fmt_money(resumo_c["fat_liq"]))
+    col2.metric("Ticket Médio", fmt_money(resumo_c["ticket_medio"]))
+    col3.metric("Margem (%)", fmt_pct(resumo_c["margem"]))
 
     # ============================================================
     # ALERTAS AUTOMÁTICOS DO CLIENTE
     # ============================================================
     st.markdown("### 🚨 Alertas Automáticos do Cliente")
 
-    alertas = []
-
-    # Faturamento atual vs histórico
-    fat_atual = df_c["Faturamento Líquido"].sum()
-    fat_prev = df[
-        (df["Nome Cliente"] == cliente_sel) &
-        (df["Data / Mês"] < data_ini)
-    ]["Faturamento Líquido"].sum()
-
-    if fat_prev > 0:
-        var_cli = (fat_atual - fat_prev) / fat_prev * 100
-        if var_cli < -30:
-            alertas.append(f"📉 Queda acentuada de faturamento (**{fmt_pct(var_cli)}**) frente ao período anterior.")
-        elif var_cli > 40:
-            alertas.append(f"📈 Crescimento expressivo de faturamento (**{fmt_pct(var_cli)}**). Cliente em expansão.")
-
-    # Margem crítica
-    margem_cli = df_c["Lucro Bruto"].sum() / df_c["Valor Pedido R$"].sum() * 100 if df_c["Valor Pedido R$"].sum() > 0 else 0
-    if margem_cli < 10:
-        alertas.append("🔥 Margem muito baixa. Avaliar desconto, mix e carga tributária.")
-
-    # Cliente com risco de churn
-    freq = df_c["Pedido"].nunique()
-    if freq == 1 and fat_atual < ticket_medio_cliente * 0.5:
-        alertas.append("⚠ Cliente com baixa frequência. Risco de churn elevado.")
-
-    # Concentração
-    perc_cli = fat_atual / fat_liq * 100 if fat_liq > 0 else 0
-    if perc_cli > 15:
-        alertas.append(f"🔴 Cliente representa **{fmt_pct(perc_cli)}** do faturamento total. Atenção à dependência.")
+    alertas = alertas_cli.loc[alertas_cli["Nome Cliente"] == cliente_sel, "Mensagem"].tolist()
 
     if len(alertas) == 0:
         st.success("Nenhum alerta identificado para este cliente.")
@@ -735,10 +1156,10 @@ with aba1:
     # ============================================================
     # TENDÊNCIA MENSAL DO CLIENTE
     # ============================================================
-    df_cli_mes = df_c.groupby("Ano-Mes", as_index=False)["Faturamento Líquido"].sum()
+    df_cli_mes = serie_mensal(df_c, col_grao)
     fig_trend = px.bar(
         df_cli_mes,
-        x="Ano-Mes",
+        x=col_grao,
         y="Faturamento Líquido",
         title=f"Evolução Mensal – {cliente_sel}"
     )
@@ -749,7 +1170,7 @@ with aba1:
     # ============================================================
     st.markdown("### 🧺 Mix de Produtos Comprados")
 
-    mix_cli = df_c.groupby("ITEM", as_index=False)["Faturamento Líquido"].sum().sort_values("Faturamento Líquido", ascending=False)
+    mix_cli = faturamento_por(df_c, "ITEM")
 
     st.dataframe(
         apply_global_formatting(mix_cli),
@@ -761,111 +1182,14 @@ with aba1:
 # ============================================================
 # REPRESENTANTES
 # ============================================================
-with aba2:
+with aba2, medir("aba.representantes", linhas_f):
     st.subheader("📌 Performance Geral por Representante")
 
     # ----------------------------------------
-    # BASE ATUAL FILTRADA
-    # ----------------------------------------
-    df_rep_periodo = df_f.copy()
-
-    # ----------------------------------------
-    # IDENTIFICAR HISTÓRICO (ANTES DO PERÍODO FILTRADO)
+    # PERFORMANCE + CLIENTES NOVOS E NÃO ATENDIDOS
+    # (histórico = base inteira antes do período filtrado)
     # ----------------------------------------
-    df_historico = df[df["Data / Mês"] < df_f["Data / Mês"].min()]
-
-    historico_por_rep = (
-        df_historico.groupby("Representante")["Nome Cliente"]
-        .unique()
-        .rename("ClientesHistoricos")
-    )
-
-    periodo_por_rep = (
-        df_rep_periodo.groupby("Representante")["Nome Cliente"]
-        .unique()
-        .rename("ClientesAtuais")
-    )
-
-    # ----------------------------------------
-    # COMBINAR HISTÓRICO x PERÍODO ATUAL
-    # ----------------------------------------
-    clientes_merge = pd.concat(
-        [historico_por_rep, periodo_por_rep],
-        axis=1
-    )
-
-    # ----------------------------------------
-    # PROTEÇÃO CONTRA NaN E TIPOS INVÁLIDOS
-    # ----------------------------------------
-    def safe_list(v):
-        if isinstance(v, (list, tuple, np.ndarray, set)):
-            return list(v)
-        if pd.isna(v):
-            return []
-        return [v]
-
-    clientes_merge["ClientesHistoricos"] = clientes_merge["ClientesHistoricos"].apply(safe_list)
-    clientes_merge["ClientesAtuais"] = clientes_merge["ClientesAtuais"].apply(safe_list)
-
-    # ----------------------------------------
-    # CÁLCULO DE NOVOS E NÃO ATENDIDOS
-    # ----------------------------------------
-    clientes_merge["ClientesNovos"] = clientes_merge.apply(
-        lambda x: list(set(x.ClientesAtuais) - set(x.ClientesHistoricos)),
-        axis=1
-    )
-
-    clientes_merge["ClientesNaoAtendidos"] = clientes_merge.apply(
-        lambda x: list(set(x.ClientesHistoricos) - set(x.ClientesAtuais)),
-        axis=1
-    )
-
-    clientes_merge["QtdClientesNovos"] = clientes_merge["ClientesNovos"].apply(len)
-    clientes_merge["QtdClientesNaoAtendidos"] = clientes_merge["ClientesNaoAtendidos"].apply(len)
-
-    # ----------------------------------------
-    # PERFORMANCE NUMÉRICA PRINCIPAL
-    # ----------------------------------------
-    rep = df_rep_periodo.groupby("Representante", as_index=False).agg(
-        FatLiq=("Faturamento Líquido", "sum"),
-        FatBruto=("Valor Pedido R$", "sum"),
-        Impostos=("Imposto Total", "sum"),
-        CustoTotal=("Custo Total", "sum"),
-        Pedidos=("Pedido", "nunique"),
-        ClientesAtivos=("Nome Cliente", "nunique"),
-        QtdItens=("Quant. Pedidos", "sum")
-    )
-
-    rep["Ticket Médio"] = rep["FatLiq"] / rep["Pedidos"]
-    rep["Margem Bruta (%)"] = np.where(
-        rep["FatBruto"] > 0,
-        100 * (rep["FatBruto"] - rep["CustoTotal"]) / rep["FatBruto"],
-        np.nan
-    )
-    rep["Margem Líquida (%)"] = np.where(
-        rep["FatLiq"] > 0,
-        100 * (rep["FatLiq"] - rep["CustoTotal"]) / rep["FatLiq"],
-        np.nan
-    )
-    rep["% Impostos"] = rep["Impostos"] / rep["FatBruto"] * 100
-
-    # ----------------------------------------
-    # MERGE COM CLIENTES NOVOS E NÃO ATENDIDOS
-    # ----------------------------------------
-    rep = rep.merge(
-        clientes_merge[
-            ["ClientesNovos", "ClientesNaoAtendidos", "QtdClientesNovos", "QtdClientesNaoAtendidos"]
-        ],
-        left_on="Representante",
-        right_index=True,
-        how="left"
-    )
-
-    # Ajuste final de listas e inteiros
-    rep["ClientesNovos"] = rep["ClientesNovos"].apply(lambda x: x if isinstance(x, list) else [])
-    rep["ClientesNaoAtendidos"] = rep["ClientesNaoAtendidos"].apply(lambda x: x if isinstance(x, list) else [])
-    rep["QtdClientesNovos"] = rep["QtdClientesNovos"].fillna(0).astype(int)
-    rep["QtdClientesNaoAtendidos"] = rep["QtdClientesNaoAtendidos"].fillna(0).astype(int)
+    rep = ranking_representantes_completo(df, df_f)
 
     # ----------------------------------------
     # FORMATAÇÃO CORPORATIVA
@@ -918,35 +1242,13 @@ with aba2:
 # ============================================================
 # UF / GEOGRAFIA – VERSÃO PREMIUM FINAL E CORRIGIDA
 # ============================================================
-with aba3:
+with aba3, medir("aba.uf_geografia", linhas_f):
     st.subheader("🌎 Inteligência Geográfica – Visão Premium por UF")
 
     # ============================================================
     # KPIs TERRITORIAIS
     # ============================================================
-    geo = df_f.groupby("UF", as_index=False).agg(
-        FatLiq=("Faturamento Líquido", "sum"),
-        FatBruto=("Valor Pedido R$","sum"),
-        Impostos=("Imposto Total","sum"),
-        Pedidos=("Pedido","nunique"),
-        Clientes=("Nome Cliente","nunique"),
-        Custo=("Custo Total","sum"),
-        Itens=("Quant. Pedidos","sum")
-    )
-
-    geo["Margem (%)"] = np.where(
-        geo["FatBruto"] > 0,
-        100 * (geo["FatBruto"] - geo["Custo"]) / geo["FatBruto"],
-        np.nan
-    )
-
-    geo["Ticket Médio"] = np.where(
-        geo["Pedidos"] > 0,
-        geo["FatLiq"] / geo["Pedidos"],
-        np.nan
-    )
-
-    geo["% Part"] = geo["FatLiq"] / geo["FatLiq"].sum() * 100 if geo["FatLiq"].sum() > 0 else 0
+    geo = ranking_ufs(df_f)
 
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("Faturamento Líquido Total", fmt_money(geo["FatLiq"].sum()))
@@ -962,17 +1264,13 @@ with aba3:
     st.markdown("---")
 
     # ============================================================
-    # MAPA – GEOJSON LOCAL (br_states.json)
+    # MAPA – GEOJSON LOCAL (brasil_estados.geojson)
     # ============================================================
     st.subheader("🗺️ Mapa de Faturamento por UF – Choropleth Premium")
 
-    import json
-    with open("br_states.json", "r", encoding="utf-8") as f:
-        geojson = json.load(f)
-
     fig_map = px.choropleth(
         geo,
-        geojson=geojson,
+        geojson=geojson_estados(),
         locations="UF",
         featureidkey="id",
         color="FatLiq",
@@ -1005,9 +1303,7 @@ with aba3:
         step=1
     )
 
-    abc_uf = geo.sort_values("FatLiq", ascending=False).copy()
-    abc_uf["% Total"] = abc_uf["FatLiq"] / abc_uf["FatLiq"].sum() * 100
-    abc_uf["% Acum"] = abc_uf["% Total"].cumsum()
+    abc_uf = curva_abc_visao(geo[["UF", "FatLiq"]], "FatLiq", cortes_abc)
 
     fig_abc_uf = px.line(
         abc_uf.head(top_ufs),
@@ -1019,6 +1315,7 @@ with aba3:
 
     fig_abc_uf.update_layout(yaxis_title="% Acumulado", xaxis_title=None)
     st.plotly_chart(fig_abc_uf, use_container_width=True)
+    tabela_resumo_abc(abc_uf)
 
     st.markdown("---")
 
@@ -1029,16 +1326,13 @@ with aba3:
 
     uf_sel = st.selectbox("Selecione a UF:", sorted(geo["UF"].unique()))
     df_u = df_f[df_f["UF"] == uf_sel]
+    resumo_u = resumo_recorte(df_u)
 
     colUF1, colUF2, colUF3, colUF4 = st.columns(4)
-    colUF1.metric("Faturamento Líquido", fmt_money(df_u["Faturamento Líquido"].sum()))
-    colUF2.metric("Pedidos", fmt_int(df_u["Pedido"].nunique()))
-    colUF3.metric("Clientes Atendidos", fmt_int(df_u["Nome Cliente"].nunique()))
-    margem_uf = (
-        df_u["Lucro Bruto"].sum() / df_u["Valor Pedido R$"].sum() * 100
-        if df_u["Valor Pedido R$"].sum() > 0 else 0
-    )
-    colUF4.metric("Margem (%)", fmt_pct(margem_uf))
+    colUF1.metric("Faturamento Líquido", fmt_money(resumo_u["fat_liq"]))
+    colUF2.metric("Pedidos", fmt_int(resumo_u["pedidos"]))
+    colUF3.metric("Clientes Atendidos", fmt_int(resumo_u["clientes"]))
+    colUF4.metric("Margem (%)", fmt_pct(resumo_u["margem"]))
 
     st.markdown("---")
 
@@ -1047,12 +1341,7 @@ with aba3:
     # ============================================================
     st.subheader("🏅 Top Clientes da UF")
 
-    top_cli = (
-        df_u.groupby("Nome Cliente", as_index=False)
-        .agg(FatLiq=("Faturamento Líquido","sum"))
-        .sort_values("FatLiq", ascending=False)
-        .head(15)
-    )
+    top_cli = top_faturamento(df_u, "Nome Cliente", TOP_CLIENTES_UF, rotulo="FatLiq")
 
     st.dataframe(apply_global_formatting(top_cli), use_container_width=True)
 
@@ -1061,12 +1350,7 @@ with aba3:
     # ============================================================
     st.subheader("🧺 Mix de Produtos da UF")
 
-    mix_uf = (
-        df_u.groupby("ITEM", as_index=False)["Faturamento Líquido"]
-        .sum()
-        .sort_values("Faturamento Líquido", ascending=False)
-        .head(20)
-    )
+    mix_uf = top_faturamento(df_u, "ITEM", TOP_MIX_UF)
 
     st.dataframe(apply_global_formatting(mix_uf), use_container_width=True)
 
@@ -1075,11 +1359,11 @@ with aba3:
     # ============================================================
     st.subheader(f"📊 Evolução Mensal – {uf_sel}")
 
-    df_mes = df_u.groupby("Ano-Mes", as_index=False)["Faturamento Líquido"].sum()
+    df_mes = serie_mensal(df_u, col_grao)
 
     fig_trend = px.line(
         df_mes,
-        x="Ano-Mes",
+        x=col_grao,
         y="Faturamento Líquido",
         markers=True,
         title=f"Evolução Mensal da UF – {uf_sel}"
@@ -1093,7 +1377,7 @@ with aba3:
 # ============================================================
 # PRODUTOS / RENTABILIDADE
 # ============================================================
-with aba4:
+with aba4, medir("aba.produtos", linhas_f):
 
     st.subheader("💼 Inteligência de Produtos – Mix, Margem, Impostos e Performance")
 
@@ -1101,15 +1385,10 @@ with aba4:
     # 1) KPIs ESTRATÉGICOS
     # ============================================================
     total_prod = df_f["ITEM"].nunique()
-    total_fat = df_f["Faturamento Líquido"].sum()
+    resumo_prod = resumo_recorte(df_f)
+    total_fat = resumo_prod["fat_liq"]
     total_lucro = df_f["Lucro Bruto"].sum()
-    total_imp = df_f["Imposto Total"].sum()
-
-    margem_media = np.where(
-        df_f["Valor Pedido R$"].sum() > 0,
-        100 * df_f["Lucro Bruto"].sum() / df_f["Valor Pedido R$"].sum(),
-        0
-    )
+    margem_media = resumo_prod["margem"]
 
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("SKUs Ativos", fmt_int(total_prod))
@@ -1124,38 +1403,12 @@ with aba4:
     # ============================================================
     st.subheader("📊 Ranking Premium de Rentabilidade por SKU")
 
-    sku = df_f.groupby("ITEM", as_index=False).agg(
-        FatLiq=("Faturamento Líquido","sum"),
-        FatBruto=("Valor Pedido R$","sum"),
-        Custo=("Custo Total","sum"),
-        Lucro=("Lucro Bruto","sum"),
-        Impostos=("Imposto Total","sum"),
-        Pedidos=("Pedido","nunique"),
-        Unidades=("Quant. Pedidos","sum")
-    )
-
-    sku["Margem (%)"] = np.where(
-        sku["FatBruto"] > 0,
-        100 * sku["Lucro"] / sku["FatBruto"],
-        np.nan
-    )
-
-    sku["Margem Líquida (%)"] = np.where(
-        sku["FatLiq"] > 0,
-        100 * (sku["Lucro"] - sku["Impostos"]) / sku["FatLiq"],
-        np.nan
-    )
-
-    sku["Ticket Médio"] = np.where(
-        sku["Pedidos"] > 0,
-        sku["FatLiq"] / sku["Pedidos"],
-        0
-    )
+    sku = ranking_skus(df_f)
 
-    sku["% Part"] = sku["FatLiq"] / sku["FatLiq"].sum() * 100
+    abc = curva_abc_visao(sku[["ITEM", "FatLiq"]], "FatLiq", cortes_abc)
 
     sku_fmt = format_dataframe(
-        sku.sort_values("FatLiq", ascending=False),
+        sku.loc[abc.index].assign(**{"Classe ABC": abc["Classe ABC"]}),
         money_cols=["FatLiq","FatBruto","Custo","Lucro","Impostos","Ticket Médio"],
         pct_cols=["Margem (%)","Margem Líquida (%)","% Part"],
         int_cols=["Pedidos","Unidades"]
@@ -1178,10 +1431,6 @@ with aba4:
         step=5
     )
 
-    abc = sku.sort_values("FatLiq", ascending=False).copy()
-    abc["% Total"] = abc["FatLiq"] / abc["FatLiq"].sum() * 100
-    abc["% Acum"] = abc["% Total"].cumsum()
-
     fig_abc = px.line(
         abc.head(top_n),
         x="ITEM",
@@ -1192,6 +1441,7 @@ with aba4:
     fig_abc.update_layout(xaxis_title=None)
 
     st.plotly_chart(fig_abc, use_container_width=True)
+    tabela_resumo_abc(abc)
 
     st.markdown("---")
 
@@ -1200,21 +1450,31 @@ with aba4:
     # ============================================================
     st.subheader("🤖 Classificação Automática dos SKUs – IA Comercial")
 
-    # Regras simplificadas executivas
-    def class_sku(row):
-        fat = row["FatLiq"]
-        mg = row["Margem (%)"]
-        ped = row["Pedidos"]
-
-        if fat > sku["FatLiq"].quantile(0.85) and mg > 30:
-            return "🔥 Líder Estratégico"
-        if fat > sku["FatLiq"].median() and mg < 15:
-            return "⚠ Volume com Margem Crítica"
-        if ped <= 1 and fat < sku["FatLiq"].median():
-            return "🛑 Baixa Relevância"
-        return "🟡 Sustentação"
+    # Regras simplificadas executivas (limites ajustáveis)
+    with st.expander("⚙️ Limites da classificação"):
+        colL1, colL2, colL3, colL4 = st.columns(4)
+        limites_sku = {
+            "quantil_lider": colL1.number_input(
+                "Quantil de faturamento (Líder)", 0.5, 0.99,
+                LIMITES_CLASSIFICACAO_SKU["quantil_lider"], 0.01
+            ),
+            "margem_lider": colL2.number_input(
+                "Margem mínima Líder (%)", 0.0, 100.0,
+                LIMITES_CLASSIFICACAO_SKU["margem_lider"], 1.0
+            ),
+            "margem_critica": colL3.number_input(
+                "Margem crítica (%)", 0.0, 100.0,
+                LIMITES_CLASSIFICACAO_SKU["margem_critica"], 1.0
+            ),
+            "pedidos_baixa_relevancia": colL4.number_input(
+                "Pedidos máx. Baixa Relevância", 0, 100,
+                LIMITES_CLASSIFICACAO_SKU["pedidos_baixa_relevancia"], 1
+            ),
+        }
 
-    sku["Categoria IA"] = sku.apply(class_sku, axis=1)
+    sku["Categoria IA"] = classificacao_skus(
+        sku[["FatLiq", "Margem (%)", "Pedidos"]], limites_sku
+    )
 
     cat_df = sku.groupby("Categoria IA")["ITEM"].count().reset_index()
     cat_df.columns = ["Categoria", "Qtd SKUs"]
@@ -1268,22 +1528,20 @@ with aba4:
 
     sku_sel = st.selectbox("Selecione o SKU:", sorted(sku["ITEM"].unique()))
     df_sku = df_f[df_f["ITEM"] == sku_sel]
+    resumo_s = resumo_recorte(df_sku)
 
     colP1, colP2, colP3, colP4 = st.columns(4)
-    colP1.metric("Faturamento Líquido", fmt_money(df_sku["Faturamento Líquido"].sum()))
-    colP2.metric("Margem (%)", fmt_pct(
-        100 * df_sku["Lucro Bruto"].sum() / df_sku["Valor Pedido R$"].sum()
-        if df_sku["Valor Pedido R$"].sum() > 0 else 0
-    ))
-    colP3.metric("Impostos", fmt_money(df_sku["Imposto Total"].sum()))
-    colP4.metric("Clientes Atendidos", fmt_int(df_sku["Nome Cliente"].nunique()))
+    colP1.metric("Faturamento Líquido", fmt_money(resumo_s["fat_liq"]))
+    colP2.metric("Margem (%)", fmt_pct(resumo_s["margem"]))
+    colP3.metric("Impostos", fmt_money(resumo_s["impostos"]))
+    colP4.metric("Clientes Atendidos", fmt_int(resumo_s["clientes"]))
 
     # Tendência mensal
-    df_sku_mes = df_sku.groupby("Ano-Mes", as_index=False)["Faturamento Líquido"].sum()
+    df_sku_mes = serie_mensal(df_sku, col_grao)
 
     fig_trend = px.line(
         df_sku_mes,
-        x="Ano-Mes",
+        x=col_grao,
         y="Faturamento Líquido",
         markers=True,
         title=f"Evolução Mensal do SKU – {sku_sel}"
@@ -1297,10 +1555,8 @@ with aba4:
     # ============================================================
     st.subheader("💰 Análise Tributária do SKU")
 
-    df_sku_tax = df_sku[[
-        "cofins","pis","ipi","icms","aproxtribFed","aproxtribState","Imposto Total"
-    ]].sum().reset_index()
-    df_sku_tax.columns = ["Imposto", "Valor"]
+    tributos = tributos_visao(df_f[["ITEM", "UF", "Valor Pedido R$", *COMPONENTES_IMPOSTO]])
+    df_sku_tax = composicao_tributaria(tributos["SKU"], "ITEM", sku_sel)
 
     fig_tax = px.bar(
         df_sku_tax,
@@ -1312,6 +1568,25 @@ with aba4:
 
     st.plotly_chart(fig_tax, use_container_width=True)
 
+    aliq_sku = tributos["SKU"].loc[tributos["SKU"]["ITEM"] == sku_sel, "Alíquota Efetiva (%)"]
+    st.caption(
+        f"Alíquota efetiva do SKU: {fmt_pct(aliq_sku.iloc[0] if len(aliq_sku) else None)} · "
+        f"mediana dos SKUs do recorte: {fmt_pct(tributos['SKU']['Alíquota Efetiva (%)'].median())}"
+    )
+
+    with st.expander("⚠️ SKUs e UFs com carga tributária fora do padrão"):
+        for rotulo, coluna, nenhum in [("SKU", "ITEM", "Nenhum SKU"), ("UF", "UF", "Nenhuma UF")]:
+            fora = desvios_tributarios(tributos[rotulo], coluna)
+            if fora.empty:
+                st.info(f"{nenhum} com alíquota efetiva fora do padrão dos pares.")
+                continue
+            st.dataframe(format_dataframe(
+                fora,
+                money_cols=["FatBruto", "Impostos"],
+                pct_cols=["Alíquota Efetiva (%)", "Alíquota Mediana (%)"],
+                int_cols=["Linhas"]
+            ), use_container_width=True)
+
     st.markdown("---")
 
     # ============================================================
@@ -1319,12 +1594,7 @@ with aba4:
     # ============================================================
     st.subheader("🏅 Top Clientes do Produto")
 
-    top_cli_sku = (
-        df_sku.groupby("Nome Cliente", as_index=False)
-        .agg(FatLiq=("Faturamento Líquido","sum"))
-        .sort_values("FatLiq", ascending=False)
-        .head(20)
-    )
+    top_cli_sku = top_faturamento(df_sku, "Nome Cliente", TOP_CLIENTES_SKU, rotulo="FatLiq")
 
     st.dataframe(apply_global_formatting(top_cli_sku), use_container_width=True)
 
@@ -1335,11 +1605,7 @@ with aba4:
     # ============================================================
     st.subheader("🌎 Distribuição Geográfica do SKU")
 
-    geo_sku = (
-        df_sku.groupby("UF", as_index=False)["Faturamento Líquido"]
-        .sum()
-        .sort_values("Faturamento Líquido", ascending=False)
-    )
+    geo_sku = faturamento_por(df_sku, "UF")
 
     fig_geo = px.bar(
         geo_sku,
@@ -1358,21 +1624,28 @@ with aba4:
     # ============================================================
     st.subheader("🧬 Mix de Produtos Relacionados")
 
-    clientes_do_sku = df_sku["Nome Cliente"].unique()
-
-    relacionados = df_f[
-        df_f["Nome Cliente"].isin(clientes_do_sku)
-    ].groupby("ITEM")["Faturamento Líquido"].sum().sort_values(ascending=False).head(20)
+    criterio_rel = st.radio(
+        "Ordenar relacionados por:",
+        ["Faturamento Relacionado", "Clientes em Comum", "Lift", "Cosseno"],
+        horizontal=True
+    )
 
-    rel_df = relacionados.reset_index()
-    rel_df.columns = ["SKU", "Faturamento Relacionado"]
+    indice_rel = indice_compra_conjunta(df_f[["Nome Cliente", "ITEM", "Faturamento Líquido"]])
+    rel_df = indice_rel.relacionados(sku_sel, k=TOP_RELACIONADOS, ordenar_por=criterio_rel)
 
-    st.dataframe(apply_global_formatting(rel_df), use_container_width=True)
+    st.dataframe(
+        format_dataframe(
+            rel_df,
+            money_cols=["Faturamento Relacionado"],
+            int_cols=["Clientes em Comum"]
+        ),
+        use_container_width=True
+    )
 
 # ============================================================
 # ATRASOS / LEAD TIME
 # ============================================================
-with aba5:
+with aba5, medir("aba.atrasos", linhas_f):
 
     st.subheader("⏱️ Inteligência de Atrasos e Lead Time")
 
@@ -1380,30 +1653,17 @@ with aba5:
     # 1. PREPARAÇÃO DAS MÉTRICAS
     # ============================================================
 
-    # Garantir colunas de datas tratadas
-    df_f["Data Pedido"] = pd.to_datetime(df_f["Data do Pedido"], errors="coerce")
-    df_f["Data Entrega"] = pd.to_datetime(df_f["Data da Entrega"], errors="coerce")
-
-    # Lead Time real
-    df_f["LeadTimeDias"] = (df_f["Data Entrega"] - df_f["Data Pedido"]).dt.days
-
-    # KPI: quantidade de pedidos atrasados / no prazo
-    atrasos = df_f.groupby("AtrasadoFlag", as_index=False).agg(
-        Pedidos=("Pedido","nunique"),
-        Fat=("Faturamento Líquido","sum")
+    # Lead time, mês do pedido e AtrasadoFlag já vêm da ingestão; KPIs e
+    # quebras saem de uma passada só, em cache por visão filtrada
+    atrasos = metricas_atraso_visao(
+        df_f[["Pedido", "AtrasadoFlag", "Faturamento Líquido", "LeadTime (dias)", *DIMENSOES_ATRASO]]
     )
-
-    total_ped = atrasos["Pedidos"].sum()
-    qtd_atrasado = atrasos.loc[atrasos["AtrasadoFlag"]=="Atrasado", "Pedidos"].sum()
-    perc_atraso = qtd_atrasado / total_ped * 100 if total_ped > 0 else 0
-
-    atraso_medio = df_f.loc[df_f["AtrasadoFlag"]=="Atrasado", "LeadTimeDias"].mean()
-    leadtime_medio = df_f["LeadTimeDias"].mean()
-
-    impacto_financeiro = atrasos.loc[
-        atrasos["AtrasadoFlag"]=="Atrasado",
-        "Fat"
-    ].sum()
+    kpis_at = atrasos["geral"]
+    total_ped = kpis_at["total_pedidos"]
+    perc_atraso = kpis_at["perc_atraso"]
+    atraso_medio = kpis_at["atraso_medio"]
+    leadtime_medio = kpis_at["leadtime_medio"]
+    impacto_financeiro = kpis_at["impacto_financeiro"]
 
     # ============================================================
     # 2. KPIs EXECUTIVOS
@@ -1417,21 +1677,45 @@ with aba5:
     st.markdown("---")
 
     # ============================================================
-    # 3. TENDÊNCIA DE ATRASOS
+    # 2.1 PERCENTIS DE LEAD TIME E SLA
     # ============================================================
-    st.subheader("📉 Tendência de Atrasos por Mês")
+    st.subheader("📏 Percentis de Lead Time e SLA")
+
+    colS1, colS2 = st.columns(2)
+    sla_dias = colS1.number_input("SLA de entrega (dias)", 1, 365, SLA_LEADTIME_PADRAO, 1)
+    quebra_lt = colS2.selectbox("Quebrar por", list(QUEBRAS_LEADTIME))
+    col_quebra = QUEBRAS_LEADTIME[quebra_lt]
 
-    df_f["AnoMes"] = df_f["Data Pedido"].dt.to_period("M").astype(str)
+    # Percentis saem da soma dos histogramas pré-calculados (sem ordenar linhas)
+    lt_geral = percentis_leadtime(hist_leadtime, filtros, sla=sla_dias, base=df)
+    lt_grupo = percentis_leadtime(hist_leadtime, filtros, por=col_quebra, sla=sla_dias, base=df)
 
-    atraso_mes = df_f.groupby("AnoMes", as_index=False).agg(
-        Atrasados=("AtrasadoFlag", lambda x: (x=="Atrasado").sum()),
-        Total=("Pedido","nunique")
+    colQ = st.columns(len(QUANTIS_LEADTIME) + 1)
+    for coluna, nome in zip(colQ, QUANTIS_LEADTIME):
+        coluna.metric(f"Lead Time {nome} (dias)", fmt_int(lt_geral.get(nome)))
+    colQ[-1].metric(f"✅ No SLA ({sla_dias} dias)", fmt_pct(lt_geral.get("% no SLA")))
+
+    st.dataframe(
+        format_dataframe(
+            lt_grupo.sort_values(col_quebra),
+            pct_cols=["% no SLA"],
+            int_cols=["Linhas", *QUANTIS_LEADTIME]
+        ),
+        use_container_width=True
     )
-    atraso_mes["% Atraso"] = atraso_mes["Atrasados"] / atraso_mes["Total"] * 100
+
+    st.markdown("---")
+
+    # ============================================================
+    # 3. TENDÊNCIA DE ATRASOS
+    # ============================================================
+    st.subheader("📉 Tendência de Atrasos por Mês")
+
+    atraso_mes = atrasos["AnoMes Pedido"]
 
     fig_tend = px.line(
         atraso_mes,
-        x="AnoMes", y="% Atraso",
+        x="AnoMes Pedido", y="% Atraso",
         markers=True,
         title="Tendência Mensal de Atraso (%)"
     )
@@ -1444,11 +1728,7 @@ with aba5:
     # ============================================================
     st.subheader("🌎 Atraso por UF")
 
-    atraso_uf = df_f.groupby("UF", as_index=False).agg(
-        Atrasados=("AtrasadoFlag", lambda x: (x=="Atrasado").sum()),
-        Total=("Pedido","nunique")
-    )
-    atraso_uf["% Atraso"] = 100 * atraso_uf["Atrasados"] / atraso_uf["Total"]
+    atraso_uf = atrasos["UF"]
 
     fig_uf = px.bar(
         atraso_uf.sort_values("% Atraso", ascending=False),
@@ -1465,11 +1745,7 @@ with aba5:
     # ============================================================
     st.subheader("🧑‍💼 Atraso por Representante")
 
-    atraso_rep = df_f.groupby("Representante", as_index=False).agg(
-        Atrasados=("AtrasadoFlag", lambda x: (x=="Atrasado").sum()),
-        Total=("Pedido","nunique")
-    )
-    atraso_rep["% Atraso"] = 100 * atraso_rep["Atrasados"] / atraso_rep["Total"]
+    atraso_rep = atrasos["Representante"]
 
     fig_rep = px.bar(
         atraso_rep.sort_values("% Atraso", ascending=False),
@@ -1488,7 +1764,7 @@ with aba5:
 
     fig_lead = px.histogram(
         df_f,
-        x="LeadTimeDias",
+        x="LeadTime (dias)",
         nbins=30,
         title="Distribuição de Lead Time"
     )
@@ -1501,14 +1777,16 @@ with aba5:
     # ============================================================
     st.subheader("🚨 Pedidos com Atraso Acima da Curva")
 
-    limite_outlier = df_f["LeadTimeDias"].mean() + 2 * df_f["LeadTimeDias"].std()
+    quantil_out = st.selectbox("Corte", list(QUANTIS_LEADTIME), index=len(QUANTIS_LEADTIME) - 1)
 
-    df_out = df_f[df_f["LeadTimeDias"] > limite_outlier]
+    # Cada pedido é comparado com o percentil do seu grupo (UF, representante ou mês)
+    limites_out = lt_grupo.set_index(col_quebra)[quantil_out]
+    df_out = pedidos_fora_da_curva(df_f, limites_out, por=col_quebra)
 
-    st.write(f"Pedidos acima de **{limite_outlier:.0f} dias** de lead time:")
+    st.write(f"Pedidos acima do **{quantil_out}** de lead time da sua quebra (**{quebra_lt}**):")
 
     df_out_fmt = apply_global_formatting(
-        df_out[["Pedido", "Nome Cliente", "ITEM", "LeadTimeDias", "Data Pedido", "Data Entrega"]]
+        df_out[["Pedido", "Nome Cliente", "ITEM", col_quebra, "LeadTime (dias)", "Limite (dias)", "Data do Pedido", "Data da Entrega"]]
     )
 
     st.dataframe(df_out_fmt, use_container_width=True)
@@ -1522,7 +1800,7 @@ with aba5:
 
     detalhamento_cols = [
         "Pedido","Nome Cliente","Representante","UF",
-        "Data Pedido","Data Entrega","LeadTimeDias",
+        "Data do Pedido","Data da Entrega","LeadTime (dias)",
         "AtrasadoFlag","Faturamento Líquido"
     ]
 
@@ -1534,14 +1812,17 @@ with aba5:
 # ============================================================
 # INTELIGÊNCIA COMERCIAL
 # ============================================================
+marco("inteligencia_comercial", linhas_f)
+
 st.header("🧠 Inteligência Comercial")
 
-tab1, tab2, tab3, tab4, tab5 = st.tabs([
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
     "Clientes em Crescimento",
     "Clientes em Queda",
     "Tendência de SKUs",
     "Cesta por Região",
-    "Anomalias"
+    "Anomalias",
+    "Previsão de Faturamento"
 ])
 
 with tab1:
@@ -1557,49 +1838,66 @@ with tab3:
     st.dataframe(apply_global_formatting(skus_em_tendencia(df_f)))
 
 with tab4:
-    st.subheader("Cesta Comercial por Região (Top 5)")
-    st.dataframe(apply_global_formatting(cesta_por_regiao(df_f)))
+    st.subheader(f"Cesta Comercial por Região (Top {TOP_CESTA_UF})")
+    st.dataframe(apply_global_formatting(cesta_por_regiao(df_f, n=TOP_CESTA_UF)))
 
 with tab5:
     st.subheader("Anomalias Comerciais")
     st.dataframe(apply_global_formatting(detectar_anomalias(df_f)))
+
+with tab6:
+    st.subheader(f"Previsão de Faturamento – Próximos {HORIZONTE_PADRAO} Meses")
+
+    dim_prev = st.radio("Prever por", list(DIMENSOES_PREVISAO), horizontal=True)
+    col_prev = DIMENSOES_PREVISAO[dim_prev]
+
+    # Modelos ajustados no histórico completo (uma vez por versão da base);
+    # a lista mostra só clientes/SKUs presentes na visão filtrada
+    prev = previsoes[dim_prev]
+    prev = prev[prev[col_prev].isin(df_f[col_prev].unique())]
+    st.caption(
+        "Cada série usa o modelo (sazonal ingênuo, tendência linear ou Holt-Winters) "
+        f"com menor erro no backtest dos últimos {HORIZONTE_PADRAO} meses fechados. "
+        "Um mês ainda em aberto na planilha fica fora do ajuste e entra como o primeiro mês previsto."
+    )
+
+    colPv1, colPv2, colPv3 = st.columns(3)
+    colPv1.metric("Faturamento Previsto", fmt_money(prev["Previsão Total"].sum()))
+    colPv2.metric(f"Últimos {HORIZONTE_PADRAO} Meses", fmt_money(prev["Últimos Meses"].sum()))
+    colPv3.metric("Erro Mediano do Backtest", fmt_pct(prev["Erro Backtest (%)"].median()))
+
+    fig_prev = px.bar(
+        prev.head(20),
+        x=col_prev,
+        y=["Últimos Meses", "Previsão Total"],
+        barmode="group",
+        title=f"Top 20 {dim_prev}s por Faturamento Previsto"
+    )
+    st.plotly_chart(fig_prev, use_container_width=True)
+
+    st.dataframe(
+        format_dataframe(
+            prev,
+            money_cols=[c for c in prev.columns if c.startswith("Prev")] + ["Últimos Meses"],
+            pct_cols=["Var %"] + [c for c in prev.columns if c.startswith("Erro")]
+        ),
+        use_container_width=True
+    )
     
    # ============================================================
 # ABA 6 – RFM (Recência, Frequência, Monetário)
 # ============================================================
-with aba6:
+with aba6, medir("aba.rfm", linhas_f):
     st.subheader("📊 Análise RMF – Recência, Frequência e Monetário")
 
     # =============================
-    # CÁLCULO DA RECÊNCIA
-    # =============================
-    max_date = df_f["Data do Pedido"].max()
-
-    rfm = df_f.groupby("Nome Cliente").agg(
-        Recencia=("Data do Pedido", lambda x: (max_date - x.max()).days),
-        Frequencia=("Pedido", "nunique"),
-        Monetario=("Faturamento Líquido", "sum"),
-        Representantes=("Representante", lambda x: list(set(x))),
-        UFs=("UF", lambda x: list(set(x)))
-    ).reset_index()
-
-    # =============================
-    # SEGMENTAÇÃO RFM (Executiva)
+    # RFM + ÍNDICES CLIENTE × REP / UF
     # =============================
-    def classificar_rfm(row):
-        r, f, m = row["Recencia"], row["Frequencia"], row["Monetario"]
-
-        if r <= 30 and f >= 3 and m >= rfm["Monetario"].median():
-            return "🔥 VIP / Premium"
-        if r <= 45 and f >= 2:
-            return "📈 Crescentes"
-        if r > 60 and f == 1:
-            return "⚠ Clientes Oportunidade"
-        if r > 90:
-            return "❌ Inativos / Risco"
-        return "🟡 Regulares"
+    rfm_scores = st.toggle("Exibir notas por quintil (R, F, M)", value=False)
 
-    rfm["Segmento"] = rfm.apply(classificar_rfm, axis=1)
+    rfm = calcular_rfm(df_f, quintis=rfm_scores)
+    membros_rep = indice_pertencimento(df_f, "Representante")
+    membros_uf = indice_pertencimento(df_f, "UF")
 
     # ============================================================
     # FILTROS INTERNOS DA ABA RMF
@@ -1655,16 +1953,16 @@ with aba6:
     # APLICAR FILTROS INTERNOS
     # ============================================================
 
-    rfm_f = rfm.copy()
+    rfm_f = rfm
 
     if len(reps_rfm) > 0:
-        rfm_f = rfm_f[rfm_f["Representantes"].apply(lambda x: any(r in x for r in reps_rfm))]
+        rfm_f = filtrar_por_pertencimento(rfm_f, membros_rep, reps_rfm)
 
     if len(segs_rfm) > 0:
         rfm_f = rfm_f[rfm_f["Segmento"].isin(segs_rfm)]
 
     if len(ufs_rfm) > 0:
-        rfm_f = rfm_f[rfm_f["UFs"].apply(lambda x: any(u in x for u in ufs_rfm))]
+        rfm_f = filtrar_por_pertencimento(rfm_f, membros_uf, ufs_rfm)
 
     rfm_f = rfm_f[
         (rfm_f["Recencia"] <= rec_max) &
@@ -1676,8 +1974,17 @@ with aba6:
     # FORMATAÇÃO CORPORATIVA
     # ============================================================
 
+    # Representantes / UFs só para exibição, a partir dos índices de pertencimento
+    rfm_exib = rfm_f.merge(
+        membros_rep["Representante"].astype(str).groupby(membros_rep["Nome Cliente"]).agg(", ".join).rename("Representantes"),
+        left_on="Nome Cliente", right_index=True, how="left"
+    ).merge(
+        membros_uf["UF"].astype(str).groupby(membros_uf["Nome Cliente"]).agg(", ".join).rename("UFs"),
+        left_on="Nome Cliente", right_index=True, how="left"
+    )
+
     rfm_fmt = format_dataframe(
-        rfm_f.sort_values("Monetario", ascending=False),
+        rfm_exib.sort_values("Monetario", ascending=False),
         money_cols=["Monetario"],
         pct_cols=[],
         int_cols=["Recencia", "Frequencia"]
@@ -1703,11 +2010,70 @@ with aba6:
     st.plotly_chart(fig_rfm, use_container_width=True)
 
 
+# ============================================================
+# MUDANÇAS ENTRE VERSÕES DA BASE (SEMANA A SEMANA)
+# ============================================================
+with aba7, medir("aba.versoes"):
+    st.subheader("🗂️ O que Mudou entre Versões da Base")
+
+    versoes = listar_versoes(PASTA_VERSOES)
+    if len(versoes) < 2:
+        st.info(
+            "São necessárias ao menos duas versões gravadas. Com `BRASFORMA_PASTA_VERSOES` "
+            "definida, a planilha padrão ganha uma versão a cada atualização; também é "
+            "possível gravar com `python versoes_base.py gravar <planilha.xlsx>`."
+        )
+    else:
+        rotulos = {
+            r.numero: f"v{r.numero} · {r.gravada_em} · {fmt_int(r.linhas)} linhas"
+            for r in versoes.itertuples()
+        }
+        numeros = list(rotulos)
+
+        colV1, colV2 = st.columns(2)
+        v_antes = colV1.selectbox("Versão anterior", numeros, index=len(numeros) - 2, format_func=rotulos.get)
+        v_depois = colV2.selectbox("Versão atual", numeros, index=len(numeros) - 1, format_func=rotulos.get)
+
+        assinaturas = tuple(versoes.set_index("numero").loc[[v_antes, v_depois], "assinatura"])
+        mudancas = mudancas_versoes(PASTA_VERSOES, v_antes, v_depois, assinaturas)
+        resumo_mud = mudancas["Resumo"]
+        st.caption("Comparação da base inteira, sem os filtros da barra lateral.")
+
+        colM1, colM2, colM3, colM4, colM5, colM6 = st.columns(6)
+        colM1.metric("Linhas Novas", fmt_int(resumo_mud["Novas"]))
+        colM2.metric("Linhas Removidas", fmt_int(resumo_mud["Removidas"]))
+        colM3.metric("Linhas Alteradas", fmt_int(resumo_mud["Alteradas"]))
+        colM4.metric("Mudanças de Status", fmt_int(resumo_mud["Mudanças de Status"]))
+        colM5.metric("Novos Atrasos", fmt_int(resumo_mud["Novos Atrasos"]))
+        colM6.metric(
+            "Revisões de Valor", fmt_int(resumo_mud["Revisões de Valor"]),
+            delta=fmt_money(resumo_mud["Variação de Valor"]), delta_color="off"
+        )
+
+        titulos_mud = {
+            "Status": "Mudanças de Status de Produção / Faturamento",
+            "Novos Atrasos": "Pedidos que Passaram a Atrasado",
+            "Revisões de Valor": "Revisões de Valor do Pedido",
+            "Novas": "Linhas Novas",
+            "Removidas": "Linhas Removidas",
+            "Alteradas": "Todos os Campos Alterados",
+        }
+        for nome, titulo in titulos_mud.items():
+            tabela_mud = mudancas[nome]
+            with st.expander(f"{titulo} ({fmt_int(len(tabela_mud))})", expanded=nome == "Status"):
+                if tabela_mud.empty:
+                    st.info("Nenhuma mudança deste tipo.")
+                elif nome == "Revisões de Valor":
+                    st.dataframe(
+                        format_dataframe(tabela_mud, money_cols=["Antes", "Depois", "Diferença"]),
+                        use_container_width=True,
+                        hide_index=True
+                    )
+                else:
+                    st.dataframe(tabela_mud, use_container_width=True, hide_index=True)
 
 
 # ============================================================
-# RODAPÉ
+# FIM DA PÁGINA
 # ============================================================
-
-st.markdown("---")
-st.caption("Powered by Brasforma • Arquitetura Comercial Inteligente • IA aplicada a dados corporativos.")
+encerrar_pagina()
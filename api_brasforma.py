@@ -0,0 +1,416 @@
+"""
+API local (HTTP/JSON) com os mesmos KPIs e rankings do dashboard.
+
+A base é carregada uma vez; cada consulta recebe um payload de filtros no
+formato de calculos_comerciais.aplicar_filtros. Respostas ficam em cache
+por (rota, parâmetros, filtros) e consultas pesadas rodam em um pool de
+threads com tamanho limitado.
+
+Uso:
+    python api_brasforma.py --excel "Dashboard - Comite Semanal - Brasforma IA (1).xlsx"
+
+    curl -X POST localhost:8765/ranking \\
+         -d '{"dimensao": "skus", "top": 10, "filtros": {"uf": ["SP"]}}'
+
+Para testes sem rede, ServicoConsultas(df).consultar(rota, payload)
+responde sem subir o servidor. Com --parquet, a base fica em Parquet
+particionado e KPIs/rankings/séries são agregados no DuckDB
+(consulta_parquet.BaseParquet).
+"""
+
+import argparse
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import numpy as np
+
+import calculos_comerciais as cc
+import inteligencia_comercial as ic
+from pipeline_brasforma import load_brasforma
+
+ARQUIVO_PADRAO = "Dashboard - Comite Semanal - Brasforma IA (1).xlsx"
+
+RANKINGS = {
+    "clientes": cc.ranking_clientes,
+    "representantes": cc.ranking_representantes,
+    "ufs": cc.ranking_ufs,
+    "skus": cc.ranking_skus,
+}
+
+# Colunas do histórico usadas por novos/perdidos e novos/não atendidos
+COLUNAS_HISTORICO = ["Data / Mês", "Representante", "Nome Cliente", "Faturamento Líquido"]
+
+INTELIGENCIA = {
+    "clientes_em_crescimento": ic.clientes_em_crescimento,
+    "clientes_em_queda": ic.clientes_em_queda,
+    "skus_em_tendencia": ic.skus_em_tendencia,
+    "cesta_por_regiao": ic.cesta_por_regiao,
+    "detectar_anomalias": ic.detectar_anomalias,
+    "rfm": ic.calcular_rfm,
+}
+
+
+# -------------------------------------------------------------
+# SERIALIZAÇÃO
+# -------------------------------------------------------------
+def _serializar(obj):
+    """Converte resultados pandas/numpy em tipos JSON (NaN vira null)"""
+    if isinstance(obj, pd.DataFrame):
+        return json.loads(obj.to_json(orient="records", date_format="iso", force_ascii=False))
+    if isinstance(obj, pd.Series):
+        return _serializar(obj.to_frame())
+    if isinstance(obj, dict):
+        return {str(k): _serializar(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_serializar(v) for v in obj]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    return obj
+
+
+def _chave(rota, payload):
+    """Chave de cache estável: listas de filtro ordenadas, chaves ordenadas"""
+    normal = dict(payload)
+    filtros = dict(normal.get("filtros") or {})
+    for k, v in filtros.items():
+        if isinstance(v, list) and k != "periodo":
+            filtros[k] = sorted(map(str, v))
+    normal["filtros"] = filtros
+    return rota + "|" + json.dumps(normal, sort_keys=True, default=str, ensure_ascii=False)
+
+
+# -------------------------------------------------------------
+# VALIDAÇÃO DOS FILTROS
+# -------------------------------------------------------------
+FILTROS_LISTA = ["transacao", *cc.COLUNAS_FILTRO]
+FILTROS_TEXTO = ["cliente", "item"]
+
+
+def _validar_filtros(filtros):
+    """
+    Confere o payload de filtros antes de aplicar_filtros (ValueError = 400).
+
+    Chaves fora das conhecidas seriam ignoradas em silêncio e a resposta
+    viria da base inteira; tipos errados quebrariam no meio do cálculo.
+    """
+    if filtros is None:
+        return
+    if not isinstance(filtros, dict):
+        raise ValueError("filtros deve ser um objeto JSON")
+
+    desconhecidas = set(filtros) - set(FILTROS_LISTA) - set(FILTROS_TEXTO) - {"periodo"}
+    if desconhecidas:
+        raise ValueError(
+            f"filtros desconhecidos: {sorted(desconhecidas)}; "
+            f"use {sorted(FILTROS_LISTA + FILTROS_TEXTO + ['periodo'])}"
+        )
+
+    for chave in FILTROS_LISTA:
+        valores = filtros.get(chave)
+        if valores is None:
+            continue
+        if not isinstance(valores, list) or any(isinstance(v, (list, dict)) for v in valores):
+            raise ValueError(f"filtros.{chave} deve ser uma lista de valores")
+
+    for chave in FILTROS_TEXTO:
+        texto = filtros.get(chave)
+        if texto is not None and not isinstance(texto, str):
+            raise ValueError(f"filtros.{chave} deve ser um texto")
+
+    periodo = filtros.get("periodo")
+    if periodo is not None:
+        if not isinstance(periodo, list) or len(periodo) != 2 or not all(isinstance(d, str) for d in periodo):
+            raise ValueError('filtros.periodo deve ser uma lista com duas datas ["AAAA-MM-DD", "AAAA-MM-DD"]')
+        try:
+            for data in periodo:
+                pd.to_datetime(data)
+        except (TypeError, ValueError):
+            raise ValueError(f"filtros.periodo tem data inválida: {periodo}")
+
+
+# -------------------------------------------------------------
+# SERVIÇO (SEM HTTP)
+# -------------------------------------------------------------
+class RotaDesconhecida(KeyError):
+    """Rota fora de ServicoConsultas.rotas() (KeyError de dentro de um cálculo não é isto)"""
+
+
+class ServicoConsultas:
+    """
+    Consultas sobre uma base já tratada, com cache LRU e pool de threads.
+
+    Consultas idênticas simultâneas compartilham o mesmo Future: o cálculo
+    roda uma vez e as demais esperam pelo resultado.
+    """
+
+    ROTAS_PESADAS = {"inteligencia", "representantes", "alertas"}
+
+    def __init__(self, df, max_cache=256, max_trabalhadores=4):
+        self.df = df
+        self.max_cache = max_cache
+        self._cache = OrderedDict()
+        self._trava = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_trabalhadores, thread_name_prefix="consulta")
+        self._rotas = {
+            "kpis": self._kpis,
+            "ranking": self._ranking,
+            "serie-mensal": self._serie_mensal,
+            "representantes": self._representantes,
+            "clientes-novos-perdidos": self._clientes_novos_perdidos,
+            "inteligencia": self._inteligencia,
+            "alertas": self._alertas,
+        }
+
+    @classmethod
+    def do_excel(cls, path, sheet="BD DASH", **kwargs):
+        return cls(load_brasforma(path, sheet), **kwargs)
+
+    # ---------------- infraestrutura ----------------
+    def rotas(self):
+        return sorted(self._rotas)
+
+    def consultar(self, rota, payload=None):
+        """Resultado serializável da rota; RotaDesconhecida p/ rota e ValueError p/ payload inválidos"""
+        if rota not in self._rotas:
+            raise RotaDesconhecida(rota)
+        payload = payload or {}
+        if not isinstance(payload, dict):
+            raise ValueError("payload deve ser um objeto JSON")
+        _validar_filtros(payload.get("filtros"))
+
+        chave = _chave(rota, payload)
+        calcular_aqui = False
+        with self._trava:
+            futuro = self._cache.get(chave)
+            if futuro is not None:
+                self._cache.move_to_end(chave)
+            else:
+                if rota in self.ROTAS_PESADAS:
+                    futuro = self._pool.submit(self._executar, rota, payload)
+                else:
+                    futuro, calcular_aqui = Future(), True
+                self._cache[chave] = futuro
+                while len(self._cache) > self.max_cache:
+                    self._cache.popitem(last=False)
+
+        # Consultas leves rodam na própria thread da requisição, fora da trava
+        if calcular_aqui:
+            try:
+                futuro.set_result(self._executar(rota, payload))
+            except Exception as e:
+                futuro.set_exception(e)
+
+        try:
+            return futuro.result()
+        except Exception:
+            # Erros não ficam em cache
+            with self._trava:
+                if self._cache.get(chave) is futuro:
+                    del self._cache[chave]
+            raise
+
+    def _executar(self, rota, payload):
+        return _serializar(self._rotas[rota](payload))
+
+    def limpar_cache(self):
+        with self._trava:
+            self._cache.clear()
+
+    def linhas_base(self):
+        if isinstance(self.df, pd.DataFrame):
+            return len(self.df)
+        return self.df.visao().linhas()
+
+    def info_cache(self):
+        with self._trava:
+            return {"entradas": len(self._cache), "max": self.max_cache}
+
+    def encerrar(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _filtrar(self, payload):
+        filtros = payload.get("filtros") or {}
+        if not isinstance(filtros, dict):
+            raise ValueError("filtros deve ser um objeto JSON")
+        return cc.aplicar_filtros(self.df, filtros)
+
+    def _linhas_filtradas(self, payload):
+        """
+        (base, df_f) em pandas para rotas que precisam das linhas.
+
+        Com base Parquet, materializa só o recorte filtrado e as colunas de
+        histórico necessárias, nunca a base inteira.
+        """
+        df_f = self._filtrar(payload)
+        if isinstance(df_f, pd.DataFrame):
+            return self.df, df_f
+        return df_f.anterior().to_pandas(COLUNAS_HISTORICO), df_f.to_pandas()
+
+    # ---------------- rotas ----------------
+    def _kpis(self, payload):
+        df_f = self._filtrar(payload)
+        if df_f.empty:
+            return {"linhas": 0}
+        kpis = cc.kpis_gerais(df_f)
+        return {
+            "linhas": len(df_f) if isinstance(df_f, pd.DataFrame) else df_f.linhas(),
+            **kpis,
+            **cc.variacao_periodo_anterior(self.df, df_f, kpis),
+            "concentracao_top5": cc.concentracao_top_clientes(df_f),
+        }
+
+    def _ranking(self, payload):
+        dimensao = payload.get("dimensao", "clientes")
+        if dimensao not in RANKINGS:
+            raise ValueError(f"dimensao deve ser uma de {sorted(RANKINGS)}")
+        cortes = payload.get("cortes") or {}
+        if not isinstance(cortes, dict) or set(cortes) - set(cc.CORTES_ABC):
+            raise ValueError(f"cortes deve ser um objeto com chaves em {sorted(cc.CORTES_ABC)}")
+        ranking = cc.curva_abc(RANKINGS[dimensao](self._filtrar(payload)), cortes=cortes)
+        return ranking.head(_inteiro(payload, "top", 50))
+
+    def _serie_mensal(self, payload):
+        return cc.evolucao_mensal(self._filtrar(payload))
+
+    def _representantes(self, payload):
+        df, df_f = self._linhas_filtradas(payload)
+        if df_f.empty:
+            return []
+        rep = cc.ranking_representantes_completo(df, df_f)
+        return rep.sort_values("FatLiq", ascending=False).head(_inteiro(payload, "top", 50))
+
+    def _clientes_novos_perdidos(self, payload):
+        df, df_f = self._linhas_filtradas(payload)
+        if df_f.empty:
+            return {"novos": [], "perdidos": []}
+        novos, perdidos = cc.clientes_novos_perdidos(df, df_f, _inteiro(payload, "meses", 12))
+        return {"novos": novos, "perdidos": perdidos}
+
+    def _inteligencia(self, payload):
+        tabela = payload.get("tabela")
+        if tabela not in INTELIGENCIA:
+            raise ValueError(f"tabela deve ser uma de {sorted(INTELIGENCIA)}")
+        _, df_f = self._linhas_filtradas(payload)
+        return INTELIGENCIA[tabela](df_f).head(_inteiro(payload, "top", 200))
+
+    def _alertas(self, payload):
+        limites = payload.get("limites") or {}
+        if not isinstance(limites, dict) or set(limites) - set(ic.LIMITES_ALERTA):
+            raise ValueError(f"limites deve ser um objeto com chaves em {sorted(ic.LIMITES_ALERTA)}")
+        df, df_f = self._linhas_filtradas(payload)
+        alertas = ic.alertas_carteira(df, df_f, limites=limites)
+        return alertas.head(_inteiro(payload, "top", 500))
+
+
+def _inteiro(payload, chave, padrao):
+    try:
+        valor = int(payload.get(chave, padrao))
+    except (TypeError, ValueError):
+        raise ValueError(f"{chave} deve ser inteiro")
+    if valor <= 0:
+        raise ValueError(f"{chave} deve ser positivo")
+    return valor
+
+
+# -------------------------------------------------------------
+# SERVIDOR HTTP
+# -------------------------------------------------------------
+class _Handler(BaseHTTPRequestHandler):
+    servico = None
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _rota(self):
+        return self.path.split("?", 1)[0].strip("/")
+
+    def do_GET(self):
+        rota = self._rota()
+        if rota in ("", "saude"):
+            self._responder(200, {
+                "linhas": self.servico.linhas_base(),
+                "rotas": self.servico.rotas(),
+                "cache": self.servico.info_cache(),
+            })
+        else:
+            self._atender(rota, {})
+
+    def do_POST(self):
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(tamanho) or b"{}")
+        except json.JSONDecodeError as e:
+            self._responder(400, {"erro": f"JSON inválido: {e}"})
+            return
+        self._atender(self._rota(), payload)
+
+    def _atender(self, rota, payload):
+        try:
+            self._responder(200, self.servico.consultar(rota, payload))
+        except RotaDesconhecida:
+            self._responder(404, {"erro": f"rota desconhecida: /{rota}", "rotas": self.servico.rotas()})
+        except ValueError as e:
+            self._responder(400, {"erro": str(e)})
+        except Exception as e:
+            self._responder(500, {"erro": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, *args):
+        pass
+
+
+def criar_servidor(servico, host="127.0.0.1", porta=8765):
+    """ThreadingHTTPServer ligado ao serviço (porta=0 escolhe uma porta livre)"""
+    handler = type("Handler", (_Handler,), {"servico": servico})
+    return ThreadingHTTPServer((host, porta), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API local de consultas Brasforma")
+    parser.add_argument("--excel", default=ARQUIVO_PADRAO)
+    parser.add_argument("--parquet", help="pasta da base Parquet (gerada do --excel se não existir)")
+    parser.add_argument("--aba", default="BD DASH")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--trabalhadores", type=int, default=4)
+    parser.add_argument("--cache", type=int, default=256, help="máximo de respostas em cache")
+    args = parser.parse_args(argv)
+
+    if args.parquet:
+        from consulta_parquet import BaseParquet
+
+        base = (
+            BaseParquet(args.parquet) if os.path.isdir(args.parquet)
+            else BaseParquet.do_excel(args.excel, args.parquet, args.aba)
+        )
+    else:
+        base = load_brasforma(args.excel, args.aba)
+
+    servico = ServicoConsultas(base, max_cache=args.cache, max_trabalhadores=args.trabalhadores)
+    servidor = criar_servidor(servico, args.host, args.porta)
+    print(f"API Brasforma em http://{args.host}:{servidor.server_address[1]} ({servico.linhas_base()} linhas)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servico.encerrar()
+
+
+if __name__ == "__main__":
+    main()
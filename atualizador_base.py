@@ -0,0 +1,153 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+from calculos_comerciais import histogramas_leadtime, opcoes_filtros, rollups_tempo
+from instrumentacao import medir
+from inteligencia_comercial import primeira_compra
+from pipeline_brasforma import load_brasforma
+from previsao_comercial import previsoes_faturamento
+from versoes_base import PASTA_VERSOES, gravar_versao
+
+# -------------------------------------------------------------
+# ATUALIZAÇÃO EM SEGUNDO PLANO DA PLANILHA PADRÃO
+# -------------------------------------------------------------
+
+logger = logging.getLogger("brasforma.atualizador")
+
+ARQUIVO_PADRAO = "Dashboard - Comite Semanal - Brasforma IA (1).xlsx"
+
+# Estruturas refeitas a cada versão da planilha padrão
+DERIVADOS_PADRAO = [
+    opcoes_filtros, rollups_tempo, histogramas_leadtime, previsoes_faturamento, primeira_compra,
+]
+
+# Um observador por (arquivo, aba) no processo inteiro
+_ATUALIZADORES = {}
+_trava_registro = threading.Lock()
+
+
+@dataclass(frozen=True)
+class VersaoBase:
+    """Uma versão carregada da planilha: base tratada + estruturas derivadas"""
+    df: object
+    numero: int
+    assinatura: tuple
+    carregada_em: float
+    extras: dict = field(default_factory=dict)
+
+
+def _assinatura(path):
+    """(mtime, tamanho) do arquivo, ou None se ele não existir no momento"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class AtualizadorBase:
+    """
+    Observa a planilha padrão e troca a base carregada de forma atômica.
+
+    Uma thread daemon compara (mtime, tamanho) do arquivo a cada `intervalo`
+    segundos. Quando o arquivo muda e fica estável por duas leituras
+    seguidas (evita pegar a planilha no meio da cópia), a base é refeita na
+    própria thread e publicada numa única atribuição. As sessões seguem
+    servindo a versão anterior até a troca e nunca esperam pela recarga;
+    só a primeira carga do processo é síncrona.
+
+    `derivados` recebe funções df -> objeto (índices etc.) recalculadas a
+    cada versão e guardadas em VersaoBase.extras pelo nome da função.
+    Com `pasta_versoes`, cada base carregada também é gravada como versão
+    (versoes_base) para a comparação semana a semana; a gravação roda na
+    thread do observador depois da troca, fora do caminho das sessões.
+    """
+
+    def __init__(self, path, sheet="BD DASH", intervalo=30.0, derivados=None, pasta_versoes=None):
+        self.path = path
+        self.sheet = sheet
+        self.intervalo = intervalo
+        self.derivados = list(derivados or [])
+        self.pasta_versoes = pasta_versoes
+        self.ultimo_erro = None
+
+        self._versao = self._carregar(1, _assinatura(path))
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._observar, name="atualizador-base", daemon=True)
+        self._thread.start()
+
+    def atual(self):
+        """Versão vigente (uma leitura de referência; segura entre threads)"""
+        return self._versao
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join(timeout=self.intervalo + 1)
+
+    def _carregar(self, numero, assinatura):
+        with medir("atualizador.recarga") as reg:
+            df = load_brasforma(self.path, self.sheet)
+            extras = {f.__name__: f(df) for f in self.derivados}
+            reg["linhas_saida"] = len(df)
+        return VersaoBase(df, numero, assinatura, time.time(), extras)
+
+    def _gravar_versao(self, df):
+        # Falha ao gravar o histórico não impede servir a base nova
+        if not self.pasta_versoes:
+            return
+        try:
+            gravar_versao(df, self.pasta_versoes, origem=self.path)
+        except Exception:
+            logger.exception("Falha ao gravar a versão de %s em %s", self.path, self.pasta_versoes)
+
+    def _observar(self):
+        # A versão da primeira carga é gravada aqui, não na carga síncrona
+        self._gravar_versao(self._versao.df)
+        pendente = falhou = None
+        while not self._parar.wait(self.intervalo):
+            assinatura = _assinatura(self.path)
+            if assinatura in (None, self._versao.assinatura, falhou):
+                pendente = None
+                continue
+            if assinatura != pendente:
+                # Mudou desde a última olhada: espera estabilizar
+                pendente = assinatura
+                continue
+
+            try:
+                nova = self._carregar(self._versao.numero + 1, assinatura)
+            except Exception as e:
+                # Mantém a versão anterior; só tenta de novo se o arquivo mudar outra vez
+                self.ultimo_erro = f"{type(e).__name__}: {e}"
+                logger.exception("Falha ao recarregar %s", self.path)
+                pendente, falhou = None, assinatura
+                continue
+
+            self._versao = nova
+            self.ultimo_erro = None
+            pendente = None
+            logger.info("Base %s recarregada (versão %d, %d linhas)", self.path, nova.numero, len(nova.df))
+            self._gravar_versao(nova.df)
+
+
+def obter_atualizador(path=ARQUIVO_PADRAO, sheet="BD DASH"):
+    """
+    Observador único do processo para a planilha (cria e carrega na 1ª chamada).
+
+    Quem chega enquanto a primeira carga está em andamento (por exemplo, o
+    aquecimento ao subir o servidor) espera por ela em vez de carregar de novo.
+    """
+    chave = (os.path.abspath(path), sheet)
+    with _trava_registro:
+        if chave not in _ATUALIZADORES:
+            _ATUALIZADORES[chave] = AtualizadorBase(
+                path, sheet,
+                intervalo=float(os.environ.get("BRASFORMA_INTERVALO_ATUALIZACAO", 30)),
+                derivados=DERIVADOS_PADRAO,
+                # Gravar versões é opcional: só com a pasta definida no ambiente
+                pasta_versoes=PASTA_VERSOES if os.environ.get("BRASFORMA_PASTA_VERSOES") else None,
+            )
+        return _ATUALIZADORES[chave]
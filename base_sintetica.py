@@ -0,0 +1,152 @@
+import pandas as pd
+import numpy as np
+
+# -------------------------------------------------------------
+# BASE SINTÉTICA NO FORMATO DA ABA "BD DASH"
+# -------------------------------------------------------------
+
+UFS = np.array([
+    "AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA",
+    "PB", "PE", "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO",
+])
+
+# Peso de cada UF na carteira (Sudeste/Sul concentram a maior parte)
+PESO_UF = np.array([
+    1, 2, 2, 1, 6, 4, 3, 3, 4, 2, 14, 2, 3, 2,
+    2, 4, 1, 9, 10, 2, 1, 1, 8, 7, 1, 30, 1,
+], dtype=float)
+
+REGIONAL_UF = {
+    "Norte": ["AC", "AM", "AP", "PA", "RO", "RR", "TO"],
+    "Nordeste": ["AL", "BA", "CE", "MA", "PB", "PE", "PI", "RN", "SE"],
+    "Centro-Oeste": ["DF", "GO", "MS", "MT"],
+    "Sudeste": ["ES", "MG", "RJ", "SP"],
+    "Sul": ["PR", "RS", "SC"],
+}
+
+ICMS_UF = {"SP": 0.18, "MG": 0.18, "RJ": 0.20, "PR": 0.195, "RS": 0.17, "SC": 0.17}
+
+IMPOSTOS_COLS = [
+    "cofins", "pis", "ipi", "icms", "ipiReturned-T", "icmsSt", "ipi-T",
+    "aproxtribFed", "aproxtribState", "cofinsDeson", "pisDeson",
+    "icmsDeson", "icmsStFCP", "icmsDifaRemet", "icmsDifaDest",
+    "icmsDifaFCP",
+]
+
+
+def _pesos_zipf(n, expoente, rng):
+    """Popularidade de cauda longa (poucos clientes/SKUs concentram o volume)"""
+    pesos = 1.0 / np.arange(1, n + 1) ** expoente
+    rng.shuffle(pesos)
+    return pesos / pesos.sum()
+
+
+def cardinalidades(n_linhas):
+    """Cardinalidades realistas para a escala pedida (clientes, SKUs, reps, pedidos)"""
+    return {
+        "clientes": int(np.clip(n_linhas // 25, 50, 200_000)),
+        "skus": int(np.clip(n_linhas // 40, 100, 60_000)),
+        "representantes": int(np.clip(n_linhas // 5_000, 10, 150)),
+        "pedidos": max(n_linhas // 4, 1),
+    }
+
+
+def gerar_base_sintetica(n_linhas=100_000, seed=0, meses=24, fim="2025-06-30", **cards):
+    """
+    Gera um DataFrame cru no layout da aba "BD DASH" (antes do load_brasforma).
+
+    Pedidos têm vários itens; cliente, UF, representante, datas e status são
+    atributos do pedido, e preço, custo e impostos do item. As cardinalidades
+    escalam com n_linhas e podem ser sobrescritas (clientes=, skus=, ...).
+    """
+    rng = np.random.default_rng(seed)
+    card = {**cardinalidades(n_linhas), **cards}
+    n_cli, n_sku, n_rep, n_ped = card["clientes"], card["skus"], card["representantes"], card["pedidos"]
+
+    # ---- Clientes ----
+    uf_cli = rng.choice(UFS, size=n_cli, p=PESO_UF / PESO_UF.sum())
+    rep_cli = rng.integers(0, n_rep, n_cli)
+    regional = {uf: reg for reg, lista in REGIONAL_UF.items() for uf in lista}
+
+    # ---- SKUs ----
+    preco_sku = rng.lognormal(3.5, 1.0, n_sku)
+    custo_sku = preco_sku * rng.uniform(0.35, 0.85, n_sku)
+    ipi_sku = rng.choice([0.0, 0.05, 0.10], size=n_sku, p=[0.5, 0.3, 0.2])
+
+    # ---- Pedidos ----
+    fim = pd.Timestamp(fim)
+    inicio = fim - pd.DateOffset(months=meses)
+    dias = (fim - inicio).days
+
+    cli_ped = rng.choice(n_cli, size=n_ped, p=_pesos_zipf(n_cli, 0.8, rng))
+    data_ped = inicio + pd.to_timedelta(rng.integers(0, dias, n_ped), unit="D")
+    lead = np.round(rng.gamma(2.0, 9.0, n_ped)).astype(int)
+    entregue = rng.random(n_ped) < 0.9
+    prazo = rng.choice([15, 21, 30, 45], size=n_ped)
+
+    # Troca de representante em ~10% dos pedidos (carteiras compartilhadas)
+    rep_ped = np.where(rng.random(n_ped) < 0.1, rng.integers(0, n_rep, n_ped), rep_cli[cli_ped])
+
+    # ---- Itens (linhas) ----
+    ped = np.sort(rng.integers(0, n_ped, n_linhas))
+    item = rng.choice(n_sku, size=n_linhas, p=_pesos_zipf(n_sku, 1.0, rng))
+    cli = cli_ped[ped]
+    uf = uf_cli[cli]
+
+    qtd = rng.integers(1, 60, n_linhas).astype(float)
+    desconto = rng.choice([0.0, 0.03, 0.05, 0.10], size=n_linhas, p=[0.6, 0.2, 0.15, 0.05])
+    valor = np.round(qtd * preco_sku[item] * (1 - desconto), 2)
+
+    data_pedido = data_ped[ped]
+    data_entrega = pd.Series(data_pedido + pd.to_timedelta(lead[ped], unit="D")).where(entregue[ped])
+
+    df = pd.DataFrame({
+        "Pedido": 100_000 + ped,
+        "Data / Mês": data_pedido.to_period("M").to_timestamp(),
+        "Transação": rng.choice(["Venda", "Bonificação", "Remessa", "Troca"], size=n_linhas,
+                                p=[0.9, 0.04, 0.04, 0.02]),
+        "Nome Cliente": np.char.add("CLIENTE ", cli.astype(str)),
+        "ITEM": np.char.add("SKU-", item.astype(str)),
+        "Representante": np.char.add("REP ", rep_ped[ped].astype(str)),
+        "UF": uf,
+        "Regional": pd.Series(uf).map(regional).to_numpy(),
+        "Status de Produção / Faturamento": rng.choice(
+            ["Faturado", "Em produção", "Aguardando", "Cancelado"], size=n_linhas,
+            p=[0.75, 0.15, 0.08, 0.02]),
+        "Data do Pedido": data_pedido,
+        "Data da Entrega": data_entrega,
+        "Data Final": data_entrega,
+        "Data Inserção": data_pedido,
+        "Quant. Pedidos": qtd,
+        "Valor Pedido R$": valor,
+        "Custo": np.round(custo_sku[item], 4),
+        "Atrasado / No prazo": np.where(lead[ped] > prazo[ped], "Atrasado", "No prazo"),
+    })
+
+    # ---- Impostos ----
+    icms = pd.Series(uf).map(ICMS_UF).fillna(0.12).to_numpy()
+    st_mask = rng.random(n_linhas) < 0.15
+    difa_mask = (uf != "SP") & (rng.random(n_linhas) < 0.2)
+
+    impostos = {col: np.zeros(n_linhas) for col in IMPOSTOS_COLS}
+    impostos["cofins"] = valor * 0.076
+    impostos["pis"] = valor * 0.0165
+    impostos["ipi"] = valor * ipi_sku[item]
+    impostos["icms"] = valor * icms
+    impostos["icmsSt"] = np.where(st_mask, valor * 0.04, 0.0)
+    impostos["icmsStFCP"] = np.where(st_mask, valor * 0.01, 0.0)
+    impostos["icmsDifaRemet"] = np.where(difa_mask, valor * 0.005, 0.0)
+    impostos["icmsDifaDest"] = np.where(difa_mask, valor * 0.02, 0.0)
+    impostos["icmsDifaFCP"] = np.where(difa_mask, valor * 0.002, 0.0)
+    impostos["aproxtribFed"] = valor * 0.01
+    impostos["aproxtribState"] = valor * 0.005
+
+    for col in IMPOSTOS_COLS:
+        df[col] = np.round(impostos[col], 2)
+
+    return df
+
+
+def salvar_xlsx(df, path, sheet="BD DASH"):
+    """Grava a base sintética como planilha (limite do Excel: 1.048.575 linhas)"""
+    df.to_excel(path, sheet_name=sheet, index=False)
@@ -0,0 +1,494 @@
+"""
+Benchmark reprodutível do dashboard Brasforma sobre a base sintética.
+
+Mede tempo de parede e pico de memória (tracemalloc) de cada etapa:
+ingestão, cadeia de filtros da sidebar, cálculos de cada aba do DASH.py e
+cada função de inteligencia_comercial.py. O resultado sai em JSON e pode
+ser comparado com uma baseline gravada.
+
+Uso:
+    python benchmark_brasforma.py --linhas 10000 100000 --saida bench.json
+    python benchmark_brasforma.py --linhas 100000 --gravar-baseline
+    python benchmark_brasforma.py --linhas 100000 --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import ast
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+import calculos_comerciais as cc
+import inteligencia_comercial as ic
+import previsao_comercial as pc
+import simulador_cenarios as sc
+import versoes_base as vb
+from base_sintetica import gerar_base_sintetica, salvar_xlsx
+from compra_conjunta import IndiceCompraConjunta
+from pipeline_brasforma import load_brasforma, preparar_base
+
+BASELINE_PADRAO = os.path.join("benchmarks", "baseline.json")
+
+# -------------------------------------------------------------
+# REGISTRO DAS ETAPAS
+# -------------------------------------------------------------
+
+# Lista ordenada de (nome, função(ctx)); cada etapa pode gravar no ctx
+ETAPAS = []
+
+# Etapa -> etapas que precisam rodar antes (preenchem o ctx que ela lê)
+DEPENDENCIAS = {}
+
+
+def etapa(nome, requer=("filtros.cadeia",)):
+    """Registra uma etapa do benchmark (uso como decorador); `requer` lista as etapas de que depende"""
+    def registrar(func):
+        ETAPAS.append((nome, func))
+        DEPENDENCIAS[nome] = tuple(requer)
+        return func
+    return registrar
+
+
+def etapas_selecionadas(prefixos=None):
+    """Nomes das etapas com os prefixos pedidos mais as dependências delas (todas sem prefixos)"""
+    if not prefixos:
+        return {nome for nome, _ in ETAPAS}
+    pendentes = [nome for nome, _ in ETAPAS if nome.startswith(tuple(prefixos))]
+    selecionadas = set()
+    while pendentes:
+        nome = pendentes.pop()
+        if nome not in selecionadas:
+            selecionadas.add(nome)
+            pendentes.extend(DEPENDENCIAS[nome])
+    return selecionadas
+
+
+# -------------------------------------------------------------
+# INICIALIZAÇÃO
+# -------------------------------------------------------------
+
+def importacoes_dash():
+    """
+    Módulos importados de imediato pelo DASH.py, lidos do próprio script.
+
+    Só os imports do nível do módulo contam; os carregados por
+    ModuloPreguicoso ficam de fora (são importados sob demanda).
+    """
+    caminho = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DASH.py")
+    with open(caminho, encoding="utf-8") as f:
+        arvore = ast.parse(f.read())
+
+    modulos = []
+    for no in arvore.body:
+        if isinstance(no, ast.Import):
+            modulos.extend(alias.name for alias in no.names)
+        elif isinstance(no, ast.ImportFrom) and no.module and not no.level:
+            modulos.append(no.module)
+    return list(dict.fromkeys(modulos))
+
+
+@etapa("inicializacao.importacoes", requer=())
+def _importacoes(ctx):
+    # Processo novo: mede a importação a frio, como num worker recém-criado
+    subprocess.run(
+        [sys.executable, "-c", "import " + ", ".join(importacoes_dash())],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True,
+    )
+
+
+# -------------------------------------------------------------
+# INGESTÃO E FILTROS
+# -------------------------------------------------------------
+@etapa("ingestao.read_excel", requer=())
+def _ler_excel(ctx):
+    load_brasforma(ctx["xlsx"])
+
+
+@etapa("ingestao.preparar_base", requer=())
+def _preparar(ctx):
+    ctx["df"] = preparar_base(ctx.pop("bruto"))
+
+
+@etapa("filtros.cadeia", requer=("ingestao.preparar_base",))
+def _filtros(ctx):
+    # Espelha a sidebar do DASH.py com seleções típicas (metade das reps, todas as UFs)
+    df = ctx["df"]
+    ctx["filtros"] = {
+        "periodo": (df["Data / Mês"].min() + pd.DateOffset(months=6), df["Data / Mês"].max()),
+        "transacao": ["Venda", "Bonificação"],
+        "representante": sorted(df["Representante"].dropna().unique())[::2],
+        "uf": sorted(df["UF"].dropna().unique()),
+        "status": sorted(df["Status de Produção / Faturamento"].dropna().unique()),
+        # Texto que casa com todos os clientes: mede o custo do str.contains
+        "cliente": "cliente",
+    }
+    ctx["df_f"] = cc.aplicar_filtros(df, ctx["filtros"])
+
+
+# -------------------------------------------------------------
+# VISÃO EXECUTIVA
+# -------------------------------------------------------------
+@etapa("visao_executiva.kpis")
+def _kpis(ctx):
+    df, df_f = ctx["df"], ctx["df_f"]
+    kpis = cc.kpis_gerais(df_f)
+    cc.variacao_periodo_anterior(df, df_f, kpis)
+    cc.concentracao_top_clientes(df_f)
+
+
+@etapa("visao_executiva.clientes_por_representante")
+def _rep_global(ctx):
+    cc.saldo_clientes_por_representante(ctx["df"], ctx["df_f"])
+
+
+@etapa("visao_executiva.simulador_cenarios")
+def _cenarios(ctx):
+    cubo = sc.cubo_cenarios(ctx["df_f"][sc.COLUNAS_CUBO])
+    uf = ctx["filtros"]["uf"][0]
+    cenario = sc.simular_cenario(cubo, [
+        {"tipo": "Desconto", "pct": 5, "uf": [uf], "item": "SKU-1"},
+        {"tipo": "Alíquota", "pct": 10, "componente": "icmsSt"},
+        {"tipo": "Custo", "pct": 3},
+    ])
+    sc.resumo_cenario(cenario)
+    sc.cenario_por(cenario, "UF")
+
+
+@etapa("ingestao.rollups_tempo", requer=("ingestao.preparar_base",))
+def _rollups(ctx):
+    ctx["rollups"] = cc.rollups_tempo(ctx["df"])
+
+
+@etapa("visao_executiva.evolucao_mensal", requer=("filtros.cadeia", "ingestao.rollups_tempo"))
+def _evolucao(ctx):
+    # Sem o filtro de texto, que obrigaria a série a sair das linhas
+    filtros = {k: v for k, v in ctx["filtros"].items() if k not in cc.FILTROS_TEXTO}
+    for grao in cc.GRAOS_TEMPO:
+        cc.serie_por_grao(ctx["rollups"], grao, filtros, ctx["df"])
+    cc.comparativo_ano_anterior(ctx["rollups"], "Mês", filtros, ctx["df"])
+
+
+# -------------------------------------------------------------
+# ABA CLIENTES
+# -------------------------------------------------------------
+@etapa("clientes.novos_perdidos")
+def _cli_novos(ctx):
+    cc.clientes_novos_perdidos(ctx["df"], ctx["df_f"])
+
+
+@etapa("clientes.ranking_abc")
+def _cli_ranking(ctx):
+    cc.resumo_abc(cc.curva_abc(cc.ranking_clientes(ctx["df_f"])))
+
+
+@etapa("ingestao.primeira_compra", requer=("ingestao.preparar_base",))
+def _primeira_compra(ctx):
+    ctx["primeiras"] = ic.primeira_compra(ctx["df"])
+
+
+@etapa("clientes.coortes", requer=("filtros.cadeia", "ingestao.primeira_compra"))
+def _coortes(ctx):
+    ic.coortes_clientes(ctx["df_f"], ctx["primeiras"])
+
+
+# -------------------------------------------------------------
+# ABA REPRESENTANTES
+# -------------------------------------------------------------
+@etapa("representantes.performance")
+def _rep(ctx):
+    cc.ranking_representantes_completo(ctx["df"], ctx["df_f"])
+
+
+# -------------------------------------------------------------
+# ABA UF / GEOGRAFIA
+# -------------------------------------------------------------
+@etapa("uf.kpis_abc_drill")
+def _uf(ctx):
+    df_f = ctx["df_f"]
+    geo = cc.ranking_ufs(df_f)
+    cc.curva_abc(geo)
+
+    df_u = df_f[df_f["UF"] == geo.sort_values("FatLiq").iloc[-1]["UF"]]
+    cc.resumo_recorte(df_u)
+    cc.top_faturamento(df_u, "Nome Cliente", 15)
+    cc.top_faturamento(df_u, "ITEM", 20)
+    cc.serie_mensal(df_u)
+
+
+# -------------------------------------------------------------
+# ABA PRODUTOS
+# -------------------------------------------------------------
+@etapa("produtos.pareto_itens")
+def _pareto(ctx):
+    cc.pareto(ctx["df_f"], "ITEM", "Quant. Pedidos")
+
+
+@etapa("produtos.ranking_classificacao")
+def _produtos(ctx):
+    sku = cc.ranking_skus(ctx["df_f"])
+    abc = cc.curva_abc(sku)
+    sku["Categoria IA"] = ic.classificar_skus(sku)
+    ctx["sku_top"] = abc["ITEM"].iloc[0]
+
+
+@etapa("produtos.analise_sku", requer=("produtos.ranking_classificacao",))
+def _produto_individual(ctx):
+    df_f = ctx["df_f"]
+    df_sku = df_f[df_f["ITEM"] == ctx["sku_top"]]
+    cc.resumo_recorte(df_sku)
+    cc.serie_mensal(df_sku)
+    cc.faturamento_por(df_sku, "UF")
+
+
+@etapa("produtos.analise_tributaria", requer=("produtos.ranking_classificacao",))
+def _tributos(ctx):
+    tributos = cc.analise_tributaria(ctx["df_f"])
+    cc.composicao_tributaria(tributos["SKU"], "ITEM", ctx["sku_top"])
+    cc.desvios_tributarios(tributos["SKU"], "ITEM")
+    cc.desvios_tributarios(tributos["UF"], "UF")
+
+
+@etapa("produtos.relacionados", requer=("produtos.ranking_classificacao",))
+def _relacionados(ctx):
+    indice = IndiceCompraConjunta.construir(
+        ctx["df_f"][["Nome Cliente", "ITEM", "Faturamento Líquido"]]
+    )
+    indice.relacionados(ctx["sku_top"], k=20)
+
+
+# -------------------------------------------------------------
+# ABA ATRASOS E RFM
+# -------------------------------------------------------------
+@etapa("ingestao.histogramas_leadtime", requer=("ingestao.preparar_base",))
+def _histogramas_leadtime(ctx):
+    ctx["hist_leadtime"] = cc.histogramas_leadtime(ctx["df"])
+
+
+@etapa("atrasos.metricas")
+def _atrasos(ctx):
+    cc.metricas_atraso(ctx["df_f"], cc.DIMENSOES_ATRASO)
+
+
+@etapa("atrasos.percentis_leadtime", requer=("filtros.cadeia", "ingestao.histogramas_leadtime"))
+def _percentis_leadtime(ctx):
+    filtros = {k: v for k, v in ctx["filtros"].items() if k not in cc.FILTROS_TEXTO}
+    cc.percentis_leadtime(ctx["hist_leadtime"], filtros, sla=30)
+    for dim in cc.QUEBRAS_LEADTIME.values():
+        grupo = cc.percentis_leadtime(ctx["hist_leadtime"], filtros, por=dim, sla=30)
+    cc.pedidos_fora_da_curva(ctx["df_f"], grupo.set_index(dim)["p99"], por=dim)
+
+
+@etapa("rfm.calculo_filtros")
+def _rfm(ctx):
+    df_f = ctx["df_f"]
+    rfm = ic.calcular_rfm(df_f)
+    membros = ic.indice_pertencimento(df_f, "Representante")
+    ic.filtrar_por_pertencimento(rfm, membros, membros["Representante"].unique()[:3])
+
+
+# -------------------------------------------------------------
+# INTELIGÊNCIA COMERCIAL
+# -------------------------------------------------------------
+for _nome in [
+    "clientes_em_crescimento",
+    "clientes_em_queda",
+    "skus_em_tendencia",
+    "cesta_por_regiao",
+    "detectar_anomalias",
+]:
+    etapa(f"inteligencia.{_nome}")(
+        lambda ctx, _func=getattr(ic, _nome): _func(ctx["df_f"])
+    )
+
+
+@etapa("inteligencia.alertas_carteira")
+def _alertas(ctx):
+    ic.alertas_carteira(ctx["df"], ctx["df_f"])
+
+
+@etapa("inteligencia.previsao_faturamento", requer=("ingestao.preparar_base",))
+def _previsao(ctx):
+    pc.previsoes_faturamento(ctx["df"])
+
+
+# -------------------------------------------------------------
+# VERSÕES DA BASE
+# -------------------------------------------------------------
+def _semana_seguinte(df, seed=0):
+    """Base da "semana seguinte": 2% de status trocados, 1% de atrasos e revisões, 1% entra e sai"""
+    rng = np.random.default_rng(seed)
+    nova = df.copy()
+    n = len(nova)
+    sorteio = rng.permutation(n)
+    fatias = np.array_split(sorteio[: n // 20], 5)
+
+    coluna = nova.columns.get_loc
+    nova.iloc[fatias[0], coluna(vb.COLUNA_STATUS)] = "Faturado"
+    nova.iloc[fatias[1], coluna(vb.COLUNA_ATRASO)] = "Atrasado"
+    nova.iloc[fatias[2], coluna(vb.COLUNA_VALOR)] *= 1.1
+    entrantes = nova.iloc[fatias[3]].assign(Pedido=lambda d: d["Pedido"] + 10_000_000)
+    return pd.concat([nova.drop(nova.index[fatias[4]]), entrantes], ignore_index=True)
+
+
+@etapa("versoes.gravar", requer=("ingestao.preparar_base",))
+def _gravar_versoes(ctx):
+    ctx["pasta_versoes"] = tempfile.mkdtemp()
+    vb.gravar_versao(ctx["df"], ctx["pasta_versoes"])
+    vb.gravar_versao(_semana_seguinte(ctx["df"]), ctx["pasta_versoes"])
+
+
+@etapa("versoes.diferencas", requer=("versoes.gravar",))
+def _diferencas(ctx):
+    vb.diferencas_versoes(1, 2, ctx["pasta_versoes"])
+
+
+# -------------------------------------------------------------
+# EXECUÇÃO E COMPARAÇÃO
+# -------------------------------------------------------------
+def _medir(func, ctx, memoria):
+    """Tempo de parede (s) ou pico de memória alocada (MB) de uma etapa"""
+    if not memoria:
+        inicio = time.perf_counter()
+        func(ctx)
+        return {"tempo_s": round(time.perf_counter() - inicio, 4)}
+
+    tracemalloc.start()
+    try:
+        func(ctx)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"pico_mb": round(pico / 2**20, 2)}
+
+
+def _passada(bruto, xlsx, memoria, filtro_etapas):
+    """Uma execução das etapas pedidas (e das que elas requerem) sobre uma cópia da base crua"""
+    ctx = {"bruto": bruto.copy(), "xlsx": xlsx}
+    selecionadas = etapas_selecionadas(filtro_etapas)
+    resultados = {}
+    try:
+        for nome, func in ETAPAS:
+            if nome not in selecionadas:
+                continue
+            if nome == "ingestao.read_excel" and not xlsx:
+                continue
+            resultados[nome] = _medir(func, ctx, memoria)
+            resultados[nome]["linhas"] = len(ctx["df_f"]) if "df_f" in ctx else len(ctx["df"]) if "df" in ctx else len(bruto)
+    finally:
+        if "pasta_versoes" in ctx:
+            shutil.rmtree(ctx.pop("pasta_versoes"), ignore_errors=True)
+    return resultados
+
+
+def executar(n_linhas, seed=0, excel=False, filtro_etapas=None, memoria=True):
+    """
+    Roda todas as etapas sobre uma base sintética de n_linhas.
+
+    O tempo vem de uma passada sem tracemalloc (que distorce laços em
+    Python); o pico de memória, de uma segunda passada com tracemalloc.
+    """
+    bruto = gerar_base_sintetica(n_linhas, seed=seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xlsx = None
+        if excel and n_linhas < 1_048_576:
+            xlsx = os.path.join(tmp, "base_sintetica.xlsx")
+            salvar_xlsx(bruto, xlsx)
+
+        resultados = _passada(bruto, xlsx, False, filtro_etapas)
+        if memoria:
+            for nome, med in _passada(bruto, xlsx, True, filtro_etapas).items():
+                resultados[nome]["pico_mb"] = med["pico_mb"]
+
+    return resultados
+
+
+def comparar(atual, baseline, tolerancia=0.25, minimo_s=0.05):
+    """Etapas cujo tempo piorou mais que a tolerância (ignora etapas muito rápidas)"""
+    regressoes = []
+    for escala, etapas in atual["escalas"].items():
+        base_escala = baseline.get("escalas", {}).get(escala, {})
+        for nome, med in etapas.items():
+            ref = base_escala.get(nome)
+            if not ref or max(ref["tempo_s"], med["tempo_s"]) < minimo_s:
+                continue
+            razao = med["tempo_s"] / ref["tempo_s"] if ref["tempo_s"] > 0 else np.inf
+            if razao > 1 + tolerancia:
+                regressoes.append({
+                    "escala": escala,
+                    "etapa": nome,
+                    "baseline_s": ref["tempo_s"],
+                    "atual_s": med["tempo_s"],
+                    "razao": round(razao, 2),
+                })
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do dashboard Brasforma")
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--excel", action="store_true", help="inclui a leitura do .xlsx")
+    parser.add_argument("--etapas", nargs="*", help="prefixos de etapas a medir")
+    parser.add_argument("--sem-memoria", action="store_true", help="não mede o pico de memória")
+    parser.add_argument("--saida", help="arquivo JSON de resultado")
+    parser.add_argument("--baseline", default=BASELINE_PADRAO)
+    parser.add_argument("--gravar-baseline", action="store_true")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    resultado = {
+        "meta": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "seed": args.seed,
+            "data": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "escalas": {},
+    }
+    for n in args.linhas:
+        resultado["escalas"][str(n)] = executar(
+            n, args.seed, args.excel, args.etapas, memoria=not args.sem_memoria
+        )
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+    if args.gravar_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            f.write(texto)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressoes = comparar(resultado, baseline, args.tolerancia)
+        for r in regressoes:
+            print(
+                f"REGRESSÃO {r['escala']} linhas · {r['etapa']}: "
+                f"{r['baseline_s']:.3f}s → {r['atual_s']:.3f}s ({r['razao']}x)",
+                file=sys.stderr,
+            )
+        return 1 if regressoes else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,892 @@
+import pandas as pd
+import numpy as np
+
+from instrumentacao import instrumentado
+from inteligencia_comercial import desvio_robusto, top_k_por_grupo
+
+# -------------------------------------------------------------
+# CÁLCULOS DO DASHBOARD (SEM STREAMLIT / PLOTLY)
+#
+# Funções puras sobre a base tratada (df) e a visão filtrada (df_f).
+# O DASH.py só renderiza; jobs em lote e benchmarks chamam estas
+# mesmas funções.
+# -------------------------------------------------------------
+
+NOMES_TRANSACAO = ["transacao", "transação", "transaction"]
+
+
+# -------------------------------------------------------------
+# AGREGAÇÃO (PANDAS OU BACKEND SQL)
+# -------------------------------------------------------------
+def _agregar(df_f, chave, colunas):
+    """
+    groupby(chave).agg(**colunas), ou uma linha de totais com chave=None.
+
+    Visões de consulta_parquet (base fora da memória) recebem a mesma
+    especificação e devolvem a agregação feita no DuckDB.
+    """
+    if not isinstance(df_f, pd.DataFrame):
+        return df_f.agregar(chave, colunas)
+    if chave is None:
+        return pd.DataFrame({nome: [getattr(df_f[col], func)()] for nome, (col, func) in colunas.items()})
+    return df_f.groupby(chave, as_index=False).agg(**colunas)
+
+
+# -------------------------------------------------------------
+# FILTROS
+# -------------------------------------------------------------
+def coluna_transacao(df):
+    """Coluna de Transação (coluna C da base quando o nome não é reconhecido)"""
+    for c in df.columns:
+        if c.strip().lower() in NOMES_TRANSACAO:
+            return c
+    return df.columns[2]
+
+
+COLUNAS_FILTRO = {
+    "regional": "Regional",
+    "representante": "Representante",
+    "uf": "UF",
+    "status": "Status de Produção / Faturamento",
+}
+
+
+def opcoes_filtros(df):
+    """Valores distintos (ordenados) de cada filtro de lista presente na base"""
+    colunas = {"transacao": coluna_transacao(df), **COLUNAS_FILTRO}
+    if not isinstance(df, pd.DataFrame):
+        # Base Parquet: um GROUP BY por coluna no DuckDB (chaves nulas ficam fora)
+        return {
+            chave: sorted(_agregar(df.visao(), coluna, {"_n": (coluna, "count")})[coluna])
+            for chave, coluna in colunas.items()
+            if coluna in df.columns
+        }
+    return {
+        chave: sorted(df[coluna].dropna().unique())
+        for chave, coluna in colunas.items()
+        if coluna in df.columns
+    }
+
+
+def limites_periodo(df):
+    """Primeira e última "Data / Mês" da base (pandas ou Parquet)"""
+    base = df if isinstance(df, pd.DataFrame) else df.visao()
+    tot = _agregar(base, None, {"ini": ("Data / Mês", "min"), "fim": ("Data / Mês", "max")}).iloc[0]
+    return pd.Timestamp(tot["ini"]), pd.Timestamp(tot["fim"])
+
+
+def contar_linhas(df):
+    """Linhas da base ou do recorte (len no pandas, COUNT(*) no DuckDB)"""
+    return len(df) if isinstance(df, pd.DataFrame) else df.linhas()
+
+
+def aplicar_filtros(df, filtros):
+    """
+    Cadeia de filtros da sidebar.
+
+    filtros: dict com "periodo" (ini, fim) e listas opcionais "transacao",
+    "regional", "representante", "uf", "status", além dos textos
+    "cliente" e "item" (busca "contém", sem diferenciar maiúsculas).
+
+    A base é compartilhada entre sessões e não deve ser alterada: quando
+    nenhum filtro restringe as linhas, devolve uma visão rasa (sem copiar
+    os dados) em vez de uma cópia completa. Com uma base Parquet
+    (consulta_parquet.BaseParquet) devolve a visão filtrada no DuckDB.
+    """
+    if not isinstance(df, pd.DataFrame):
+        return df.visao(filtros)
+
+    mascara = pd.Series(True, index=df.index)
+
+    periodo = filtros.get("periodo")
+    if periodo:
+        mascara &= (df["Data / Mês"] >= pd.to_datetime(periodo[0])) & \
+                   (df["Data / Mês"] <= pd.to_datetime(periodo[1]))
+
+    listas = {"transacao": coluna_transacao(df), **COLUNAS_FILTRO}
+    for chave, coluna in listas.items():
+        valores = filtros.get(chave)
+        if valores and coluna in df.columns:
+            mascara &= df[coluna].isin(valores)
+
+    for chave, coluna in [("cliente", "Nome Cliente"), ("item", "ITEM")]:
+        texto = (filtros.get(chave) or "").strip()
+        if texto and coluna in df.columns:
+            mascara &= df[coluna].astype(str).str.contains(texto, case=False, na=False)
+
+    if mascara.all():
+        return df.copy(deep=False)
+    return df[mascara]
+
+
+def historico_anterior(df, df_f):
+    """Linhas da base anteriores ao início da visão filtrada"""
+    if not isinstance(df_f, pd.DataFrame):
+        return df_f.anterior()
+    return df[df["Data / Mês"] < df_f["Data / Mês"].min()]
+
+
+# -------------------------------------------------------------
+# VISÃO EXECUTIVA
+# -------------------------------------------------------------
+@instrumentado()
+def kpis_gerais(df_f):
+    """KPIs dos cartões executivos"""
+    tot = _agregar(df_f, None, {
+        "fat_liq": ("Faturamento Líquido", "sum"),
+        "fat_bruto": ("Valor Pedido R$", "sum"),
+        "impostos": ("Imposto Total", "sum"),
+        "pedidos": ("Pedido", "nunique"),
+        "clientes": ("Nome Cliente", "nunique"),
+        "custo_total": ("Custo Total", "sum"),
+    }).iloc[0]
+    fat_liq, fat_bruto, impostos = tot["fat_liq"], tot["fat_bruto"], tot["impostos"]
+    pedidos, clientes, custo_total = tot["pedidos"], tot["clientes"], tot["custo_total"]
+
+    return {
+        "fat_liq": fat_liq,
+        "fat_bruto": fat_bruto,
+        "impostos": impostos,
+        "pedidos": pedidos,
+        "clientes": clientes,
+        "custo_total": custo_total,
+        "margem_bruta": ((fat_bruto - custo_total) / fat_bruto * 100) if fat_bruto > 0 else 0,
+        "ticket_medio": fat_liq / pedidos if pedidos > 0 else 0,
+        "perc_impostos": (impostos / fat_bruto * 100) if fat_bruto > 0 else 0,
+    }
+
+
+@instrumentado()
+def variacao_periodo_anterior(df, df_f, kpis):
+    """Variação % de faturamento, pedidos e clientes frente ao histórico anterior"""
+    prev = _agregar(historico_anterior(df, df_f), None, {
+        "fat": ("Faturamento Líquido", "sum"),
+        "ped": ("Pedido", "nunique"),
+        "cli": ("Nome Cliente", "nunique"),
+    }).iloc[0]
+    fat_prev, ped_prev, cli_prev = prev["fat"], prev["ped"], prev["cli"]
+
+    def var(atual, prev):
+        return ((atual - prev) / prev * 100) if prev > 0 else 0
+
+    return {
+        "var_fat": var(kpis["fat_liq"], fat_prev),
+        "var_ped": var(kpis["pedidos"], ped_prev),
+        "var_cli": var(kpis["clientes"], cli_prev),
+    }
+
+
+@instrumentado()
+def concentracao_top_clientes(df_f, n=5):
+    """% do faturamento líquido nos n maiores clientes"""
+    fat_liq = _agregar(df_f, None, {"Fat": ("Faturamento Líquido", "sum")})["Fat"].iloc[0]
+    por_cliente = _agregar(df_f, "Nome Cliente", {"Fat": ("Faturamento Líquido", "sum")})["Fat"]
+    return por_cliente.nlargest(n).sum() / fat_liq * 100 if fat_liq > 0 else 0
+
+
+@instrumentado()
+def saldo_clientes_por_representante(df, df_f):
+    """Clientes históricos × atuais por representante (contagens)"""
+    def clientes(recorte):
+        tab = _agregar(recorte, "Representante", {"Clientes": ("Nome Cliente", "nunique")})
+        return tab.set_index("Representante")["Clientes"]
+
+    hist = clientes(historico_anterior(df, df_f))
+    atual = clientes(df_f)
+
+    rep = pd.concat(
+        [hist.rename("ClientesHistoricos"), atual.rename("ClientesAtuais")], axis=1
+    ).fillna(0).astype(int)
+
+    rep["QtdClientesNovos"] = (rep["ClientesAtuais"] - rep["ClientesHistoricos"]).clip(lower=0)
+    rep["QtdClientesNaoAtendidos"] = (rep["ClientesHistoricos"] - rep["ClientesAtuais"]).clip(lower=0)
+    return rep
+
+
+@instrumentado()
+def evolucao_mensal(df_f):
+    return _agregar(df_f, "Ano-Mes", {
+        "FatLiq": ("Faturamento Líquido", "sum"),
+        "FatBruto": ("Valor Pedido R$", "sum"),
+        "Impostos": ("Imposto Total", "sum"),
+    })
+
+
+def serie_mensal(df_sel, coluna="Ano-Mes"):
+    """Faturamento líquido por período de um recorte (cliente, UF, SKU)"""
+    return _agregar(df_sel, coluna, {"Faturamento Líquido": ("Faturamento Líquido", "sum")})
+
+
+# -------------------------------------------------------------
+# SÉRIES POR GRÃO DE TEMPO (ROLLUPS)
+# -------------------------------------------------------------
+
+# Grão -> chave de calendário criada na ingestão
+GRAOS_TEMPO = {
+    "Semana": "Semana ISO",
+    "Mês": "Ano-Mes",
+    "Trimestre": "Trimestre",
+    "Ano": "Ano",
+    "Período fiscal": "Periodo Fiscal",
+}
+
+METRICAS_SERIE = {
+    "FatLiq": ("Faturamento Líquido", "sum"),
+    "FatBruto": ("Valor Pedido R$", "sum"),
+    "Impostos": ("Imposto Total", "sum"),
+}
+
+# Filtros de texto ("contém") não são dimensões dos rollups
+FILTROS_TEXTO = ("cliente", "item")
+
+
+def rollups_tempo(df):
+    """
+    Um cubo por grão: somas por (chave do grão, Data / Mês, dimensões de filtro).
+
+    Feito uma vez por versão da base; séries e comparações anuais filtram e
+    reagrupam o cubo (milhares de linhas) em vez das linhas da base.
+    """
+    dims = ["Data / Mês", coluna_transacao(df)] + [c for c in COLUNAS_FILTRO.values() if c in df.columns]
+    valores = {nome: col for nome, (col, _) in METRICAS_SERIE.items()}
+
+    cubos = {}
+    for grao, chave in GRAOS_TEMPO.items():
+        cubos[grao] = (
+            df.groupby([chave] + dims, dropna=False)[list(valores.values())]
+            .sum()
+            .rename(columns={col: nome for nome, col in valores.items()})
+            .reset_index()
+        )
+    return cubos
+
+
+def serie_por_grao(rollups, grao, filtros, base=None):
+    """
+    FatLiq, FatBruto e Impostos por período do grão sob os filtros da sidebar.
+
+    Com filtro de texto (cliente/item), ou sem rollups (base Parquet), a
+    série sai das linhas de `base` filtradas.
+    """
+    chave = GRAOS_TEMPO[grao]
+    if rollups is None or base is not None and any((filtros.get(k) or "").strip() for k in FILTROS_TEXTO):
+        return _agregar(aplicar_filtros(base, filtros), chave, METRICAS_SERIE)
+
+    cubo = aplicar_filtros(rollups[grao], {k: v for k, v in filtros.items() if k not in FILTROS_TEXTO})
+    return cubo.groupby(chave, as_index=False)[list(METRICAS_SERIE)].sum()
+
+
+def _mesmo_periodo_ano_seguinte(chave):
+    """'2024-03' -> '2025-03', '2024Q1' -> '2025Q1', 'AF2024-P03' -> 'AF2025-P03'"""
+    texto = str(chave)
+    for i in range(len(texto) - 3):
+        if texto[i:i + 4].isdigit():
+            return texto[:i] + str(int(texto[i:i + 4]) + 1) + texto[i + 4:]
+    return texto
+
+
+@instrumentado()
+def comparativo_ano_anterior(rollups, grao, filtros, base=None, metrica="FatLiq"):
+    """
+    Série do período com o mesmo período do ano anterior e a variação YoY (%).
+
+    O ano anterior é outra leitura dos rollups com o período deslocado em
+    12 meses; as chaves são alinhadas somando um ano à chave anterior.
+    """
+    chave = GRAOS_TEMPO[grao]
+    atual = serie_por_grao(rollups, grao, filtros, base)
+
+    filtros_ant = dict(filtros)
+    periodo = filtros.get("periodo")
+    if periodo:
+        filtros_ant["periodo"] = tuple(pd.to_datetime(p) - pd.DateOffset(years=1) for p in periodo[:2])
+    anterior = serie_por_grao(rollups, grao, filtros_ant, base)
+
+    anterior = pd.Series(
+        anterior[metrica].to_numpy(),
+        index=anterior[chave].astype(str).map(_mesmo_periodo_ano_seguinte),
+    )
+    anterior = anterior[~anterior.index.duplicated()]
+
+    comp = atual[[chave, metrica]].copy()
+    comp[f"{metrica} Ano Anterior"] = comp[chave].astype(str).map(anterior)
+    comp["Var YoY %"] = np.where(
+        comp[f"{metrica} Ano Anterior"] > 0,
+        (comp[metrica] / comp[f"{metrica} Ano Anterior"] - 1) * 100,
+        np.nan
+    )
+    return comp
+
+
+def resumo_recorte(df_sel):
+    """KPIs de um recorte da visão filtrada (cliente, UF ou SKU)"""
+    tot = _agregar(df_sel, None, {
+        "fat_liq": ("Faturamento Líquido", "sum"),
+        "fat_bruto": ("Valor Pedido R$", "sum"),
+        "pedidos": ("Pedido", "nunique"),
+        "clientes": ("Nome Cliente", "nunique"),
+        "impostos": ("Imposto Total", "sum"),
+        "lucro": ("Lucro Bruto", "sum"),
+    }).iloc[0]
+    fat_liq, fat_bruto, pedidos = tot["fat_liq"], tot["fat_bruto"], tot["pedidos"]
+    return {
+        "fat_liq": fat_liq,
+        "pedidos": pedidos,
+        "clientes": tot["clientes"],
+        "impostos": tot["impostos"],
+        "ticket_medio": fat_liq / pedidos if pedidos > 0 else np.nan,
+        "margem": 100 * tot["lucro"] / fat_bruto if fat_bruto > 0 else 0,
+    }
+
+
+# -------------------------------------------------------------
+# RANKINGS
+# -------------------------------------------------------------
+@instrumentado()
+def ranking_clientes(df_f):
+    cli = _agregar(df_f, "Nome Cliente", {
+        "FatLiq": ("Faturamento Líquido", "sum"),
+        "FatBruto": ("Valor Pedido R$", "sum"),
+        "Impostos": ("Imposto Total", "sum"),
+        "Lucro": ("Lucro Bruto", "sum"),
+        "Pedidos": ("Pedido", "nunique"),
+        "Qtd": ("Quant. Pedidos", "sum"),
+    })
+
+    cli["Ticket Médio"] = cli["FatLiq"] / cli["Pedidos"]
+    cli["Margem (%)"] = np.where(cli["FatBruto"] > 0, 100 * cli["Lucro"] / cli["FatBruto"], np.nan)
+    return cli
+
+
+@instrumentado()
+def ranking_representantes(df_f):
+    rep = _agregar(df_f, "Representante", {
+        "FatLiq": ("Faturamento Líquido", "sum"),
+        "FatBruto": ("Valor Pedido R$", "sum"),
+        "Impostos": ("Imposto Total", "sum"),
+        "CustoTotal": ("Custo Total", "sum"),
+        "Pedidos": ("Pedido", "nunique"),
+        "ClientesAtivos": ("Nome Cliente", "nunique"),
+        "QtdItens": ("Quant. Pedidos", "sum"),
+    })
+
+    rep["Ticket Médio"] = rep["FatLiq"] / rep["Pedidos"]
+    rep["Margem Bruta (%)"] = np.where(
+        rep["FatBruto"] > 0,
+        100 * (rep["FatBruto"] - rep["CustoTotal"]) / rep["FatBruto"],
+        np.nan
+    )
+    rep["Margem Líquida (%)"] = np.where(
+        rep["FatLiq"] > 0,
+        100 * (rep["FatLiq"] - rep["CustoTotal"]) / rep["FatLiq"],
+        np.nan
+    )
+    rep["% Impostos"] = rep["Impostos"] / rep["FatBruto"] * 100
+    return rep
+
+
+@instrumentado()
+def ranking_ufs(df_f):
+    geo = _agregar(df_f, "UF", {
+        "FatLiq": ("Faturamento Líquido", "sum"),
+        "FatBruto": ("Valor Pedido R$", "sum"),
+        "Impostos": ("Imposto Total", "sum"),
+        "Pedidos": ("Pedido", "nunique"),
+        "Clientes": ("Nome Cliente", "nunique"),
+        "Custo": ("Custo Total", "sum"),
+        "Itens": ("Quant. Pedidos", "sum"),
+    })
+
+    geo["Margem (%)"] = np.where(
+        geo["FatBruto"] > 0,
+        100 * (geo["FatBruto"] - geo["Custo"]) / geo["FatBruto"],
+        np.nan
+    )
+    geo["Ticket Médio"] = np.where(geo["Pedidos"] > 0, geo["FatLiq"] / geo["Pedidos"], np.nan)
+    geo["% Part"] = geo["FatLiq"] / geo["FatLiq"].sum() * 100 if geo["FatLiq"].sum() > 0 else 0
+    return geo
+
+
+@instrumentado()
+def ranking_skus(df_f):
+    sku = _agregar(df_f, "ITEM", {
+        "FatLiq": ("Faturamento Líquido", "sum"),
+        "FatBruto": ("Valor Pedido R$", "sum"),
+        "Custo": ("Custo Total", "sum"),
+        "Lucro": ("Lucro Bruto", "sum"),
+        "Impostos": ("Imposto Total", "sum"),
+        "Pedidos": ("Pedido", "nunique"),
+        "Unidades": ("Quant. Pedidos", "sum"),
+    })
+
+    sku["Margem (%)"] = np.where(sku["FatBruto"] > 0, 100 * sku["Lucro"] / sku["FatBruto"], np.nan)
+    sku["Margem Líquida (%)"] = np.where(
+        sku["FatLiq"] > 0,
+        100 * (sku["Lucro"] - sku["Impostos"]) / sku["FatLiq"],
+        np.nan
+    )
+    sku["Ticket Médio"] = np.where(sku["Pedidos"] > 0, sku["FatLiq"] / sku["Pedidos"], 0)
+    sku["% Part"] = sku["FatLiq"] / sku["FatLiq"].sum() * 100
+    return sku
+
+
+# Cortes da curva ABC: % acumulado da métrica coberto pelas classes A e B
+CORTES_ABC = {"A": 80.0, "B": 95.0}
+
+
+def curva_abc(ranking, metrica="FatLiq", cortes=None):
+    """
+    Ranking ordenado com % do total, % acumulado e classe ABC da métrica.
+
+    Um item é A enquanto o acumulado antes dele não passa do corte de A (o
+    item que cruza o corte ainda é A); o mesmo vale para B; o resto é C.
+    Os cortes precisam ser 0 < A < B <= 100 (ValueError caso contrário).
+    """
+    cortes = {**CORTES_ABC, **(cortes or {})}
+    try:
+        cortes = {classe: float(cortes[classe]) for classe in CORTES_ABC}
+    except (TypeError, ValueError):
+        raise ValueError("cortes A e B devem ser números")
+    if not 0 < cortes["A"] < cortes["B"] <= 100:
+        raise ValueError("cortes devem satisfazer 0 < A < B <= 100")
+    valores = ranking[metrica].to_numpy(dtype=float)
+    ordem = np.argsort(-valores, kind="stable")
+
+    total = np.nansum(valores)
+    part = valores[ordem] / total * 100 if total > 0 else np.zeros(len(valores))
+    acum = np.cumsum(part)
+    antes = acum - part
+
+    return ranking.take(ordem).assign(**{
+        "% do Total": part,
+        "% Acum": acum,
+        "Classe ABC": np.select([antes < cortes["A"], antes < cortes["B"]], ["A", "B"], "C"),
+    })
+
+
+@instrumentado()
+def pareto(df_f, dimensao, coluna="Faturamento Líquido", funcao="sum", cortes=None):
+    """Curva ABC de qualquer dimensão × métrica direto do recorte (pandas ou Parquet)"""
+    ranking = _agregar(df_f, dimensao, {coluna: (coluna, funcao)})
+    return curva_abc(ranking, coluna, cortes)
+
+
+def resumo_abc(curva, metrica="FatLiq"):
+    """Quantidade e participação na métrica de cada classe da curva ABC"""
+    resumo = (
+        curva.groupby("Classe ABC")
+        .agg(**{
+            "Qtd": ("Classe ABC", "size"),
+            metrica: (metrica, "sum"),
+            f"% {metrica}": ("% do Total", "sum"),
+        })
+        .reindex(["A", "B", "C"], fill_value=0)
+        .reset_index()
+    )
+    resumo.insert(2, "% Qtd", resumo["Qtd"] / max(len(curva), 1) * 100)
+    return resumo
+
+
+# -------------------------------------------------------------
+# CLIENTES NOVOS / PERDIDOS
+# -------------------------------------------------------------
+@instrumentado()
+def clientes_novos_perdidos(df, df_f, meses=12):
+    """Clientes novos e perdidos frente aos `meses` anteriores ao período"""
+    data_ini = df_f["Data / Mês"].min()
+    hist = df[
+        (df["Data / Mês"] >= data_ini - pd.DateOffset(months=meses)) &
+        (df["Data / Mês"] < data_ini)
+    ]
+
+    atuais = set(df_f["Nome Cliente"].unique())
+    anteriores = set(hist["Nome Cliente"].unique())
+    return sorted(atuais - anteriores), sorted(anteriores - atuais)
+
+
+@instrumentado()
+def clientes_novos_nao_atendidos_por_rep(df, df_f):
+    """
+    Listas de clientes novos e não atendidos por representante.
+
+    Compara os pares distintos (representante, cliente) do histórico e do
+    período com anti-joins, em vez de conjuntos Python linha a linha.
+    """
+    cols = ["Representante", "Nome Cliente"]
+    hist = historico_anterior(df, df_f)[cols].dropna().drop_duplicates()
+    atual = df_f[cols].dropna().drop_duplicates()
+
+    pares = hist.merge(atual, on=cols, how="outer", indicator=True)
+    novos = pares[pares["_merge"] == "right_only"]
+    nao = pares[pares["_merge"] == "left_only"]
+
+    reps = pd.Index(pares["Representante"].unique(), name="Representante")
+    out = pd.DataFrame(index=reps)
+    out["ClientesNovos"] = novos.groupby("Representante")["Nome Cliente"].agg(list)
+    out["ClientesNaoAtendidos"] = nao.groupby("Representante")["Nome Cliente"].agg(list)
+    for col in ["ClientesNovos", "ClientesNaoAtendidos"]:
+        out[col] = out[col].apply(lambda x: x if isinstance(x, list) else [])
+    out["QtdClientesNovos"] = out["ClientesNovos"].str.len().astype(int)
+    out["QtdClientesNaoAtendidos"] = out["ClientesNaoAtendidos"].str.len().astype(int)
+    return out
+
+
+@instrumentado()
+def ranking_representantes_completo(df, df_f):
+    """Ranking de representantes com as listas de clientes novos/não atendidos"""
+    rep = ranking_representantes(df_f).merge(
+        clientes_novos_nao_atendidos_por_rep(df, df_f),
+        left_on="Representante",
+        right_index=True,
+        how="left"
+    )
+    rep["ClientesNovos"] = rep["ClientesNovos"].apply(lambda x: x if isinstance(x, list) else [])
+    rep["ClientesNaoAtendidos"] = rep["ClientesNaoAtendidos"].apply(lambda x: x if isinstance(x, list) else [])
+    rep["QtdClientesNovos"] = rep["QtdClientesNovos"].fillna(0).astype(int)
+    rep["QtdClientesNaoAtendidos"] = rep["QtdClientesNaoAtendidos"].fillna(0).astype(int)
+    return rep
+
+
+# -------------------------------------------------------------
+# PRODUTOS
+# -------------------------------------------------------------
+def faturamento_por(df_sel, coluna):
+    """Faturamento líquido do recorte por coluna, do maior para o menor"""
+    return (
+        df_sel.groupby(coluna, as_index=False)["Faturamento Líquido"]
+        .sum()
+        .sort_values("Faturamento Líquido", ascending=False)
+    )
+
+
+def top_faturamento(df_sel, coluna, k, rotulo="Faturamento Líquido"):
+    """Top k de `coluna` por faturamento líquido no recorte, com participação"""
+    agg = df_sel.groupby(coluna, as_index=False).agg(**{rotulo: ("Faturamento Líquido", "sum")})
+    return top_k_por_grupo(agg, None, rotulo, k=k)
+
+
+# -------------------------------------------------------------
+# IMPOSTOS
+# -------------------------------------------------------------
+# Componentes somados em "Imposto Total"; a ingestão os guarda como uma
+# matriz float32 contígua (um único bloco no DataFrame)
+COMPONENTES_IMPOSTO = [
+    "cofins", "pis", "ipi", "icms", "ipiReturned-T", "icmsSt", "ipi-T",
+    "aproxtribFed", "aproxtribState", "cofinsDeson", "pisDeson",
+    "icmsDeson", "icmsStFCP", "icmsDifaRemet", "icmsDifaDest",
+    "icmsDifaFCP",
+]
+
+IMPOSTOS_PAINEL_SKU = ["cofins", "pis", "ipi", "icms", "aproxtribFed", "aproxtribState"]
+
+# Dimensões da análise tributária: rótulo -> coluna da base
+DIMENSOES_IMPOSTO = {"UF": "UF", "SKU": "ITEM", "Cliente": "Nome Cliente", "Mês": "Ano-Mes"}
+
+
+def matriz_impostos(df):
+    """Componentes de imposto do recorte como matriz linhas × componentes (float32)"""
+    return df[COMPONENTES_IMPOSTO].to_numpy(dtype=np.float32)
+
+
+@instrumentado()
+def analise_tributaria(df_f, dimensoes=None):
+    """
+    Carga tributária por dimensão numa passada sobre a matriz de impostos.
+
+    Para cada dimensão (padrão: UF, SKU, cliente e mês) devolve uma tabela
+    com Linhas, FatBruto, Impostos, Alíquota Efetiva (%) e o valor de cada
+    componente, ordenada pelos impostos. A matriz é extraída uma vez; cada
+    dimensão custa uma fatoração da chave e somas por grupo em float64.
+    """
+    dimensoes = DIMENSOES_IMPOSTO if dimensoes is None else dimensoes
+    if not isinstance(df_f, pd.DataFrame):
+        return _analise_tributaria_parquet(df_f, dimensoes)
+
+    matriz = matriz_impostos(df_f)
+    bruto = df_f["Valor Pedido R$"].to_numpy(dtype=float)
+
+    tabelas = {}
+    for nome, coluna in dimensoes.items():
+        codigos, chaves = pd.factorize(df_f[coluna], sort=True)
+        validos = codigos >= 0
+        codigos, n = codigos[validos], len(chaves)
+        comp = matriz[validos] if not validos.all() else matriz
+
+        somas = np.zeros((n, len(COMPONENTES_IMPOSTO)))
+        for j in range(len(COMPONENTES_IMPOSTO)):
+            somas[:, j] = np.bincount(codigos, weights=comp[:, j], minlength=n)
+        fat_bruto = np.bincount(codigos, weights=np.nan_to_num(bruto[validos]), minlength=n)
+        tabelas[nome] = _tabela_tributaria(coluna, chaves, np.bincount(codigos, minlength=n), fat_bruto, somas)
+    return tabelas
+
+
+def _analise_tributaria_parquet(visao, dimensoes):
+    """analise_tributaria com as somas por dimensão feitas no DuckDB"""
+    colunas = {c: (c, "sum") for c in COMPONENTES_IMPOSTO}
+    tabelas = {}
+    for nome, coluna in dimensoes.items():
+        tot = _agregar(visao, coluna, {"Linhas": (coluna, "size"), "FatBruto": ("Valor Pedido R$", "sum"), **colunas})
+        tabelas[nome] = _tabela_tributaria(
+            coluna, tot[coluna].to_numpy(), tot["Linhas"].to_numpy(),
+            tot["FatBruto"].to_numpy(dtype=float), tot[COMPONENTES_IMPOSTO].to_numpy(dtype=float),
+        )
+    return tabelas
+
+
+def _tabela_tributaria(coluna, chaves, linhas, fat_bruto, somas):
+    """Tabela de uma dimensão da análise tributária a partir das somas por grupo"""
+    impostos = somas.sum(axis=1)
+
+    tab = pd.DataFrame(somas, columns=COMPONENTES_IMPOSTO)
+    tab.insert(0, coluna, chaves)
+    tab.insert(1, "Linhas", linhas)
+    tab.insert(2, "FatBruto", fat_bruto)
+    tab.insert(3, "Impostos", impostos)
+    tab.insert(4, "Alíquota Efetiva (%)", np.where(
+        fat_bruto > 0, 100 * impostos / np.where(fat_bruto > 0, fat_bruto, 1), np.nan
+    ))
+    return tab.sort_values("Impostos", ascending=False, ignore_index=True)
+
+
+def composicao_tributaria(tabela, coluna, chave):
+    """Principais impostos de uma entrada da análise tributária (painel do SKU)"""
+    linha = tabela.loc[tabela[coluna] == chave, IMPOSTOS_PAINEL_SKU + ["Impostos"]]
+    valores = linha.sum() if len(linha) else pd.Series(0.0, index=linha.columns)
+    tax = valores.rename({"Impostos": "Imposto Total"}).reset_index()
+    tax.columns = ["Imposto", "Valor"]
+    return tax
+
+
+@instrumentado()
+def desvios_tributarios(tabela, coluna, limite_z=3.5, min_linhas=5):
+    """
+    Entradas (SKUs, UFs...) com alíquota efetiva fora do padrão dos pares.
+
+    Desvio robusto (mediana/MAD) da alíquota de cada entrada da tabela de
+    analise_tributaria contra as demais; entradas com menos de min_linhas
+    linhas ou sem faturamento ficam fora da comparação.
+    """
+    base = tabela[(tabela["Linhas"] >= min_linhas) & (tabela["FatBruto"] > 0)]
+    aliquota = base["Alíquota Efetiva (%)"]
+    desvio = desvio_robusto(aliquota, pd.Series(0, index=base.index), min_obs=min_linhas)
+
+    out = base[[coluna, "Linhas", "FatBruto", "Impostos", "Alíquota Efetiva (%)"]].assign(**{
+        "Alíquota Mediana (%)": aliquota.median(),
+        "Desvio (z)": desvio,
+    })
+    out = out[out["Desvio (z)"].abs() > limite_z]
+    return out.reindex(out["Desvio (z)"].abs().sort_values(ascending=False).index)
+
+
+# -------------------------------------------------------------
+# ATRASOS / LEAD TIME
+# -------------------------------------------------------------
+# Dimensões da aba de atrasos (tendência mensal, UF e representante)
+DIMENSOES_ATRASO = ["AnoMes Pedido", "UF", "Representante"]
+
+
+def _distintos_por_grupo(codigos, n, pedidos, n_pedidos):
+    """Pedidos distintos por grupo: pares (grupo, pedido) únicos contados por grupo"""
+    validos = (codigos >= 0) & (pedidos >= 0)
+    pares = pd.unique(codigos[validos].astype(np.int64) * n_pedidos + pedidos[validos])
+    return np.bincount(pares // max(n_pedidos, 1), minlength=n)
+
+
+def _tabela_atraso(codigos, n, pedidos, n_pedidos, atrasado, pesos):
+    # Grupo -1 (chave nula) vai para o bin 0, descartado no fim
+    bins = codigos + 1
+
+    def soma(p=None):
+        return np.bincount(bins, weights=p, minlength=n + 1)[1:]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({
+            "Atrasados": _distintos_por_grupo(np.where(atrasado, codigos, -1), n, pedidos, n_pedidos),
+            "Total": _distintos_por_grupo(codigos, n, pedidos, n_pedidos),
+            "Linhas": soma(),
+            "Fat. Atrasado": soma(pesos["fat_atrasado"]),
+            "Lead Time Médio": soma(pesos["lead"]) / soma(pesos["com_lead"]),
+            "Lead Time Médio Atrasados": soma(pesos["lead_atrasado"]) / soma(pesos["com_lead_atrasado"]),
+        })
+
+
+@instrumentado()
+def metricas_atraso(base, dimensoes=()):
+    """
+    Métricas de atraso do recorte e de cada dimensão pedida.
+
+    Pedidos atrasados e totais (distintos), faturamento dos atrasos e lead
+    time médio (geral e dos atrasados) saem de uma passada vetorizada por
+    dimensão (fatoração da chave + somas por grupo) sobre o AtrasadoFlag
+    booleano da ingestão. Devolve {"geral": KPIs, dimensão: tabela com % Atraso}.
+    Com uma visão Parquet, as mesmas métricas saem de agregações no DuckDB.
+    """
+    if not isinstance(base, pd.DataFrame):
+        return _metricas_atraso_parquet(base, dimensoes)
+
+    pedidos, unicos = pd.factorize(base["Pedido"])
+    atrasado = base["AtrasadoFlag"].fillna(False).to_numpy(dtype=bool)
+    lead = base["LeadTime (dias)"].to_numpy(dtype=float)
+    com_lead = ~np.isnan(lead)
+
+    # Pesos das somas por grupo, montados uma vez para todas as dimensões
+    pesos = {
+        "fat_atrasado": np.nan_to_num(base["Faturamento Líquido"].to_numpy(dtype=float)) * atrasado,
+        "lead": np.nan_to_num(lead),
+        "com_lead": com_lead.astype(float),
+        "lead_atrasado": np.nan_to_num(lead) * atrasado,
+        "com_lead_atrasado": (com_lead & atrasado).astype(float),
+    }
+    args = (pedidos, len(unicos), atrasado, pesos)
+
+    g = _tabela_atraso(np.zeros(len(base), dtype=np.int64), 1, *args).iloc[0]
+
+    resultado = {"geral": _kpis_atraso(g)}
+    for dimensao in dimensoes:
+        codigos, chaves = pd.factorize(base[dimensao], sort=True)
+        tab = _tabela_atraso(codigos, len(chaves), *args)
+        tab.insert(0, dimensao, chaves)
+        tab["% Atraso"] = 100 * tab["Atrasados"] / tab["Total"]
+        resultado[dimensao] = tab
+    return resultado
+
+
+def _kpis_atraso(g):
+    """KPIs gerais a partir da linha de totais da tabela de atraso"""
+    total_ped = int(g["Total"])
+    return {
+        "total_pedidos": total_ped,
+        "perc_atraso": g["Atrasados"] / total_ped * 100 if total_ped > 0 else 0,
+        "atraso_medio": g["Lead Time Médio Atrasados"],
+        "leadtime_medio": g["Lead Time Médio"],
+        "impacto_financeiro": g["Fat. Atrasado"],
+    }
+
+
+# Agregações da tabela de atraso: todas as linhas e só as atrasadas (base Parquet)
+_ATRASO_TOTAL = {
+    "Total": ("Pedido", "nunique"),
+    "Linhas": ("Pedido", "size"),
+    "Lead Time Médio": ("LeadTime (dias)", "mean"),
+}
+_ATRASO_ATRASADOS = {
+    "Atrasados": ("Pedido", "nunique"),
+    "Fat. Atrasado": ("Faturamento Líquido", "sum"),
+    "Lead Time Médio Atrasados": ("LeadTime (dias)", "mean"),
+}
+COLUNAS_TABELA_ATRASO = [
+    "Atrasados", "Total", "Linhas", "Fat. Atrasado", "Lead Time Médio", "Lead Time Médio Atrasados",
+]
+
+
+def _metricas_atraso_parquet(visao, dimensoes):
+    """metricas_atraso sobre uma visão Parquet: totais e atrasados em agregações separadas"""
+    atrasados = visao.onde("AtrasadoFlag")
+    g = pd.concat([
+        _agregar(visao, None, _ATRASO_TOTAL).iloc[0],
+        _agregar(atrasados, None, _ATRASO_ATRASADOS).iloc[0],
+    ])
+
+    resultado = {"geral": _kpis_atraso(g)}
+    for dimensao in dimensoes:
+        tab = _agregar(visao, dimensao, _ATRASO_TOTAL).merge(
+            _agregar(atrasados, dimensao, _ATRASO_ATRASADOS), on=dimensao, how="left"
+        )
+        tab["Atrasados"] = tab["Atrasados"].fillna(0).astype(int)
+        tab["Fat. Atrasado"] = tab["Fat. Atrasado"].fillna(0.0)
+        tab = tab[[dimensao] + COLUNAS_TABELA_ATRASO]
+        tab["% Atraso"] = 100 * tab["Atrasados"] / tab["Total"]
+        resultado[dimensao] = tab
+    return resultado
+
+
+def kpis_atraso(base):
+    """KPIs da aba de atrasos (lead time e mês do pedido vêm da ingestão)"""
+    return metricas_atraso(base)["geral"]
+
+
+def atraso_por(base, dimensao):
+    """% de atraso por dimensão (AnoMes Pedido, UF, Representante)"""
+    return metricas_atraso(base, [dimensao])[dimensao]
+
+
+# Quantis de lead time da aba de atrasos e quebras disponíveis
+QUANTIS_LEADTIME = {"p50": 0.50, "p90": 0.90, "p99": 0.99}
+QUEBRAS_LEADTIME = {"UF": "UF", "Representante": "Representante", "Mês do pedido": "AnoMes Pedido"}
+
+
+def histogramas_leadtime(df):
+    """
+    Sketch mergeável do lead time: linhas por (célula de filtro/quebra, dias).
+
+    O lead time é inteiro (dias), então o histograma de contagens é exato e
+    recortes se juntam somando contagens. Feito uma vez por versão da base;
+    percentis e SLA de qualquer filtro e quebra saem da soma das células em
+    vez de ordenar as linhas.
+    """
+    dims = ["Data / Mês", coluna_transacao(df), "AnoMes Pedido"] + [c for c in COLUNAS_FILTRO.values() if c in df.columns]
+    com_lead = df[df["LeadTime (dias)"].notna()]
+    return (
+        com_lead.groupby(dims + ["LeadTime (dias)"], dropna=False)
+        .size()
+        .reset_index(name="Linhas")
+    )
+
+
+def mesclar_histogramas(hist, filtros, por=None, base=None):
+    """
+    Histograma do lead time do recorte, por grupo de `por` (ou geral).
+
+    Com filtro de texto (cliente/item) as células não servem: as contagens
+    saem das linhas de `base` filtradas.
+    """
+    chaves = ([por] if por else []) + ["LeadTime (dias)"]
+    if base is not None and any((filtros.get(k) or "").strip() for k in FILTROS_TEXTO):
+        recorte = aplicar_filtros(base, filtros)
+        return recorte[recorte["LeadTime (dias)"].notna()].groupby(chaves).size().reset_index(name="Linhas")
+
+    celulas = aplicar_filtros(hist, {k: v for k, v in filtros.items() if k not in FILTROS_TEXTO})
+    return celulas.groupby(chaves, as_index=False)["Linhas"].sum()
+
+
+@instrumentado()
+def percentis_leadtime(hist, filtros, por=None, sla=None, base=None, quantis=None):
+    """
+    p50/p90/p99 do lead time e % de linhas dentro do SLA, por grupo de `por`.
+
+    O quantil q é o menor lead time que cobre ao menos a fração q das linhas,
+    lido do histograma acumulado de cada grupo. Sem `por`, devolve uma Series
+    com os números do recorte inteiro.
+    """
+    quantis = QUANTIS_LEADTIME if quantis is None else quantis
+    chave = por or "Recorte"
+    h = mesclar_histogramas(hist, filtros, por, base)
+    if not por:
+        h[chave] = "Total"
+
+    # O groupby da mescla já deixa as células ordenadas por (grupo, dias)
+    grupos = h.groupby(chave, sort=False)["Linhas"]
+    fracao = grupos.cumsum() / grupos.transform("sum")
+
+    out = grupos.sum().rename("Linhas").to_frame()
+    for nome, q in quantis.items():
+        out[nome] = h[fracao >= q].groupby(chave, sort=False)["LeadTime (dias)"].first()
+    if sla is not None:
+        no_sla = h["Linhas"].where(h["LeadTime (dias)"] <= sla, 0).groupby(h[chave], sort=False).sum()
+        out["% no SLA"] = 100 * no_sla / out["Linhas"]
+
+    if not por:
+        return out.iloc[0] if len(out) else pd.Series(np.nan, index=out.columns)
+    return out.reset_index()
+
+
+def pedidos_fora_da_curva(base, limites, por=None):
+    """
+    Linhas com lead time acima do limite do seu grupo.
+
+    limites: Series grupo -> dias (ex.: p99 por UF de percentis_leadtime) com
+    `por` indicando a coluna do grupo, ou um número único sem `por`.
+    """
+    limite = base[por].map(limites) if por else pd.Series(limites, index=base.index)
+    acima = base["LeadTime (dias)"] > limite
+    return base[acima].assign(**{"Limite (dias)": limite[acima]})
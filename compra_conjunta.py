@@ -0,0 +1,86 @@
+import pandas as pd
+import numpy as np
+from scipy import sparse
+
+# -------------------------------------------------------------
+# ÍNDICE DE COMPRA CONJUNTA (CLIENTE × SKU)
+# -------------------------------------------------------------
+
+class IndiceCompraConjunta:
+    """
+    Índice item-item sobre a matriz esparsa cliente × SKU, construído uma vez.
+
+    Guarda só a incidência (com o faturamento de cada par cliente-SKU) nas
+    duas orientações; a linha item × item de um SKU (clientes em comum e
+    faturamento cruzado) sai na consulta, somando as linhas dos clientes
+    que o compraram. Lift e cosseno usam os clientes por item. A busca por
+    SKUs relacionados termina numa seleção parcial top-k.
+    """
+
+    def __init__(self, itens, n_clientes, receita):
+        self.itens = itens
+        self.n_clientes = n_clientes
+        self.receita = receita
+        # Colunas (SKU -> clientes que o compraram) para achar os clientes do item
+        self._por_item = receita.tocsc()
+        self.clientes_por_item = np.diff(self._por_item.indptr)
+        self._posicao = pd.Index(itens)
+
+    @classmethod
+    def construir(cls, df):
+        """Monta a incidência cliente × SKU com o faturamento de cada par"""
+        base = df.dropna(subset=["Nome Cliente", "ITEM"])
+
+        cod_cli, clientes = pd.factorize(base["Nome Cliente"])
+        cod_item, itens = pd.factorize(base["ITEM"], sort=True)
+        forma = (len(clientes), len(itens))
+
+        # Faturamento por (cliente, SKU); duplicatas somadas na conversão para CSR
+        receita = sparse.coo_matrix(
+            (base["Faturamento Líquido"].fillna(0).to_numpy(dtype=float), (cod_cli, cod_item)),
+            shape=forma,
+        ).tocsr()
+        receita.sum_duplicates()
+
+        return cls(np.asarray(itens), len(clientes), receita)
+
+    def _linha_item(self, pos):
+        """Clientes em comum e faturamento cruzado do item `pos` com cada SKU"""
+        inicio, fim = self._por_item.indptr[pos], self._por_item.indptr[pos + 1]
+        compras = self.receita[self._por_item.indices[inicio:fim]]
+        n_itens = len(self.itens)
+        comuns = np.bincount(compras.indices, minlength=n_itens)
+        fat = np.bincount(compras.indices, weights=compras.data, minlength=n_itens)
+        return comuns, fat
+
+    def relacionados(self, item, k=20, ordenar_por="Clientes em Comum"):
+        """SKUs comprados pelos mesmos clientes do item, top k pela métrica escolhida"""
+        colunas = ["SKU", "Clientes em Comum", "Lift", "Cosseno", "Faturamento Relacionado"]
+
+        pos = self._posicao.get_indexer([item])[0]
+        if pos < 0:
+            return pd.DataFrame(columns=colunas)
+
+        comuns, fat = self._linha_item(pos)
+        vizinhos = np.flatnonzero(comuns)
+        vizinhos = vizinhos[vizinhos != pos]
+        comuns = comuns[vizinhos]
+
+        n_i = self.clientes_por_item[pos]
+        n_j = self.clientes_por_item[vizinhos]
+
+        rel = pd.DataFrame({
+            "SKU": self.itens[vizinhos],
+            "Clientes em Comum": comuns,
+            "Lift": comuns * self.n_clientes / (n_i * n_j),
+            "Cosseno": comuns / np.sqrt(n_i * n_j),
+            # Faturamento do SKU j entre os clientes que compraram o item
+            "Faturamento Relacionado": fat[vizinhos],
+        })
+
+        chave = rel[ordenar_por].to_numpy(dtype=float)
+        if len(rel) > k:
+            sel = np.argpartition(-chave, k - 1)[:k]
+            rel, chave = rel.iloc[sel], chave[sel]
+
+        return rel.iloc[np.argsort(-chave, kind="stable")].reset_index(drop=True)
@@ -0,0 +1,234 @@
+"""
+Base histórica em Parquet particionado (Ano/Mes) consultada via DuckDB.
+
+Para históricos que não cabem confortavelmente em um DataFrame por
+processo: a base tratada é gravada uma vez em Parquet particionado e as
+consultas (filtros da sidebar + agregações) rodam no DuckDB, que só lê as
+partições e colunas necessárias. A memória fica limitada pelo
+`memory_limit` do DuckDB e pelo tamanho dos resultados agregados.
+
+calculos_comerciais reconhece BaseParquet/VisaoParquet: aplicar_filtros,
+KPIs, rankings, séries mensais, atrasos e tributos usam este backend sem
+mudar a chamada. No DASH.py, BRASFORMA_PASTA_PARQUET apontando para a pasta
+exportada habilita o modo "Base Parquet (DuckDB)" na sidebar.
+
+Uso:
+    python consulta_parquet.py "Dashboard - Comite Semanal - Brasforma IA (1).xlsx" base_parquet
+"""
+
+import os
+import threading
+
+import pandas as pd
+import duckdb
+
+from pipeline_brasforma import load_brasforma, tabela_arrow
+
+FUNCOES_SQL = {
+    "sum": "COALESCE(SUM({c}), 0)",
+    "nunique": "COUNT(DISTINCT {c})",
+    "mean": "AVG({c})",
+    "min": "MIN({c})",
+    "max": "MAX({c})",
+    "count": "COUNT({c})",
+    "size": "COUNT(*)",
+}
+
+COLUNAS_LISTA = {
+    "transacao": "Transação",
+    "regional": "Regional",
+    "representante": "Representante",
+    "uf": "UF",
+    "status": "Status de Produção / Faturamento",
+}
+
+
+def _q(coluna):
+    """Identificador SQL entre aspas (colunas com espaço, acento e barra)"""
+    return '"' + coluna.replace('"', '""') + '"'
+
+
+# -------------------------------------------------------------
+# EXPORTAÇÃO
+# -------------------------------------------------------------
+# Arquivo que marca a pasta como exportação desta base (pode ser sobrescrita)
+MARCADOR_EXPORTACAO = "_BASE_BRASFORMA"
+
+
+def exportar_parquet(df, pasta):
+    """
+    Grava a base tratada em `pasta`, particionada em Ano=/Mes=.
+
+    Uma exportação anterior na mesma pasta é substituída por inteiro; uma
+    pasta com outro conteúdo (sem o marcador de exportação) é recusada
+    com ValueError em vez de ser apagada.
+    """
+    if os.path.isdir(pasta) and os.listdir(pasta) \
+            and not os.path.exists(os.path.join(pasta, MARCADOR_EXPORTACAO)):
+        raise ValueError(f"{pasta} não está vazia e não é uma exportação da base; escolha outra pasta")
+
+    con = duckdb.connect()
+    con.register("tabela", tabela_arrow(df))
+    con.execute(f"""
+        COPY (
+            SELECT * REPLACE (CAST(Ano AS INTEGER) AS Ano, CAST(Mes AS INTEGER) AS Mes)
+            FROM tabela
+        ) TO '{pasta.replace("'", "''")}'
+        (FORMAT PARQUET, PARTITION_BY (Ano, Mes), OVERWRITE)
+    """)
+    con.close()
+    with open(os.path.join(pasta, MARCADOR_EXPORTACAO), "w", encoding="utf-8") as f:
+        f.write(f"{len(df)} linhas\n")
+    return pasta
+
+
+# -------------------------------------------------------------
+# BASE E VISÕES
+# -------------------------------------------------------------
+class BaseParquet:
+    """
+    Conexão DuckDB sobre a pasta Parquet particionada.
+
+    Cada consulta usa um cursor próprio, então a mesma base atende várias
+    threads (sessões, API) ao mesmo tempo.
+    """
+
+    def __init__(self, pasta, memoria="1GB", threads=None):
+        self.pasta = pasta
+        self._con = duckdb.connect()
+        self._con.execute(f"SET memory_limit = '{memoria}'")
+        if threads:
+            self._con.execute(f"SET threads = {int(threads)}")
+        origem = os.path.join(pasta, "**", "*.parquet").replace("'", "''")
+        self.origem = f"read_parquet('{origem}', hive_partitioning = true)"
+        self._trava = threading.Lock()
+        self.colunas = [d[0] for d in self._consultar(f"DESCRIBE SELECT * FROM {self.origem}").fetchall()]
+
+    @classmethod
+    def do_excel(cls, path, pasta, sheet="BD DASH", **kwargs):
+        exportar_parquet(load_brasforma(path, sheet), pasta)
+        return cls(pasta, **kwargs)
+
+    @property
+    def columns(self):
+        """Colunas da base, como em DataFrame.columns (calculos_comerciais não distingue o backend)"""
+        return pd.Index(self.colunas)
+
+    def _consultar(self, sql, parametros=()):
+        with self._trava:
+            cursor = self._con.cursor()
+        return cursor.execute(sql, list(parametros))
+
+    def visao(self, filtros=None):
+        """Visão filtrada no formato de calculos_comerciais.aplicar_filtros"""
+        filtros = filtros or {}
+        condicoes, parametros = [], []
+
+        periodo = filtros.get("periodo")
+        if periodo:
+            ini, fim = pd.to_datetime(periodo[0]), pd.to_datetime(periodo[1])
+            # Predicados nas colunas de partição: o DuckDB nem abre os meses fora do período
+            condicoes += [
+                "Ano BETWEEN ? AND ?",
+                "Ano * 100 + Mes BETWEEN ? AND ?",
+                f"{_q('Data / Mês')} BETWEEN ? AND ?",
+            ]
+            parametros += [
+                ini.year, fim.year,
+                ini.year * 100 + ini.month, fim.year * 100 + fim.month,
+                ini.to_pydatetime(), fim.to_pydatetime(),
+            ]
+
+        for chave, coluna in COLUNAS_LISTA.items():
+            valores = filtros.get(chave)
+            if valores and coluna in self.colunas:
+                condicoes.append(f"{_q(coluna)} IN ({', '.join('?' * len(valores))})")
+                parametros += list(valores)
+
+        for chave, coluna in [("cliente", "Nome Cliente"), ("item", "ITEM")]:
+            texto = (filtros.get(chave) or "").strip()
+            if texto and coluna in self.colunas:
+                condicoes.append(f"contains(lower(CAST({_q(coluna)} AS VARCHAR)), ?)")
+                parametros.append(texto.lower())
+
+        return VisaoParquet(self, condicoes, parametros)
+
+    def linhas(self):
+        return self.visao().linhas()
+
+    def to_pandas(self, colunas=None):
+        return self.visao().to_pandas(colunas)
+
+
+class VisaoParquet:
+    """Recorte lazy da base: WHERE + parâmetros, materializado só por agregações"""
+
+    def __init__(self, base, condicoes, parametros):
+        self.base = base
+        self.condicoes = list(condicoes)
+        self.parametros = list(parametros)
+
+    def _where(self):
+        return ("WHERE " + " AND ".join(self.condicoes)) if self.condicoes else ""
+
+    def agregar(self, chave, colunas):
+        """Mesma especificação de calculos_comerciais._agregar, executada no DuckDB"""
+        exprs = [
+            f"{FUNCOES_SQL[func].format(c=_q(col))} AS {_q(nome)}"
+            for nome, (col, func) in colunas.items()
+        ]
+        if chave is None:
+            sql = f"SELECT {', '.join(exprs)} FROM {self.base.origem} {self._where()}"
+            return self.base._consultar(sql, self.parametros).df()
+
+        # Como no groupby do pandas: chaves nulas fora, resultado ordenado pela chave
+        condicoes = self.condicoes + [f"{_q(chave)} IS NOT NULL"]
+        sql = (
+            f"SELECT {_q(chave)}, {', '.join(exprs)} FROM {self.base.origem} "
+            f"WHERE {' AND '.join(condicoes)} GROUP BY 1 ORDER BY 1"
+        )
+        return self.base._consultar(sql, self.parametros).df()
+
+    def onde(self, coluna):
+        """Visão só com as linhas em que a coluna booleana `coluna` é verdadeira"""
+        return VisaoParquet(self.base, self.condicoes + [f"{_q(coluna)}"], self.parametros)
+
+    def anterior(self):
+        """Visão do histórico anterior ao início desta (base de comparação)"""
+        inicio = self.agregar(None, {"ini": ("Data / Mês", "min")})["ini"].iloc[0]
+        if pd.isna(inicio):
+            return VisaoParquet(self.base, ["FALSE"], [])
+        inicio = pd.Timestamp(inicio)
+        return VisaoParquet(
+            self.base,
+            ["Ano <= ?", f"{_q('Data / Mês')} < ?"],
+            [inicio.year, inicio.to_pydatetime()],
+        )
+
+    @property
+    def empty(self):
+        sql = f"SELECT 1 FROM {self.base.origem} {self._where()} LIMIT 1"
+        return self.base._consultar(sql, self.parametros).fetchone() is None
+
+    def linhas(self):
+        sql = f"SELECT COUNT(*) FROM {self.base.origem} {self._where()}"
+        return self.base._consultar(sql, self.parametros).fetchone()[0]
+
+    def to_pandas(self, colunas=None):
+        """Materializa o recorte (só as colunas pedidas) como DataFrame"""
+        sel = ", ".join(_q(c) for c in colunas) if colunas else "*"
+        sql = f"SELECT {sel} FROM {self.base.origem} {self._where()}"
+        return self.base._consultar(sql, self.parametros).df()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exporta a base Brasforma para Parquet particionado")
+    parser.add_argument("excel")
+    parser.add_argument("pasta")
+    parser.add_argument("--aba", default="BD DASH")
+    args = parser.parse_args()
+
+    exportar_parquet(load_brasforma(args.excel, args.aba), args.pasta)
+    print(f"Base gravada em {args.pasta} (particionada por Ano/Mes)")
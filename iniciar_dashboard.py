@@ -0,0 +1,40 @@
+"""
+Sobe o dashboard já aquecido.
+
+Enquanto o servidor do Streamlit inicia, uma thread importa os módulos
+pesados e carrega a planilha padrão (com seus índices) no observador do
+processo. O primeiro usuário encontra tudo pronto em vez de pagar a carga;
+se chegar antes do fim do aquecimento, espera por ele sem carregar de novo.
+
+Uso:
+    python iniciar_dashboard.py [opções do "streamlit run", ex.: --server.port 8501]
+"""
+
+import os
+import sys
+import threading
+
+from atualizador_base import ARQUIVO_PADRAO, obter_atualizador
+from instrumentacao import configurar_log, importar
+
+# Importados sob demanda pelo DASH.py (ModuloPreguicoso)
+MODULOS_PESADOS = ["plotly.express", "compra_conjunta"]
+
+
+def aquecer(path=ARQUIVO_PADRAO):
+    """Importa os módulos pesados e carrega a planilha padrão no processo"""
+    configurar_log(os.environ.get("BRASFORMA_LOG_DESEMPENHO"))
+    for nome in MODULOS_PESADOS:
+        importar(nome)
+    if os.path.exists(path):
+        obter_atualizador(path)
+
+
+if __name__ == "__main__":
+    from streamlit.web import cli
+
+    threading.Thread(target=aquecer, name="aquecimento", daemon=True).start()
+
+    dash = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DASH.py")
+    sys.argv = ["streamlit", "run", dash, *sys.argv[1:]]
+    sys.exit(cli.main())
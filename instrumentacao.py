@@ -0,0 +1,153 @@
+import importlib
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+# -------------------------------------------------------------
+# INSTRUMENTAÇÃO LEVE DOS TRECHOS QUENTES
+# -------------------------------------------------------------
+
+logger = logging.getLogger("brasforma.desempenho")
+
+# Registros da execução corrente; cada sessão do Streamlit roda em sua thread.
+# Fora de uma execução (threads da API, observador da base, lotes) as seções
+# só vão para o log: nada acumula em memória sem alguém para ler
+_local = threading.local()
+
+
+def iniciar_execucao():
+    """Zera os registros da execução (chamar no topo de cada rerun)"""
+    _local.registros = []
+    _local.profundidade = 0
+    _local.marco_aberto = None
+    return _local.registros
+
+
+def registros():
+    """Registros da execução corrente, na ordem em que as seções terminaram"""
+    return getattr(_local, "registros", [])
+
+
+def configurar_log(caminho):
+    """Grava os registros como JSON por linha em `caminho` (uma vez por processo)"""
+    if not caminho or any(getattr(h, "_brasforma", False) for h in logger.handlers):
+        return
+    handler = logging.FileHandler(caminho, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler._brasforma = True
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+def _linhas(obj):
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+@contextmanager
+def medir(secao, linhas_entrada=None):
+    """
+    Mede uma seção: tempo de parede, linhas de entrada/saída e memória.
+
+    A memória (MB líquidos alocados) só é medida com o tracemalloc ativo do
+    início ao fim da seção; se ele parar no meio, fica None. O tracemalloc
+    conta o processo inteiro: com outras sessões ou threads rodando, o
+    número inclui as alocações delas (exato só em execução isolada, como
+    no benchmark). O dicionário devolvido aceita "linhas_saida" preenchido
+    pelo chamador.
+    Só entra em registros() com uma execução iniciada por iniciar_execucao().
+    """
+    destino = getattr(_local, "registros", None)
+    nivel = getattr(_local, "profundidade", 0)
+
+    reg = {"secao": secao, "linhas_entrada": linhas_entrada, "linhas_saida": None,
+           "nivel": nivel}
+    memoria = tracemalloc.is_tracing()
+    mem_antes = tracemalloc.get_traced_memory()[0] if memoria else 0
+
+    _local.profundidade = nivel + 1
+    inicio = time.perf_counter()
+    try:
+        yield reg
+    finally:
+        reg["tempo_s"] = round(time.perf_counter() - inicio, 4)
+        reg["memoria_mb"] = (
+            round((tracemalloc.get_traced_memory()[0] - mem_antes) / 2**20, 2)
+            if memoria and tracemalloc.is_tracing() else None
+        )
+        _local.profundidade = nivel
+        if destino is not None:
+            destino.append(reg)
+        logger.info(json.dumps({"ts": time.time(), **reg}, ensure_ascii=False))
+
+
+def marco(secao, linhas_entrada=None):
+    """
+    Fecha a seção sequencial anterior e abre `secao` (para código de topo de script).
+
+    Evita reindentar blocos inteiros do DASH.py em um `with`; a última
+    seção aberta é fechada por encerrar_marcos().
+    """
+    encerrar_marcos()
+    cm = medir(secao, linhas_entrada)
+    reg = cm.__enter__()
+    _local.marco_aberto = cm
+    return reg
+
+
+def encerrar_marcos():
+    """Fecha a seção aberta por marco(), se houver"""
+    cm = getattr(_local, "marco_aberto", None)
+    _local.marco_aberto = None
+    if cm is not None:
+        cm.__exit__(None, None, None)
+
+
+def instrumentado(secao=None):
+    """Decorador: mede a função com linhas do 1º argumento e do retorno"""
+    def decorar(func):
+        nome = secao or f"{func.__module__}.{func.__name__}"
+
+        @wraps(func)
+        def envolvida(*args, **kwargs):
+            with medir(nome, _linhas(args[0]) if args else None) as reg:
+                resultado = func(*args, **kwargs)
+                reg["linhas_saida"] = _linhas(resultado)
+            return resultado
+        return envolvida
+    return decorar
+
+
+# -------------------------------------------------------------
+# IMPORTAÇÕES PREGUIÇOSAS
+# -------------------------------------------------------------
+
+# Tempo (s) da primeira importação de cada módulo pesado neste processo
+TEMPOS_IMPORTACAO = {}
+
+
+def importar(nome):
+    """import_module registrando quanto a primeira importação custou no processo"""
+    if nome in sys.modules:
+        return sys.modules[nome]
+    inicio = time.perf_counter()
+    modulo = importlib.import_module(nome)
+    TEMPOS_IMPORTACAO.setdefault(nome, round(time.perf_counter() - inicio, 4))
+    return modulo
+
+
+class ModuloPreguicoso:
+    """Proxy que só importa o módulo no primeiro acesso a um atributo"""
+
+    def __init__(self, nome):
+        self._nome = nome
+
+    def __getattr__(self, atributo):
+        return getattr(importar(self._nome), atributo)
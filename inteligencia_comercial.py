@@ -1,22 +1,53 @@
 import pandas as pd
 import numpy as np
 
+from instrumentacao import instrumentado
+
 # -------------------------------------------------------------
-# AUXILIAR
+# AUXILIARES (públicos: previsao_comercial monta as mesmas matrizes)
 # -------------------------------------------------------------
 
-def _prep(df):
-    """Prepara dados mínimos para inteligência"""
-    base = df.copy()
-    base = base.dropna(subset=["Nome Cliente", "ITEM", "Ano-Mes"])
+def linhas_validas(df):
+    """Prepara dados mínimos para inteligência (linhas com cliente, SKU e mês)"""
+    # dropna já devolve um novo frame; não é preciso copiar a base inteira antes
+    base = df.dropna(subset=["Nome Cliente", "ITEM", "Ano-Mes"])
     return base
 
 
+def matriz_mensal(base, chave, valor="Faturamento Líquido"):
+    """Monta a matriz chave × mês (meses contínuos, zero onde não houve venda)"""
+    datas = base["Data / Mês"]
+    validos = datas.notna().to_numpy()
+    base = base[validos]
+    datas = datas[validos]
+
+    codigos, chaves = pd.factorize(base[chave], sort=True)
+    mes_ord = ((datas.dt.year - 1970) * 12 + datas.dt.month - 1).to_numpy(dtype=np.int64)
+
+    if len(mes_ord) == 0:
+        meses = pd.PeriodIndex([], freq="M")
+        return chaves, meses, np.zeros((len(chaves), 0))
+
+    inicio = mes_ord.min()
+    n_meses = int(mes_ord.max() - inicio + 1)
+    posicao = codigos.astype(np.int64) * n_meses + (mes_ord - inicio)
+
+    matriz = np.bincount(
+        posicao,
+        weights=base[valor].fillna(0).to_numpy(dtype=float),
+        minlength=len(chaves) * n_meses,
+    ).reshape(len(chaves), n_meses)
+
+    meses = pd.period_range(pd.Period(ordinal=int(inicio), freq="M"), periods=n_meses, freq="M")
+    return chaves, meses, matriz
+
+
 # -------------------------------------------------------------
 # (A) CLIENTES EM CRESCIMENTO
 # -------------------------------------------------------------
+@instrumentado()
 def clientes_em_crescimento(df):
-    base = _prep(df)
+    base = linhas_validas(df)
 
     grp = base.groupby(["Nome Cliente", "Ano-Mes"], as_index=False).agg(
         FatLiq=("Faturamento Líquido", "sum")
@@ -47,8 +78,9 @@ def clientes_em_crescimento(df):
 # -------------------------------------------------------------
 # (B) CLIENTES EM QUEDA (RISCO)
 # -------------------------------------------------------------
+@instrumentado()
 def clientes_em_queda(df):
-    base = _prep(df)
+    base = linhas_validas(df)
 
     grp = base.groupby(["Nome Cliente", "Ano-Mes"], as_index=False).agg(
         FatLiq=("Faturamento Líquido", "sum")
@@ -77,27 +109,95 @@ def clientes_em_queda(df):
 # -------------------------------------------------------------
 # (C) SKUs EM TENDÊNCIA (ALTA / BAIXA)
 # -------------------------------------------------------------
-def skus_em_tendencia(df):
-    base = _prep(df)
-
-    grp = base.groupby(["ITEM", "Ano-Mes"], as_index=False).agg(
-        FatLiq=("Faturamento Líquido", "sum"),
-        Qtd=("Quant. Pedidos", "sum"),
+def _somas_janela(acumulado, janela):
+    """Faturamento dos últimos `janela` meses e dos `janela` anteriores (None sem meses para ambos)"""
+    n_meses = acumulado.shape[1] - 1
+    if janela < 1 or n_meses < 2 * janela:
+        return None
+    atual = acumulado[:, n_meses] - acumulado[:, n_meses - janela]
+    anterior = acumulado[:, n_meses - janela] - acumulado[:, n_meses - 2 * janela]
+    return atual, anterior
+
+
+def _crescimento_janela(acumulado, janela):
+    """Crescimento % dos últimos N meses contra os N meses anteriores"""
+    somas = _somas_janela(acumulado, janela)
+    if somas is None:
+        return np.full(acumulado.shape[0], np.nan)
+
+    atual, anterior = somas
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cresc = np.where(anterior > 0, (atual - anterior) / anterior * 100, np.nan)
+    return cresc
+
+
+@instrumentado()
+def skus_em_tendencia(df, janelas=(3, 6, 12), limiar=5.0):
+    """
+    Tendência de todos os SKUs a partir da matriz SKU × mês.
+
+    Para cada janela N calcula CrescNM: faturamento somado dos últimos N
+    meses contra o dos N anteriores (NaN com menos de 2·N meses). Antes,
+    Cresc3M era a média das variações mês a mês dos 3 últimos meses com
+    venda; a soma por janela não explode com um mês fraco no denominador.
+    Inclinação (regressão linear) e volatilidade usam a maior janela.
+
+    A classificação usa a primeira janela e o limiar ±%. Com período curto
+    (menos de 2·N meses) a janela da classificação encolhe para metade dos
+    meses disponíveis, sem ir abaixo de 1 mês contra 1 mês; a janela usada
+    fica em JanelaTendencia e o crescimento em CrescTendencia_%. SKU sem
+    faturamento na janela anterior e com faturamento na atual é "Alta".
+    """
+    base = linhas_validas(df)
+
+    itens, meses, fat = matriz_mensal(base, "ITEM", "Faturamento Líquido")
+    _, _, qtd = matriz_mensal(base, "ITEM", "Quant. Pedidos")
+
+    trend = pd.DataFrame({"ITEM": itens})
+
+    # Soma acumulada com coluna zero à esquerda: soma de qualquer janela em O(1)
+    acumulado = np.concatenate(
+        [np.zeros((fat.shape[0], 1)), np.cumsum(fat, axis=1)], axis=1
+    )
+    for janela in janelas:
+        trend[f"Cresc{janela}M"] = _crescimento_janela(acumulado, janela)
+
+    # Inclinação e volatilidade na maior janela disponível
+    n_reg = min(max(janelas), fat.shape[1])
+    recorte = fat[:, fat.shape[1] - n_reg:]
+    media = recorte.mean(axis=1) if n_reg > 0 else np.zeros(fat.shape[0])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if n_reg > 1:
+            x = np.arange(n_reg) - (n_reg - 1) / 2
+            inclinacao = (recorte - media[:, None]) @ x / (x @ x)
+            volat = recorte.std(axis=1, ddof=1)
+        else:
+            inclinacao = np.full(fat.shape[0], np.nan)
+            volat = np.full(fat.shape[0], np.nan)
+
+        # Inclinação em % da média mensal; volatilidade como coeficiente de variação
+        trend["Inclinacao_%"] = np.where(media > 0, inclinacao / media * 100, np.nan)
+        trend["Volatilidade_%"] = np.where(media > 0, volat / media * 100, np.nan)
+
+    trend["FatTotal"] = fat.sum(axis=1)
+    trend["QtdTotal"] = qtd.sum(axis=1)
+
+    # Janela da classificação: a primeira, encolhida ao que o período comporta
+    janela = min(janelas[0], fat.shape[1] // 2)
+    somas = _somas_janela(acumulado, janela)
+    trend["JanelaTendencia"] = janela if somas is not None else np.nan
+    trend["CrescTendencia_%"] = _crescimento_janela(acumulado, janela)
+
+    principal = trend["CrescTendencia_%"]
+    surgiu = (somas[1] == 0) & (somas[0] > 0) if somas is not None else False
+    trend["Tendencia"] = np.select(
+        [(principal > limiar) | surgiu, principal < -limiar],
+        ["Alta", "Baixa"],
+        default="Estável",
     )
 
-    grp["FatAnterior"] = grp.groupby("ITEM")["FatLiq"].shift(1)
-    grp["Variacao_%"] = (grp["FatLiq"] - grp["FatAnterior"]) / grp["FatAnterior"] * 100
-
-    trend = grp.groupby("ITEM").agg(
-        Cresc3M=("Variacao_%", lambda x: x.tail(3).mean()),
-        FatTotal=("FatLiq", "sum"),
-        QtdTotal=("Qtd", "sum")
-    ).reset_index()
-
-    trend["Tendencia"] = np.where(trend["Cresc3M"] > 5, "Alta",
-                           np.where(trend["Cresc3M"] < -5, "Baixa", "Estável"))
-
-    trend = trend.sort_values("Cresc3M", ascending=False)
+    trend = trend.sort_values("CrescTendencia_%", ascending=False)
 
     return trend
 
@@ -105,63 +205,576 @@ def skus_em_tendencia(df):
 # -------------------------------------------------------------
 # (D) CESTA POR REGIÃO (TOP SKUs por UF)
 # -------------------------------------------------------------
-def cesta_por_regiao(df):
-    base = _prep(df)
+@instrumentado()
+def top_k_por_grupo(df, grupo, valor, k=5, coluna_part="Participacao_%"):
+    """
+    Top k linhas por grupo (maior valor primeiro) com participação no grupo.
+
+    Usa seleção parcial (argpartition) em cada segmento do grupo em vez de
+    ordenar tudo: custo linear no tamanho da base. grupo=None trata o frame
+    inteiro como um único grupo.
+    """
+    n = len(df)
+    valores = df[valor].to_numpy(dtype=float)
+
+    if grupo is None:
+        codigos = np.zeros(n, dtype=np.int64)
+        n_grupos = 1 if n else 0
+    else:
+        codigos, uniques = pd.factorize(df[grupo], sort=True)
+        n_grupos = len(uniques)
+
+    validos = codigos >= 0
+    total_grupo = np.bincount(
+        codigos[validos], weights=np.nan_to_num(valores[validos]), minlength=n_grupos
+    )
+
+    # Agrupa as posições por segmento (counting sort, sem comparação)
+    contagem = np.bincount(codigos[validos], minlength=n_grupos)
+    inicio = np.concatenate([[0], np.cumsum(contagem)[:-1]]).astype(np.int64)
+    rank = pd.Series(codigos[validos]).groupby(codigos[validos]).cumcount().to_numpy()
+    ordem = np.empty(validos.sum(), dtype=np.int64)
+    ordem[inicio[codigos[validos]] + rank] = np.flatnonzero(validos)
+
+    chave = np.where(np.isnan(valores), -np.inf, valores)
+
+    selecionados = []
+    for g in range(n_grupos):
+        seg = ordem[inicio[g]:inicio[g] + contagem[g]]
+        if len(seg) > k:
+            seg = seg[np.argpartition(-chave[seg], k - 1)[:k]]
+        # Ordena só os k escolhidos
+        selecionados.append(seg[np.argsort(-chave[seg], kind="stable")])
+
+    pos = np.concatenate(selecionados) if selecionados else np.array([], dtype=np.int64)
+
+    top = df.iloc[pos].copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        top[coluna_part] = valores[pos] / total_grupo[codigos[pos]] * 100
+    return top
+
+
+@instrumentado()
+def cesta_por_regiao(df, n=5):
+    base = linhas_validas(df)
 
     grp = base.groupby(["UF", "ITEM"], as_index=False).agg(
         FatLiq=("Faturamento Líquido", "sum")
     )
 
-    total_uf = grp.groupby("UF")["FatLiq"].transform("sum")
-    grp["Participacao_%"] = grp["FatLiq"] / total_uf * 100
+    # Top n por UF
+    return top_k_por_grupo(grp, "UF", "FatLiq", k=n)
+
+
+# -------------------------------------------------------------
+# (E) DETECÇÃO DE ANOMALIAS
+# -------------------------------------------------------------
+
+# Registro das regras: Tipo -> função(base, limite_z) -> (mascara, valor, desvio)
+REGRAS_ANOMALIA = {}
+
+
+def regra_anomalia(tipo):
+    """Registra uma regra no motor de anomalias (uso como decorador)"""
+    def registrar(func):
+        REGRAS_ANOMALIA[tipo] = func
+        return func
+    return registrar
+
+
+def desvio_robusto(valores, grupos, min_obs=5):
+    """
+    Desvio robusto (mediana/MAD) de cada linha dentro do seu grupo.
+
+    Grupos com menos de min_obs linhas ou MAD zero usam a estatística
+    global, para não gerar alarmes em clientes/SKUs com pouco histórico.
+    Público: também mede os desvios tributários de calculos_comerciais.
+    """
+    valores = valores.astype(float)
+
+    mediana_g = valores.groupby(grupos).transform("median")
+    mad_g = (valores - mediana_g).abs().groupby(grupos).transform("median")
+    contagem_g = valores.groupby(grupos).transform("count")
+
+    mediana = valores.median()
+    mad = (valores - mediana).abs().median()
+
+    usa_grupo = (contagem_g >= min_obs) & (mad_g > 0)
+    centro = mediana_g.where(usa_grupo, mediana)
+    escala = (1.4826 * mad_g.where(usa_grupo, mad)).replace(0, np.nan)
+
+    return (valores - centro) / escala
+
+
+@regra_anomalia("Pedido gigante fora do padrão")
+def _regra_pedido_gigante(base, limite_z):
+    desvio = desvio_robusto(base["Valor Pedido R$"], base["Nome Cliente"])
+    return desvio > limite_z, base["Valor Pedido R$"], desvio
+
+
+@regra_anomalia("Margem extremamente alta")
+def _regra_margem_alta(base, limite_z):
+    desvio = desvio_robusto(base["Margem %"], base["ITEM"])
+    return desvio > limite_z, base["Margem %"], desvio
+
+
+@regra_anomalia("Custo negativo (erro de base)")
+def _regra_custo_negativo(base, limite_z):
+    return base["Custo Total"] < 0, base["Custo Total"], np.nan
+
+
+@regra_anomalia("Item com custo zero")
+def _regra_custo_zero(base, limite_z):
+    mascara = (base["Custo Total"] == 0) & (base["Valor Pedido R$"] > 0)
+    return mascara, base["Valor Pedido R$"], np.nan
+
+
+@regra_anomalia("Preço unitário fora do padrão do SKU")
+def _regra_preco_unitario(base, limite_z):
+    preco = base["Valor Pedido R$"] / base["Quant. Pedidos"].where(base["Quant. Pedidos"] > 0)
+    desvio = desvio_robusto(preco, base["ITEM"])
+    return desvio.abs() > limite_z, preco, desvio
+
+
+@regra_anomalia("Carga tributária fora do padrão da UF")
+def _regra_carga_tributaria(base, limite_z):
+    aliquota = 100 * base["Imposto Total"] / base["Valor Pedido R$"].where(base["Valor Pedido R$"] > 0)
+    desvio = desvio_robusto(aliquota, base["UF"])
+    return desvio.abs() > limite_z, aliquota, desvio
+
+
+@instrumentado()
+def detectar_anomalias(df, regras=None, limite_z=3.5):
+    """
+    Avalia as regras registradas como máscaras vetorizadas.
+
+    regras: lista de Tipos a rodar (padrão: todas as registradas).
+    limite_z: corte do desvio robusto (mediana/MAD por cliente, SKU ou UF).
+    """
+    regras = list(REGRAS_ANOMALIA) if regras is None else regras
+    colunas = ["Tipo", "Pedido", "Cliente", "ITEM", "Valor", "Desvio"]
+
+    partes = []
+    for tipo in regras:
+        mascara, valor, desvio = REGRAS_ANOMALIA[tipo](df, limite_z)
+        mascara = mascara.fillna(False).to_numpy(dtype=bool)
+        if not mascara.any():
+            continue
+
+        desvio = desvio[mascara].to_numpy() if isinstance(desvio, pd.Series) else desvio
+        partes.append(pd.DataFrame({
+            "Tipo": tipo,
+            "Pedido": df["Pedido"].to_numpy()[mascara],
+            "Cliente": df["Nome Cliente"].to_numpy()[mascara],
+            "ITEM": df["ITEM"].to_numpy()[mascara],
+            "Valor": valor[mascara].to_numpy(),
+            "Desvio": desvio,
+        }))
+
+    if not partes:
+        return pd.DataFrame(columns=colunas)
+
+    return pd.concat(partes, ignore_index=True)
+
+
+# -------------------------------------------------------------
+# (F) RFM – RECÊNCIA, FREQUÊNCIA E MONETÁRIO
+# -------------------------------------------------------------
+def _quintil(valores, maior_melhor=True):
+    """Nota de 1 a 5 por posição (rank), robusta a empates e poucos clientes"""
+    pct = valores.rank(method="first", pct=True, ascending=maior_melhor)
+    return np.ceil(pct * 5).clip(1, 5).astype("Int64")
+
+
+@instrumentado()
+def calcular_rfm(df, quintis=False):
+    """
+    RFM de todos os clientes em uma única passada agrupada.
+
+    A segmentação executiva é aplicada com condições vetorizadas; a mediana
+    do monetário é calculada uma vez. quintis=True adiciona as notas 1–5.
+    """
+    max_date = df["Data do Pedido"].max()
+
+    rfm = df.groupby("Nome Cliente").agg(
+        UltimaCompra=("Data do Pedido", "max"),
+        Frequencia=("Pedido", "nunique"),
+        Monetario=("Faturamento Líquido", "sum"),
+    ).reset_index()
+
+    rfm.insert(1, "Recencia", (max_date - rfm.pop("UltimaCompra")).dt.days)
+
+    r, f, m = rfm["Recencia"], rfm["Frequencia"], rfm["Monetario"]
+    mediana_m = m.median()
+
+    rfm["Segmento"] = np.select(
+        [
+            (r <= 30) & (f >= 3) & (m >= mediana_m),
+            (r <= 45) & (f >= 2),
+            (r > 60) & (f == 1),
+            r > 90,
+        ],
+        [
+            "🔥 VIP / Premium",
+            "📈 Crescentes",
+            "⚠ Clientes Oportunidade",
+            "❌ Inativos / Risco",
+        ],
+        default="🟡 Regulares",
+    )
+
+    if quintis:
+        rfm["R_Score"] = _quintil(r, maior_melhor=False)
+        rfm["F_Score"] = _quintil(f)
+        rfm["M_Score"] = _quintil(m)
+        rfm["RFM_Score"] = (
+            rfm["R_Score"].astype(str) + rfm["F_Score"].astype(str) + rfm["M_Score"].astype(str)
+        )
+
+    return rfm
+
 
-    top = grp.sort_values(["UF", "Participacao_%"], ascending=[True, False])
+@instrumentado()
+def indice_pertencimento(df, coluna):
+    """Pares distintos (cliente, valor) – ex.: cliente × Representante, cliente × UF"""
+    return df[["Nome Cliente", coluna]].dropna().drop_duplicates(ignore_index=True)
 
-    # Top 5 por UF
-    top5 = top.groupby("UF").head(5)
 
-    return top5
+@instrumentado()
+def filtrar_por_pertencimento(rfm, membros, valores):
+    """Mantém os clientes ligados a algum dos valores (semi-join no índice)"""
+    coluna = membros.columns[1]
+    clientes = membros.loc[membros[coluna].isin(valores), "Nome Cliente"].unique()
+    return rfm[rfm["Nome Cliente"].isin(clientes)]
 
 
 # -------------------------------------------------------------
-# (E) DETECÇÃO DE ANOMALIAS
+# (G) CLASSIFICAÇÃO AUTOMÁTICA DE SKUs
 # -------------------------------------------------------------
-def detectar_anomalias(df):
-    base = df.copy()
-
-    anomalies = []
-
-    # 1) Pedido fora da curva
-    q3 = base["Valor Pedido R$"].quantile(0.75)
-    lim = q3 * 2.5  # Muito acima da mediana
-    out = base[base["Valor Pedido R$"] > lim]
-
-    for _, row in out.iterrows():
-        anomalies.append({
-            "Tipo": "Pedido gigante fora do padrão",
-            "Pedido": row["Pedido"],
-            "Cliente": row["Nome Cliente"],
-            "Valor": row["Valor Pedido R$"],
-        })
-
-    # 2) Margem muito alta
-    marg_out = base[base["Margem %"] > base["Margem %"].quantile(0.99)]
-    for _, row in marg_out.iterrows():
-        anomalies.append({
-            "Tipo": "Margem extremamente alta",
-            "Pedido": row["Pedido"],
-            "Cliente": row["Nome Cliente"],
-            "Valor": row["Margem %"],
-        })
-
-    # 3) SKU com custo inadequado
-    custo_out = base[base["Custo Total"] < 0]
-    for _, row in custo_out.iterrows():
-        anomalies.append({
-            "Tipo": "Custo negativo (erro de base)",
-            "Pedido": row["Pedido"],
-            "Cliente": row["Nome Cliente"],
-            "Valor": row["Custo Total"],
-        })
-
-    return pd.DataFrame(anomalies)
+LIMITES_CLASSIFICACAO_SKU = {
+    "quantil_lider": 0.85,       # faturamento acima deste quantil ...
+    "margem_lider": 30.0,        # ... e margem acima deste % → Líder
+    "margem_critica": 15.0,      # acima da mediana e margem abaixo deste % → Crítica
+    "pedidos_baixa_relevancia": 1,
+}
+
+
+@instrumentado()
+def classificar_skus(sku, limites=None):
+    """
+    Categoria IA de cada SKU a partir do ranking (FatLiq, Margem (%), Pedidos).
+
+    Quantil e mediana são calculados uma única vez; as regras são aplicadas
+    como condições vetorizadas, na mesma ordem de prioridade.
+    """
+    lim = {**LIMITES_CLASSIFICACAO_SKU, **(limites or {})}
+
+    fat = sku["FatLiq"]
+    mg = sku["Margem (%)"]
+    ped = sku["Pedidos"]
+
+    corte_lider = fat.quantile(lim["quantil_lider"])
+    mediana = fat.median()
+
+    return pd.Series(
+        np.select(
+            [
+                (fat > corte_lider) & (mg > lim["margem_lider"]),
+                (fat > mediana) & (mg < lim["margem_critica"]),
+                (ped <= lim["pedidos_baixa_relevancia"]) & (fat < mediana),
+            ],
+            [
+                "🔥 Líder Estratégico",
+                "⚠ Volume com Margem Crítica",
+                "🛑 Baixa Relevância",
+            ],
+            default="🟡 Sustentação",
+        ),
+        index=sku.index,
+        name="Categoria IA",
+    )
+
+
+# -------------------------------------------------------------
+# (H) ALERTAS DA CARTEIRA (TODOS OS CLIENTES)
+# -------------------------------------------------------------
+LIMITES_ALERTA = {
+    "queda_pct": -30.0,            # variação contra o histórico abaixo deste %
+    "crescimento_pct": 40.0,       # variação contra o histórico acima deste %
+    "margem_critica": 10.0,        # margem bruta abaixo deste %
+    "fracao_ticket": 0.5,          # 1 pedido e faturamento < fração do ticket médio
+    "concentracao_pct": 15.0,      # participação no faturamento acima deste %
+    "dias_sem_pedido": 90,         # último pedido há mais de N dias do fim do período
+}
+
+# Ordem do ranking de alertas
+SEVERIDADES = ["Alta", "Média", "Oportunidade"]
+
+_FORMATOS_ALERTA = {
+    "pct": lambda v: f"{v:.1f}%".replace(".", ","),
+    "dias": lambda v: f"{v:.0f} dias",
+}
+
+# Registro das regras: Alerta -> (função(agregados, limites) -> (mascara, valor), severidade, mensagem, formato)
+REGRAS_ALERTA = {}
+
+
+def regra_alerta(tipo, severidade, mensagem, formato="pct"):
+    """Registra uma regra no motor de alertas (uso como decorador); `mensagem` aceita {valor}"""
+    def registrar(func):
+        REGRAS_ALERTA[tipo] = (func, severidade, mensagem, formato)
+        return func
+    return registrar
+
+
+@regra_alerta("Queda acentuada de faturamento", "Alta",
+              "📉 Queda acentuada de faturamento (**{valor}**) frente ao período anterior.")
+def _alerta_queda(ag, lim):
+    return (ag["FatAnterior"] > 0) & (ag["Var %"] < lim["queda_pct"]), ag["Var %"]
+
+
+@regra_alerta("Crescimento expressivo", "Oportunidade",
+              "📈 Crescimento expressivo de faturamento (**{valor}**). Cliente em expansão.")
+def _alerta_crescimento(ag, lim):
+    return (ag["FatAnterior"] > 0) & (ag["Var %"] > lim["crescimento_pct"]), ag["Var %"]
+
+
+@regra_alerta("Margem crítica", "Alta",
+              "🔥 Margem muito baixa. Avaliar desconto, mix e carga tributária.")
+def _alerta_margem(ag, lim):
+    return ag["Margem (%)"] < lim["margem_critica"], ag["Margem (%)"]
+
+
+@regra_alerta("Baixa frequência", "Média",
+              "⚠ Cliente com baixa frequência. Risco de churn elevado.")
+def _alerta_frequencia(ag, lim):
+    ticket_medio = ag["FatLiq"].mean()
+    mascara = (ag["Pedidos"] == 1) & (ag["FatLiq"] < ticket_medio * lim["fracao_ticket"])
+    return mascara, ag["FatLiq"]
+
+
+@regra_alerta("Concentração de faturamento", "Alta",
+              "🔴 Cliente representa **{valor}** do faturamento total. Atenção à dependência.")
+def _alerta_concentracao(ag, lim):
+    return ag["% do Total"] > lim["concentracao_pct"], ag["% do Total"]
+
+
+@regra_alerta("Sem pedidos recentes", "Média",
+              "⏰ Último pedido há **{valor}** do fim do período.", formato="dias")
+def _alerta_sem_pedido(ag, lim):
+    return ag["Dias sem Pedido"] > lim["dias_sem_pedido"], ag["Dias sem Pedido"]
+
+
+@instrumentado()
+def agregados_clientes(df, df_f):
+    """
+    Números de cada cliente do recorte numa passada agrupada.
+
+    FatAnterior soma o histórico de `df` antes do início do recorte (mesma
+    base de comparação do alerta individual do cliente).
+    """
+    ag = df_f.groupby("Nome Cliente").agg(
+        FatLiq=("Faturamento Líquido", "sum"),
+        FatBruto=("Valor Pedido R$", "sum"),
+        Lucro=("Lucro Bruto", "sum"),
+        Pedidos=("Pedido", "nunique"),
+        UltimoPedido=("Data do Pedido", "max"),
+    )
+
+    anterior = df[df["Data / Mês"] < df_f["Data / Mês"].min()]
+    ag["FatAnterior"] = (
+        anterior.groupby("Nome Cliente")["Faturamento Líquido"].sum()
+        .reindex(ag.index, fill_value=0.0)
+    )
+
+    total = ag["FatLiq"].sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ag["Var %"] = np.where(
+            ag["FatAnterior"] > 0, (ag["FatLiq"] - ag["FatAnterior"]) / ag["FatAnterior"] * 100, np.nan
+        )
+        ag["Margem (%)"] = np.where(ag["FatBruto"] > 0, ag["Lucro"] / ag["FatBruto"] * 100, 0.0)
+    ag["% do Total"] = ag["FatLiq"] / total * 100 if total > 0 else 0.0
+    ag["Dias sem Pedido"] = (df_f["Data do Pedido"].max() - ag.pop("UltimoPedido")).dt.days
+
+    return ag
+
+
+@instrumentado()
+def alertas_carteira(df, df_f, regras=None, limites=None):
+    """
+    Alertas de todos os clientes do recorte, do mais grave para o menos.
+
+    As regras registradas são avaliadas como máscaras vetorizadas sobre os
+    agregados por cliente (uma linha por cliente); cada disparo vira uma
+    linha com severidade, valor e mensagem. Ordem: severidade e, dentro
+    dela, faturamento do cliente.
+    """
+    regras = list(REGRAS_ALERTA) if regras is None else regras
+    lim = {**LIMITES_ALERTA, **(limites or {})}
+    colunas = ["Nome Cliente", "Alerta", "Severidade", "Valor", "Mensagem", "FatLiq", "Var %", "Margem (%)", "% do Total"]
+
+    if df_f.empty:
+        return pd.DataFrame(columns=colunas)
+    ag = agregados_clientes(df, df_f)
+
+    partes = []
+    for tipo in regras:
+        func, severidade, mensagem, formato = REGRAS_ALERTA[tipo]
+        mascara, valor = func(ag, lim)
+        mascara = mascara.fillna(False).to_numpy(dtype=bool)
+        if not mascara.any():
+            continue
+
+        valores = valor.to_numpy()[mascara]
+        fmt = _FORMATOS_ALERTA[formato]
+        sel = ag[mascara]
+        partes.append(pd.DataFrame({
+            "Nome Cliente": sel.index,
+            "Alerta": tipo,
+            "Severidade": severidade,
+            "Valor": valores,
+            "Mensagem": [mensagem.format(valor=fmt(v)) for v in valores],
+            "FatLiq": sel["FatLiq"].to_numpy(),
+            "Var %": sel["Var %"].to_numpy(),
+            "Margem (%)": sel["Margem (%)"].to_numpy(),
+            "% do Total": sel["% do Total"].to_numpy(),
+        }))
+
+    if not partes:
+        return pd.DataFrame(columns=colunas)
+
+    alertas = pd.concat(partes, ignore_index=True)
+    alertas["Severidade"] = pd.Categorical(alertas["Severidade"], categories=SEVERIDADES, ordered=True)
+    return alertas.sort_values(["Severidade", "FatLiq"], ascending=[True, False], ignore_index=True)
+
+
+
+# -------------------------------------------------------------
+# (I) COORTES DE CLIENTES (RETENÇÃO E RECEITA)
+# -------------------------------------------------------------
+def _mes_ordinal(datas):
+    """Mês como inteiro contínuo (o ordinal do pd.Period mensal)"""
+    return ((datas.dt.year - 1970) * 12 + datas.dt.month - 1).to_numpy(dtype=np.int64)
+
+
+@instrumentado()
+def primeira_compra(df):
+    """Mês (ordinal) da primeira compra de cada cliente na base inteira"""
+    base = df[["Nome Cliente", "Data / Mês"]].dropna()
+    codigos, clientes = pd.factorize(base["Nome Cliente"])
+    primeiro = np.full(len(clientes), np.iinfo(np.int64).max)
+    np.minimum.at(primeiro, codigos, _mes_ordinal(base["Data / Mês"]))
+    return pd.Series(primeiro, index=clientes, name="Primeira Compra")
+
+
+@instrumentado()
+def coortes_clientes(df_f, primeira=None):
+    """
+    Retenção e faturamento por coorte × meses desde a primeira compra.
+
+    A coorte do cliente é o mês da primeira compra na base inteira
+    (`primeira`, de primeira_compra; sem ela, a primeira compra na visão).
+    As linhas da visão filtrada dizem em que meses cada cliente comprou e
+    quanto; entram as coortes iniciadas dentro dos meses da visão. Tudo sai
+    de bincounts sobre índices inteiros (coorte, mês relativo). Devolve:
+      "Coortes": clientes e faturamento de cada coorte;
+      "Retenção (%)": % dos clientes da coorte que compraram em M+k;
+      "Faturamento": faturamento líquido da coorte em M+k.
+    Células depois do último mês da visão ficam NaN.
+    """
+    base = df_f[["Nome Cliente", "Data / Mês", "Faturamento Líquido"]].dropna(
+        subset=["Nome Cliente", "Data / Mês"]
+    )
+    if base.empty:
+        vazio = pd.DataFrame(index=pd.Index([], name="Coorte"))
+        return {
+            "Coortes": pd.DataFrame(columns=["Coorte", "Clientes", "Faturamento", "Fat. por Cliente"]),
+            "Retenção (%)": vazio,
+            "Faturamento": vazio,
+        }
+
+    codigos, clientes = pd.factorize(base["Nome Cliente"])
+    mes = _mes_ordinal(base["Data / Mês"])
+    inicio = mes.min()
+    n = int(mes.max() - inicio + 1)
+
+    # Coorte por cliente (nunca depois da primeira compra vista no recorte)
+    coorte = np.full(len(clientes), np.iinfo(np.int64).max)
+    np.minimum.at(coorte, codigos, mes)
+    if primeira is not None:
+        anterior = primeira.reindex(clientes, fill_value=np.iinfo(np.int64).max).to_numpy(dtype=np.int64)
+        coorte = np.minimum(coorte, anterior)
+    dentro = coorte >= inicio
+    c_cli = np.where(dentro, coorte - inicio, 0)
+
+    linha = dentro[codigos]
+    c_lin = c_cli[codigos][linha]
+    k_lin = (mes - coorte[codigos])[linha]
+
+    faturamento = np.bincount(
+        c_lin * n + k_lin,
+        weights=base["Faturamento Líquido"].fillna(0).to_numpy(dtype=float)[linha],
+        minlength=n * n,
+    ).reshape(n, n)
+
+    # Clientes ativos em M+k: pares (cliente, k) distintos marcados uma vez
+    ativo = np.zeros(len(clientes) * n, dtype=bool)
+    ativo[codigos[linha].astype(np.int64) * n + k_lin] = True
+    cli_ativo, k_ativo = np.divmod(np.flatnonzero(ativo), n)
+    ativos = np.bincount(c_cli[cli_ativo] * n + k_ativo, minlength=n * n).reshape(n, n)
+    tamanho = np.bincount(c_cli[dentro], minlength=n)
+
+    # Triângulo observável: coorte c só tem meses até M+(n-1-c)
+    futuro = np.arange(n)[:, None] + np.arange(n)[None, :] >= n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        retencao = np.where(futuro, np.nan, ativos / tamanho[:, None] * 100)
+    faturamento = np.where(futuro, np.nan, faturamento)
+
+    rotulos = pd.period_range(pd.Period(ordinal=int(inicio), freq="M"), periods=n, freq="M").astype(str)
+    indice = pd.Index(rotulos, name="Coorte")
+    colunas = [f"M+{k}" for k in range(n)]
+    com_clientes = tamanho > 0
+
+    fat_coorte = np.nansum(faturamento, axis=1)
+    resumo = pd.DataFrame({
+        "Coorte": rotulos,
+        "Clientes": tamanho,
+        "Faturamento": fat_coorte,
+        "Fat. por Cliente": fat_coorte / np.maximum(tamanho, 1),
+    })[com_clientes].reset_index(drop=True)
+
+    return {
+        "Coortes": resumo,
+        "Retenção (%)": pd.DataFrame(retencao, index=indice, columns=colunas)[com_clientes],
+        "Faturamento": pd.DataFrame(faturamento, index=indice, columns=colunas)[com_clientes],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from calculos_comerciais import aplicar_filtros
+    from pipeline_brasforma import load_brasforma
+
+    parser = argparse.ArgumentParser(description="Alertas de todos os clientes (rodada em lote)")
+    parser.add_argument("excel")
+    parser.add_argument("--aba", default="BD DASH")
+    parser.add_argument("--saida", default="alertas_carteira.xlsx", help=".xlsx ou .csv")
+    parser.add_argument("--inicio")
+    parser.add_argument("--fim")
+    parser.add_argument("--meses", type=int, default=3, help="período quando --inicio não é informado")
+    args = parser.parse_args()
+
+    df = load_brasforma(args.excel, args.aba)
+    fim = pd.to_datetime(args.fim) if args.fim else df["Data / Mês"].max()
+    inicio = (
+        pd.to_datetime(args.inicio) if args.inicio
+        else fim - pd.DateOffset(months=args.meses) + pd.DateOffset(days=1)
+    )
+
+    alertas = alertas_carteira(df, aplicar_filtros(df, {"periodo": (inicio, fim)}))
+    if args.saida.endswith(".csv"):
+        alertas.to_csv(args.saida, index=False)
+    else:
+        alertas.to_excel(args.saida, index=False)
+    print(f"{len(alertas)} alertas em {alertas['Nome Cliente'].nunique()} clientes gravados em {args.saida}")
@@ -1,6 +1,23 @@
+import os
+import re
+import tempfile
+
 import pandas as pd
 import numpy as np
 
+from calculos_comerciais import COMPONENTES_IMPOSTO, coluna_transacao
+
+# Mês de início do ano fiscal (1 = ano fiscal igual ao calendário)
+MES_INICIO_FISCAL = 1
+
+# Colunas criadas por preparar_base (o resto vem da planilha)
+COLUNAS_DERIVADAS = [
+    "Imposto Total", "Faturamento Líquido", "Custo Total", "Lucro Bruto", "Margem %",
+    "Ano", "Mes", "Ano-Mes", "Trimestre", "Periodo Fiscal", "Semana ISO",
+    "LeadTime (dias)", "AnoMes Pedido", "AtrasadoFlag", "PedidoItemKey",
+]
+
+
 def to_num(x):
     if pd.isna(x):
         return np.nan
@@ -15,8 +32,16 @@ def to_num(x):
 
 def load_brasforma(path: str, sheet="BD DASH"):
     df = pd.read_excel(path, sheet_name=sheet)
+    return preparar_base(df)
+
+
+def preparar_base(df):
+    """Tratamento da aba "BD DASH" já lida (datas, números, impostos e derivadas)"""
     df.columns = [c.strip() for c in df.columns]
 
+    # Transação com nome canônico (coluna C quando o cabeçalho vem diferente)
+    df.rename(columns={coluna_transacao(df): "Transação"}, inplace=True)
+
     # Datas
     date_cols = [
         "Data / Mês","Data Final","Data do Pedido",
@@ -32,21 +57,23 @@ def load_brasforma(path: str, sheet="BD DASH"):
         if col in df.columns:
             df[col] = df[col].apply(to_num)
 
-    # Impostos da base
-    impostos_cols = [
-        "cofins","pis","ipi","icms","ipiReturned-T","icmsSt","ipi-T",
-        "aproxtribFed","aproxtribState","cofinsDeson","pisDeson",
-        "icmsDeson","icmsStFCP","icmsDifaRemet","icmsDifaDest",
-        "icmsDifaFCP"
-    ]
-
-    for col in impostos_cols:
-        if col not in df.columns:
-            df[col] = 0
-        df[col] = df[col].apply(to_num)
+    # Impostos da base: o total é somado em float64 e os componentes ficam
+    # numa matriz float32 contígua (um bloco só), lida pela análise tributária
+    impostos = np.column_stack([
+        df[col].apply(to_num) if col in df.columns else np.zeros(len(df))
+        for col in COMPONENTES_IMPOSTO
+    ])
 
     # Imposto total
-    df["Imposto Total"] = df[impostos_cols].sum(axis=1)
+    df["Imposto Total"] = np.nansum(impostos, axis=1)
+
+    df = pd.concat([
+        df.drop(columns=[c for c in COMPONENTES_IMPOSTO if c in df.columns]),
+        pd.DataFrame(
+            np.nan_to_num(impostos).astype(np.float32),
+            index=df.index, columns=COMPONENTES_IMPOSTO,
+        ),
+    ], axis=1)
 
     # Faturamento líquido
     df["Faturamento Líquido"] = df["Valor Pedido R$"] - df["Imposto Total"]
@@ -68,10 +95,23 @@ def load_brasforma(path: str, sheet="BD DASH"):
     df["Mes"] = df["Data / Mês"].dt.month
     df["Ano-Mes"] = df["Data / Mês"].dt.to_period("M").astype(str)
 
-    # Lead time
+    # Chaves de calendário das séries: trimestre e período fiscal saem de
+    # "Data / Mês"; a semana ISO, da data do pedido (a base é mensal)
+    df["Trimestre"] = df["Data / Mês"].dt.to_period("Q").astype(str)
+    inicio_fiscal = df["Data / Mês"] - pd.DateOffset(months=MES_INICIO_FISCAL - 1)
+    df["Periodo Fiscal"] = "AF" + inicio_fiscal.dt.strftime("%Y-P%m")
+
+    data_semana = df["Data do Pedido"].fillna(df["Data / Mês"])
+    iso = data_semana.dt.isocalendar()
+    df["Semana ISO"] = (
+        iso["year"].astype(str) + "-W" + iso["week"].astype(str).str.zfill(2)
+    ).where(data_semana.notna())
+
+    # Lead time e mês do pedido (aba de atrasos)
     df["LeadTime (dias)"] = (
         df["Data da Entrega"] - df["Data do Pedido"]
     ).dt.days
+    df["AnoMes Pedido"] = df["Data do Pedido"].dt.to_period("M").astype(str)
 
     # Flag atraso
     df["AtrasadoFlag"] = df["Atrasado / No prazo"].astype(str).str.contains(
@@ -84,3 +124,166 @@ def load_brasforma(path: str, sheet="BD DASH"):
     )
 
     return df
+
+
+# -------------------------------------------------------------
+# RELATÓRIOS EM LOTE (POR REPRESENTANTE / UF)
+# -------------------------------------------------------------
+DIMENSOES_RELATORIO = {"representante": "Representante", "uf": "UF"}
+
+# Base memory-mapped aberta uma vez por processo trabalhador
+_BASE_TRABALHADOR = {}
+
+
+def tabela_arrow(df):
+    """Base como tabela Arrow; colunas texto com tipos mistos viram string"""
+    import pyarrow as pa
+
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _iniciar_trabalhador(caminho):
+    from pyarrow import feather
+
+    _BASE_TRABALHADOR["tabela"] = feather.read_table(caminho, memory_map=True)
+
+
+def _recorte(coluna, valor):
+    """Linhas de um representante/UF lidas do arquivo mapeado (só o recorte é copiado)"""
+    import pyarrow.compute as pc
+
+    tabela = _BASE_TRABALHADOR["tabela"]
+    return tabela.filter(pc.equal(tabela[coluna], valor)).to_pandas()
+
+
+def montar_pacote(df_dim, ini, fim):
+    """
+    Tabelas do pacote de um representante/UF.
+
+    df_dim traz todo o histórico do recorte; o período [ini, fim] é a
+    visão do relatório e o que vem antes serve de base para novos/perdidos.
+    """
+    from calculos_comerciais import (
+        aplicar_filtros, kpis_gerais, ranking_clientes, ranking_skus, curva_abc,
+        clientes_novos_perdidos, kpis_atraso, atraso_por,
+    )
+
+    df_f = aplicar_filtros(df_dim, {"periodo": (ini, fim)})
+    if df_f.empty:
+        return {}
+
+    kpis = {**kpis_gerais(df_f), **kpis_atraso(df_f)}
+    novos, perdidos = clientes_novos_perdidos(df_dim, df_f)
+
+    return {
+        "KPIs": pd.DataFrame({"Indicador": list(kpis), "Valor": list(kpis.values())}),
+        "Ranking Clientes": curva_abc(ranking_clientes(df_f)),
+        "Clientes Novos-Perdidos": pd.DataFrame({
+            "Nome Cliente": novos + perdidos,
+            "Situação": ["Novo"] * len(novos) + ["Perdido"] * len(perdidos),
+        }),
+        "Mix SKU": curva_abc(ranking_skus(df_f)),
+        "Atraso Mensal": atraso_por(df_f, "AnoMes Pedido"),
+    }
+
+
+def _nome_arquivo(valor):
+    return re.sub(r"[^\w\-]+", "_", str(valor)).strip("_") or "sem_nome"
+
+
+def gravar_pacote(tabelas, destino, formato="xlsx"):
+    """Excel com uma aba por tabela, ou pasta com um Parquet por tabela"""
+    if formato == "xlsx":
+        caminho = destino + ".xlsx"
+        with pd.ExcelWriter(caminho) as writer:
+            for nome, tab in tabelas.items():
+                tab.to_excel(writer, sheet_name=nome[:31], index=False)
+        return caminho
+
+    os.makedirs(destino, exist_ok=True)
+    for nome, tab in tabelas.items():
+        tab.to_parquet(os.path.join(destino, _nome_arquivo(nome) + ".parquet"), index=False)
+    return destino
+
+
+def _gerar_pacote(tarefa):
+    dimensao, valor, ini, fim, pasta, formato = tarefa
+    coluna = DIMENSOES_RELATORIO[dimensao]
+    tabelas = montar_pacote(_recorte(coluna, valor), ini, fim)
+    if not tabelas:
+        return None
+    destino = os.path.join(pasta, dimensao, _nome_arquivo(valor))
+    return gravar_pacote(tabelas, destino, formato)
+
+
+def gerar_relatorios(base, pasta_saida, dimensoes=("representante", "uf"), formato="xlsx",
+                     inicio=None, fim=None, meses=12, processos=None, sheet="BD DASH"):
+    """
+    Gera os pacotes por representante e por UF em paralelo.
+
+    A base (DataFrame tratado ou caminho do .xlsx) é carregada uma vez e
+    gravada como Arrow/Feather sem compressão; cada processo a abre com
+    memory_map, então os trabalhadores não recebem cópias via pickle.
+    Sem `inicio`, o período são os últimos `meses` meses da base.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from pyarrow import feather
+
+    if formato not in ("xlsx", "parquet"):
+        raise ValueError("formato deve ser 'xlsx' ou 'parquet'")
+
+    df = load_brasforma(base, sheet) if isinstance(base, str) else base
+    fim = pd.to_datetime(fim) if fim is not None else df["Data / Mês"].max()
+    inicio = (
+        pd.to_datetime(inicio) if inicio is not None
+        else fim - pd.DateOffset(months=meses) + pd.DateOffset(days=1)
+    )
+
+    tarefas = [
+        (dim, valor, inicio, fim, pasta_saida, formato)
+        for dim in dimensoes
+        for valor in sorted(df[DIMENSOES_RELATORIO[dim]].dropna().unique())
+    ]
+    for dim in dimensoes:
+        os.makedirs(os.path.join(pasta_saida, dim), exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, "base.arrow")
+        feather.write_feather(tabela_arrow(df), caminho, compression="uncompressed")
+        del df
+
+        with ProcessPoolExecutor(
+            max_workers=processos, initializer=_iniciar_trabalhador, initargs=(caminho,)
+        ) as pool:
+            gerados = list(pool.map(_gerar_pacote, tarefas, chunksize=4))
+
+    return [g for g in gerados if g]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pacotes de relatório por representante/UF")
+    parser.add_argument("excel")
+    parser.add_argument("--aba", default="BD DASH")
+    parser.add_argument("--saida", default="relatorios")
+    parser.add_argument("--dimensoes", nargs="+", default=["representante", "uf"],
+                        choices=sorted(DIMENSOES_RELATORIO))
+    parser.add_argument("--formato", default="xlsx", choices=["xlsx", "parquet"])
+    parser.add_argument("--inicio")
+    parser.add_argument("--fim")
+    parser.add_argument("--meses", type=int, default=12)
+    parser.add_argument("--processos", type=int)
+    args = parser.parse_args()
+
+    arquivos = gerar_relatorios(
+        args.excel, args.saida, args.dimensoes, args.formato,
+        args.inicio, args.fim, args.meses, args.processos, args.aba,
+    )
+    print(f"{len(arquivos)} pacotes gravados em {args.saida}")
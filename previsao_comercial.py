@@ -0,0 +1,216 @@
+import pandas as pd
+import numpy as np
+
+from instrumentacao import instrumentado
+from inteligencia_comercial import matriz_mensal, linhas_validas
+
+# -------------------------------------------------------------
+# PREVISÃO DE FATURAMENTO EM LOTE (CLIENTES E SKUs)
+# -------------------------------------------------------------
+# Todas as séries de uma dimensão formam a matriz chave × mês; cada modelo
+# recebe a matriz inteira e devolve a previsão de todas as linhas de uma
+# vez (laços só no tempo, nunca nas séries).
+
+HORIZONTE_PADRAO = 3          # próximo trimestre
+PERIODO_SAZONAL = 12          # sazonalidade anual em meses
+
+DIMENSOES_PREVISAO = {"Cliente": "Nome Cliente", "SKU": "ITEM"}
+
+# Colunas lidas da base (o resto não é copiado)
+COLUNAS_PREVISAO = ["Nome Cliente", "ITEM", "Ano-Mes", "Data / Mês", "Data do Pedido", "Faturamento Líquido"]
+
+# Grade de suavização do Holt-Winters (escolhida por série no ajuste)
+GRADE_HOLT_WINTERS = [
+    (alfa, beta, gama)
+    for alfa in (0.2, 0.5, 0.8)
+    for beta in (0.05, 0.2)
+    for gama in (0.1, 0.3)
+]
+
+# Registro dos modelos: nome -> função(matriz, horizonte, periodo) -> previsões
+MODELOS_PREVISAO = {}
+
+
+def modelo_previsao(nome):
+    """Registra um modelo no motor de previsão (uso como decorador)"""
+    def registrar(func):
+        MODELOS_PREVISAO[nome] = func
+        return func
+    return registrar
+
+
+@modelo_previsao("Sazonal ingênuo")
+def _sazonal_ingenuo(Y, h, periodo):
+    """Repete o mesmo mês do ano anterior (ou o último mês, sem um ano de histórico)"""
+    n, T = Y.shape
+    if T == 0:
+        return np.zeros((n, h))
+    if T < periodo:
+        return np.repeat(Y[:, -1:], h, axis=1)
+    passos = np.arange(h)
+    return Y[:, T - periodo + passos % periodo]
+
+
+@modelo_previsao("Tendência linear")
+def _tendencia_linear(Y, h, periodo):
+    """Reta de mínimos quadrados sobre o último ciclo, extrapolada h meses"""
+    n, T = Y.shape
+    janela = min(T, periodo)
+    if janela < 2:
+        return _sazonal_ingenuo(Y, h, periodo)
+
+    recorte = Y[:, T - janela:]
+    x = np.arange(janela) - (janela - 1) / 2
+    media = recorte.mean(axis=1)
+    inclinacao = (recorte - media[:, None]) @ x / (x @ x)
+    futuro = x[-1] + np.arange(1, h + 1)
+    return media[:, None] + inclinacao[:, None] * futuro
+
+
+def _holt_winters(Y, h, periodo, alfa, beta, gama):
+    """Holt-Winters aditivo (sem sazonalidade com menos de dois ciclos); devolve previsões e SSE"""
+    n, T = Y.shape
+    if T >= 2 * periodo:
+        # Início pelos dois primeiros ciclos: tendência entre as médias, e a
+        # sazonalidade do primeiro ciclo já sem a rampa da tendência
+        m, inicio = periodo, periodo
+        media = Y[:, :m].mean(axis=1)
+        tendencia = (Y[:, m:2 * m].mean(axis=1) - media) / m
+        rampa = media[:, None] + tendencia[:, None] * (np.arange(m) - (m - 1) / 2)
+        sazonal = Y[:, :m] - rampa
+        nivel = rampa[:, -1]
+    else:
+        m, inicio, gama = 1, 1, 0.0
+        nivel = Y[:, 0].copy()
+        tendencia = np.zeros(n)
+        sazonal = np.zeros((n, 1))
+
+    sse = np.zeros(n)
+    for t in range(inicio, T):
+        s = sazonal[:, t % m]
+        erro = Y[:, t] - (nivel + tendencia + s)
+        sse += erro ** 2
+        novo_nivel = alfa * (Y[:, t] - s) + (1 - alfa) * (nivel + tendencia)
+        tendencia = beta * (novo_nivel - nivel) + (1 - beta) * tendencia
+        sazonal[:, t % m] = gama * (Y[:, t] - novo_nivel) + (1 - gama) * s
+        nivel = novo_nivel
+
+    passos = np.arange(1, h + 1)
+    previsao = nivel[:, None] + tendencia[:, None] * passos + sazonal[:, (T + passos - 1) % m]
+    return previsao, sse
+
+
+@modelo_previsao("Holt-Winters")
+def _holt_winters_grade(Y, h, periodo):
+    """Holt-Winters com os parâmetros da grade de menor erro no ajuste de cada série"""
+    n, T = Y.shape
+    if T < 2:
+        return _sazonal_ingenuo(Y, h, periodo)
+
+    melhor = np.zeros((n, h))
+    melhor_sse = np.full(n, np.inf)
+    for alfa, beta, gama in GRADE_HOLT_WINTERS:
+        previsao, sse = _holt_winters(Y, h, periodo, alfa, beta, gama)
+        troca = sse < melhor_sse
+        melhor[troca] = previsao[troca]
+        melhor_sse[troca] = sse[troca]
+    return melhor
+
+
+def _ultimo_mes_incompleto(base, meses):
+    """
+    Se o último mês da matriz ainda está em aberto na base.
+
+    A planilha é atualizada toda semana: o mês corrente está incompleto
+    enquanto o pedido mais recente for anterior ao último dia útil dele.
+    """
+    if not len(meses):
+        return False
+    ultimo_pedido = base["Data do Pedido"].max()
+    if pd.isna(ultimo_pedido):
+        return False
+    fim_mes = meses[-1].to_timestamp() + pd.offsets.BMonthEnd(0)
+    return ultimo_pedido.normalize() < fim_mes
+
+
+def _prever(Y, h, periodo):
+    """Previsões de todos os modelos registrados: array modelos × séries × h"""
+    return np.stack([
+        np.maximum(func(Y, h, periodo), 0) for func in MODELOS_PREVISAO.values()
+    ])
+
+
+def _erro_backtest(Y, h, periodo):
+    """
+    WAPE (%) de cada modelo e série nos últimos h meses, ajustando no restante.
+
+    Séries sem faturamento no trecho de validação (ou histórico curto
+    demais para separar um) ficam com erro NaN.
+    """
+    n, T = Y.shape
+    if T < h + 2:
+        return np.full((len(MODELOS_PREVISAO), n), np.nan)
+
+    real = Y[:, T - h:]
+    previsto = _prever(Y[:, :T - h], h, periodo)
+    total = real.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total > 0, np.abs(previsto - real).sum(axis=2) / total * 100, np.nan)
+
+
+@instrumentado()
+def prever_faturamento(df, chave, horizonte=HORIZONTE_PADRAO, periodo=PERIODO_SAZONAL):
+    """
+    Previsão do faturamento líquido dos próximos `horizonte` meses por `chave`.
+
+    Todos os modelos registrados são ajustados de uma vez sobre a matriz
+    chave × mês e validados nos últimos `horizonte` meses; cada série fica
+    com o modelo de menor erro no backtest (Sazonal ingênuo quando não há
+    como validar). Devolve previsão por mês e total, erro de cada modelo e
+    o faturamento dos últimos `horizonte` meses para comparação.
+
+    Um último mês ainda em aberto fica fora do ajuste, do backtest e dos
+    últimos meses; ele passa a ser o primeiro mês previsto.
+    """
+    base = linhas_validas(df[COLUNAS_PREVISAO])
+    chaves, meses, Y = matriz_mensal(base, chave, "Faturamento Líquido")
+    if _ultimo_mes_incompleto(base, meses):
+        meses, Y = meses[:-1], Y[:, :-1]
+    nomes = list(MODELOS_PREVISAO)
+
+    erros = _erro_backtest(Y, horizonte, periodo)
+    previsoes = _prever(Y, horizonte, periodo)
+
+    # Modelo de menor erro por série; sem backtest, o primeiro registrado
+    escolha = np.argmin(np.where(np.isnan(erros), np.inf, erros), axis=0)
+    previsao = previsoes[escolha, np.arange(len(chaves))]
+
+    if len(meses):
+        futuros = [str(meses[-1] + i) for i in range(1, horizonte + 1)]
+    else:
+        futuros = [f"M+{i}" for i in range(1, horizonte + 1)]
+
+    out = pd.DataFrame({chave: chaves, "Modelo": np.array(nomes)[escolha]})
+    for i, mes in enumerate(futuros):
+        out[f"Prev {mes}"] = previsao[:, i]
+    out["Previsão Total"] = previsao.sum(axis=1)
+    out["Últimos Meses"] = Y[:, max(Y.shape[1] - horizonte, 0):].sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["Var %"] = np.where(
+            out["Últimos Meses"] > 0,
+            (out["Previsão Total"] / out["Últimos Meses"] - 1) * 100,
+            np.nan
+        )
+    out["Erro Backtest (%)"] = erros[escolha, np.arange(len(chaves))]
+    for nome, erro in zip(nomes, erros):
+        out[f"Erro {nome} (%)"] = erro
+
+    return out.sort_values("Previsão Total", ascending=False, ignore_index=True)
+
+
+def previsoes_faturamento(df):
+    """Previsões de clientes e SKUs da base inteira (uma vez por versão da base)"""
+    return {
+        nome: prever_faturamento(df, coluna)
+        for nome, coluna in DIMENSOES_PREVISAO.items()
+    }
@@ -0,0 +1,206 @@
+import pandas as pd
+import numpy as np
+
+from calculos_comerciais import COMPONENTES_IMPOSTO, matriz_impostos
+from instrumentacao import instrumentado
+
+# -------------------------------------------------------------
+# SIMULADOR DE CENÁRIOS (WHAT-IF) SOBRE O CUBO SKU × UF
+# -------------------------------------------------------------
+# A visão filtrada vira um cubo pequeno (uma célula por SKU × UF) com as
+# somas de faturamento, custo e de cada componente de imposto. Cada choque
+# de preço, desconto, custo ou alíquota vira um fator nas células que ele
+# atinge, e o cenário sai de uma conta vetorizada sobre todas as células.
+# Volumes ficam constantes (sem elasticidade ao preço).
+
+DIMENSOES_CUBO = ["ITEM", "UF"]
+
+# Medida do cubo -> coluna da base
+MEDIDAS_CUBO = {
+    "FatBruto": "Valor Pedido R$",
+    "FatLiq": "Faturamento Líquido",
+    "Impostos": "Imposto Total",
+    "Custo": "Custo Total",
+    "Unidades": "Quant. Pedidos",
+}
+
+# Colunas da base lidas pelo cubo
+COLUNAS_CUBO = DIMENSOES_CUBO + list(MEDIDAS_CUBO.values()) + COMPONENTES_IMPOSTO
+
+# Registro dos choques: tipo -> função(fatores, alvo, pct, componente)
+TIPOS_CHOQUE = {}
+
+
+def tipo_choque(nome):
+    """Registra um tipo de choque do simulador (uso como decorador)"""
+    def registrar(func):
+        TIPOS_CHOQUE[nome] = func
+        return func
+    return registrar
+
+
+@tipo_choque("Preço")
+def _choque_preco(fatores, alvo, pct, componente):
+    """Reajuste de preço: faturamento bruto e impostos (alíquotas mantidas) sobem pct%"""
+    fatores["preco"][alvo] *= 1 + pct / 100
+
+
+@tipo_choque("Desconto")
+def _choque_desconto(fatores, alvo, pct, componente):
+    """Desconto de pct% no preço (os impostos acompanham a base menor)"""
+    fatores["preco"][alvo] *= 1 - pct / 100
+
+
+@tipo_choque("Custo")
+def _choque_custo(fatores, alvo, pct, componente):
+    """Variação de pct% no custo total"""
+    fatores["custo"][alvo] *= 1 + pct / 100
+
+
+@tipo_choque("Alíquota")
+def _choque_aliquota(fatores, alvo, pct, componente):
+    """Variação de pct% na alíquota de um componente de imposto (sem componente, de todos)"""
+    if componente:
+        fatores["imposto"][alvo, COMPONENTES_IMPOSTO.index(componente)] *= 1 + pct / 100
+    else:
+        fatores["imposto"][alvo] *= 1 + pct / 100
+
+
+@instrumentado()
+def cubo_cenarios(df_f):
+    """Somas da visão filtrada por SKU × UF: medidas do cenário e componentes de imposto"""
+    codigos_item, itens = pd.factorize(df_f["ITEM"])
+    codigos_uf, ufs = pd.factorize(df_f["UF"])
+
+    # Só as combinações presentes viram células; nulos (código -1) formam uma
+    # célula própria. As dimensões ficam categóricas: os recortes dos choques
+    # comparam textos uma vez por SKU/UF, não por célula
+    largura = len(ufs) + 1
+    codigos, celulas = pd.factorize((codigos_item.astype(np.int64) + 1) * largura + codigos_uf + 1)
+    n = len(celulas)
+
+    cubo = pd.DataFrame({
+        "ITEM": pd.Categorical.from_codes(celulas // largura - 1, categories=itens),
+        "UF": pd.Categorical.from_codes(celulas % largura - 1, categories=ufs),
+        "Linhas": np.bincount(codigos, minlength=n),
+    })
+    for nome, coluna in MEDIDAS_CUBO.items():
+        valores = np.nan_to_num(df_f[coluna].to_numpy(dtype=float))
+        cubo[nome] = np.bincount(codigos, weights=valores, minlength=n)
+
+    matriz = matriz_impostos(df_f)
+    for j, comp in enumerate(COMPONENTES_IMPOSTO):
+        cubo[comp] = np.bincount(codigos, weights=matriz[:, j], minlength=n)
+    return cubo
+
+
+def _alvo(cubo, choque):
+    """Células atingidas por um choque (UFs e SKU/família; sem recorte, todas)"""
+    alvo = np.ones(len(cubo), dtype=bool)
+    ufs = choque.get("uf")
+    if ufs:
+        alvo &= cubo["UF"].isin(ufs).to_numpy()
+
+    item = choque.get("item")
+    if isinstance(item, str):
+        if item.strip():
+            # Códigos de SKU podem vir numéricos da planilha: compara como texto
+            contem = cubo["ITEM"].astype(str).str.contains(item.strip(), case=False, regex=False)
+            alvo &= (contem & cubo["ITEM"].notna()).to_numpy(dtype=bool)
+    elif item:
+        alvo &= cubo["ITEM"].isin(item).to_numpy()
+    return alvo
+
+
+@instrumentado()
+def simular_cenario(cubo, choques):
+    """
+    Aplica os choques a todas as células do cubo de uma vez.
+
+    `choques` é uma lista de dicts com "tipo" (de TIPOS_CHOQUE), "pct" e,
+    opcionais, "uf" (lista de UFs), "item" (texto contido no código do SKU,
+    para uma família, ou lista de SKUs) e "componente" (imposto do choque
+    de alíquota). Choques na mesma célula se compõem. Os impostos do
+    cenário são os da base mais a variação de cada componente, então sem
+    choques o cenário reproduz exatamente os KPIs da visão. Devolve o cubo
+    com as colunas "<medida> Cenário".
+    """
+    n = len(cubo)
+    fatores = {
+        "preco": np.ones(n),
+        "custo": np.ones(n),
+        "imposto": np.ones((n, len(COMPONENTES_IMPOSTO))),
+    }
+    for choque in choques:
+        tipo, componente = choque.get("tipo"), choque.get("componente") or None
+        if tipo not in TIPOS_CHOQUE:
+            raise ValueError(f"tipo de choque deve ser um de {list(TIPOS_CHOQUE)}")
+        if componente is not None and componente not in COMPONENTES_IMPOSTO:
+            raise ValueError(f"componente deve ser um de {COMPONENTES_IMPOSTO}")
+        TIPOS_CHOQUE[tipo](fatores, _alvo(cubo, choque), float(choque.get("pct", 0)), componente)
+
+    componentes = cubo[COMPONENTES_IMPOSTO].to_numpy()
+    delta_bruto = cubo["FatBruto"].to_numpy() * (fatores["preco"] - 1)
+    delta_impostos = (componentes * (fatores["preco"][:, None] * fatores["imposto"] - 1)).sum(axis=1)
+
+    cenario = cubo[DIMENSOES_CUBO + ["FatBruto", "Impostos", "FatLiq", "Custo"]].copy()
+    cenario["FatBruto Cenário"] = cenario["FatBruto"] + delta_bruto
+    cenario["Impostos Cenário"] = cenario["Impostos"] + delta_impostos
+    cenario["FatLiq Cenário"] = cenario["FatLiq"] + delta_bruto - delta_impostos
+    cenario["Custo Cenário"] = cenario["Custo"] * fatores["custo"]
+    return cenario
+
+
+def _indicadores(fat_bruto, impostos, fat_liq, custo):
+    """Valores, lucro bruto e margens (mesmas definições dos KPIs e do ranking de SKUs)"""
+    lucro = fat_bruto - custo
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "Faturamento Bruto": fat_bruto,
+            "Impostos": impostos,
+            "Faturamento Líquido": fat_liq,
+            "Custo Total": custo,
+            "Lucro Bruto": lucro,
+            "Margem Bruta (%)": np.where(fat_bruto > 0, 100 * lucro / fat_bruto, np.nan),
+            "Margem Líquida (%)": np.where(fat_liq > 0, 100 * (lucro - impostos) / fat_liq, np.nan),
+        }
+
+
+def _lados(tabela):
+    """Indicadores da base e do cenário a partir das somas de uma tabela do cenário"""
+    base = _indicadores(*(tabela[c].to_numpy(dtype=float) for c in ["FatBruto", "Impostos", "FatLiq", "Custo"]))
+    cen = _indicadores(*(
+        tabela[f"{c} Cenário"].to_numpy(dtype=float) for c in ["FatBruto", "Impostos", "FatLiq", "Custo"]
+    ))
+    return base, cen
+
+
+def resumo_cenario(cenario):
+    """Totais da base × cenário com a variação absoluta e percentual"""
+    base, cen = _lados(cenario.drop(columns=DIMENSOES_CUBO).sum().to_frame().T)
+    resumo = pd.DataFrame({
+        "Indicador": list(base),
+        "Base": [float(v[0]) for v in base.values()],
+        "Cenário": [float(v[0]) for v in cen.values()],
+    })
+    resumo["Variação"] = resumo["Cenário"] - resumo["Base"]
+    resumo["Variação (%)"] = np.where(
+        resumo["Base"].abs() > 0, 100 * resumo["Variação"] / resumo["Base"].abs(), np.nan
+    )
+    # Margens variam em pontos percentuais (a coluna "Variação" já mostra isso)
+    resumo.loc[resumo["Indicador"].str.endswith("(%)"), "Variação (%)"] = np.nan
+    return resumo
+
+
+def cenario_por(cenario, dimensao):
+    """Faturamento líquido e margem bruta da base × cenário por UF ou SKU"""
+    tabela = cenario.groupby(dimensao, as_index=False, observed=True, dropna=False).sum(numeric_only=True)
+    base, cen = _lados(tabela)
+    return pd.DataFrame({
+        dimensao: tabela[dimensao],
+        "FatLiq": base["Faturamento Líquido"],
+        "FatLiq Cenário": cen["Faturamento Líquido"],
+        "Var FatLiq": cen["Faturamento Líquido"] - base["Faturamento Líquido"],
+        "Margem Bruta (%)": base["Margem Bruta (%)"],
+        "Margem Bruta Cenário (%)": cen["Margem Bruta (%)"],
+    }).sort_values("Var FatLiq", key=np.abs, ascending=False, ignore_index=True)
@@ -0,0 +1,460 @@
+"""
+Versões da base ingerida e o que mudou entre elas.
+
+Cada base tratada pode ser gravada como uma versão numerada: um Parquet
+por versão com as colunas da planilha, a chave da linha (PedidoItemKey,
+com o nº da ocorrência quando o par pedido-item se repete) e um hash do
+conteúdo da linha, mais um manifesto JSON com o histórico. A comparação
+entre duas versões cruza só par pedido-item, data e hash (pares repetidos
+casam primeiro pelo conteúdo, ver casar_linhas); as colunas completas são
+lidas apenas dos grupos de linhas do Parquet que contêm linhas novas,
+removidas ou alteradas, e as alteradas são comparadas campo a campo.
+
+Com BRASFORMA_PASTA_VERSOES definida, o observador da planilha padrão
+(atualizador_base) grava uma versão a cada recarga, em segundo plano; uma
+base idêntica à última versão não gera versão nova. Sem ela, as versões
+vêm do comando `gravar` abaixo.
+
+Uso:
+    python versoes_base.py gravar "Dashboard - Comite Semanal - Brasforma IA (1).xlsx"
+    python versoes_base.py listar
+    python versoes_base.py diff [antes depois] --saida mudancas.xlsx
+"""
+
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+import numpy as np
+
+from instrumentacao import instrumentado
+from pipeline_brasforma import COLUNAS_DERIVADAS, load_brasforma, tabela_arrow
+
+# Caminho relativo é resolvido a partir da pasta do projeto, não do diretório corrente
+PASTA_VERSOES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.environ.get("BRASFORMA_PASTA_VERSOES") or "versoes_base",
+)
+MANIFESTO = "versoes.json"
+
+# Linhas por grupo do Parquet: a comparação lê por inteiro só os grupos com mudanças
+LINHAS_POR_GRUPO = 16_384
+
+COLUNA_CHAVE = "PedidoItemKey"
+COLUNA_HASH = "_HashLinha"
+
+# Campos acompanhados pelo comitê
+COLUNA_STATUS = "Status de Produção / Faturamento"
+COLUNA_ATRASO = "Atrasado / No prazo"
+COLUNA_VALOR = "Valor Pedido R$"
+
+# Colunas de contexto nas tabelas de mudanças
+COLUNAS_CONTEXTO = ["Nome Cliente", "Representante", "UF"]
+
+_trava_manifesto = threading.Lock()
+
+
+# -------------------------------------------------------------
+# CHAVES E HASHES DAS LINHAS
+# -------------------------------------------------------------
+def _texto_chave(serie):
+    """Parte da chave como texto; números inteiros sem ".0" (Pedido lido como float)"""
+    if pd.api.types.is_float_dtype(serie) and (serie.dropna() % 1 == 0).all():
+        return serie.astype("Int64").astype(str)
+    return serie.astype(str)
+
+
+def _ocorrencias(codigos, datas=None):
+    """
+    Nº da ocorrência (0, 1, 2...) de cada linha entre as de mesmo código.
+
+    Com `datas`, as ocorrências seguem a data; a ordem das linhas desempata.
+    """
+    ocorrencia = np.empty(len(codigos), dtype=np.int64)
+    if len(codigos) == 0:
+        return ocorrencia
+    ordem = np.lexsort((codigos,) if datas is None else (datas, codigos))
+    ordenados = codigos[ordem]
+    posicoes = np.arange(len(ordem))
+    inicio = np.maximum.accumulate(
+        np.where(np.r_[True, ordenados[1:] != ordenados[:-1]], posicoes, 0)
+    )
+    ocorrencia[ordem] = posicoes - inicio
+    return ocorrencia
+
+
+def _datas(df):
+    return df["Data / Mês"].to_numpy("datetime64[ns]").view("i8")
+
+
+def chaves_linhas(df):
+    """
+    PedidoItemKey única por linha.
+
+    Pares pedido-item repetidos ganham "#2", "#3"... na ordem de
+    "Data / Mês" (a ordem das linhas na planilha desempata). Essa numeração
+    muda quando uma linha do par entra, sai ou troca de data, então a
+    comparação entre versões não casa pares repetidos por ela (ver
+    casar_linhas).
+    """
+    chave = _texto_chave(df["Pedido"]) + "-" + _texto_chave(df["ITEM"])
+    codigos, _ = pd.factorize(chave)
+    if len(codigos) == 0:
+        return chave
+
+    ocorrencia = _ocorrencias(codigos, _datas(df))
+    repetida = ocorrencia > 0
+    if repetida.any():
+        chave = chave.copy()
+        chave[repetida] = chave[repetida] + "#" + (ocorrencia[repetida] + 1).astype(str)
+    return chave
+
+
+def _hash_coluna(serie):
+    """
+    Hash de cada valor da coluna, estável entre versões.
+
+    Números (inteiros, float32/64, booleanos) viram float64 e textos viram
+    str, para a mesma informação dar o mesmo hash lida da planilha ou do
+    Parquet; nulos têm hash próprio.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        valores = serie.to_numpy("datetime64[ns]").view("i8")
+    elif pd.api.types.is_bool_dtype(serie) or pd.api.types.is_numeric_dtype(serie):
+        valores = serie.to_numpy("float64", na_value=np.nan) + 0.0  # -0.0 vira 0.0
+    else:
+        valores = serie.astype(str).where(serie.notna(), "\x00").to_numpy(object)
+    return pd.util.hash_array(valores, categorize=True)
+
+
+def hash_linhas(df, colunas):
+    """Hash uint64 do conteúdo de cada linha nas `colunas` (independe da ordem delas)"""
+    h = np.zeros(len(df), dtype=np.uint64)
+    for col in sorted(colunas):
+        h = h * np.uint64(0x100000001B3) ^ _hash_coluna(df[col])
+    return h
+
+
+# -------------------------------------------------------------
+# GRAVAÇÃO E LEITURA DAS VERSÕES
+# -------------------------------------------------------------
+def _ler_manifesto(pasta):
+    try:
+        with open(os.path.join(pasta, MANIFESTO), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def _gravar_manifesto(pasta, versoes):
+    # Grava ao lado e troca numa operação só: leitores nunca veem o arquivo pela metade
+    caminho = os.path.join(pasta, MANIFESTO)
+    with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(versoes, f, ensure_ascii=False, indent=2)
+    os.replace(caminho + ".tmp", caminho)
+
+
+def listar_versoes(pasta=PASTA_VERSOES):
+    """Versões gravadas em `pasta` (uma linha por versão, da mais antiga à mais nova)"""
+    return pd.DataFrame(
+        _ler_manifesto(pasta),
+        columns=["numero", "arquivo", "gravada_em", "origem", "linhas", "assinatura", "colunas"],
+    )
+
+
+def _registro(pasta, numero):
+    for reg in _ler_manifesto(pasta):
+        if reg["numero"] == numero:
+            return reg
+    raise ValueError(f"versão {numero} não encontrada em {pasta}")
+
+
+@instrumentado()
+def gravar_versao(df, pasta=PASTA_VERSOES, origem=None):
+    """
+    Grava a base tratada como nova versão em `pasta` e devolve seu registro.
+
+    Só as colunas da planilha são guardadas (as derivadas saem de novo do
+    pipeline). Se o conteúdo for idêntico ao da última versão, nada é
+    gravado e o registro dela é devolvido.
+    """
+    import pyarrow.parquet as pq
+
+    colunas = [c for c in df.columns if c not in COLUNAS_DERIVADAS]
+    hashes = hash_linhas(df, colunas)
+    assinatura = f"{len(df)}-{int(hashes.sum(dtype=np.uint64)):016x}"
+
+    os.makedirs(pasta, exist_ok=True)
+    with _trava_manifesto:
+        versoes = _ler_manifesto(pasta)
+        if versoes and versoes[-1]["assinatura"] == assinatura and versoes[-1]["colunas"] == colunas:
+            return versoes[-1]
+
+        numero = versoes[-1]["numero"] + 1 if versoes else 1
+        arquivo = f"v{numero:04d}.parquet"
+        tabela = tabela_arrow(df[colunas].assign(**{COLUNA_CHAVE: chaves_linhas(df), COLUNA_HASH: hashes}))
+        caminho = os.path.join(pasta, arquivo)
+        pq.write_table(tabela, caminho + ".tmp", row_group_size=LINHAS_POR_GRUPO)
+        os.replace(caminho + ".tmp", caminho)
+
+        registro = {
+            "numero": numero,
+            "arquivo": arquivo,
+            "gravada_em": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "origem": str(origem) if origem is not None else None,
+            "linhas": len(df),
+            "assinatura": assinatura,
+            "colunas": colunas,
+        }
+        _gravar_manifesto(pasta, versoes + [registro])
+    return registro
+
+
+def ler_versao(numero, pasta=PASTA_VERSOES, colunas=None):
+    """Colunas da planilha (e a chave da linha) de uma versão gravada"""
+    import pyarrow.parquet as pq
+
+    reg = _registro(pasta, numero)
+    colunas = colunas or reg["colunas"] + [COLUNA_CHAVE]
+    return pq.read_table(os.path.join(pasta, reg["arquivo"]), columns=colunas).to_pandas()
+
+
+# -------------------------------------------------------------
+# DIFERENÇAS ENTRE VERSÕES
+# -------------------------------------------------------------
+def _ler_linhas(caminho, colunas, posicoes):
+    """Linhas nas `posicoes` de um Parquet, lendo só os grupos de linhas que as contêm"""
+    import pyarrow.parquet as pq
+
+    arquivo = pq.ParquetFile(caminho)
+    tamanhos = [arquivo.metadata.row_group(i).num_rows for i in range(arquivo.num_row_groups)]
+    inicios = np.r_[0, np.cumsum(tamanhos)].astype(np.int64)
+
+    grupo = np.searchsorted(inicios, posicoes, side="right") - 1
+    lidos = np.unique(grupo)
+    tabela = arquivo.read_row_groups(lidos.tolist(), columns=colunas)
+
+    # Início de cada grupo lido dentro da tabela (só com os grupos lidos)
+    inicio_lido = np.r_[0, np.cumsum(np.asarray(tamanhos, dtype=np.int64)[lidos])]
+    local = posicoes - inicios[grupo] + inicio_lido[np.searchsorted(lidos, grupo)]
+    return tabela.take(local).to_pandas()
+
+
+def _combinar(*codigos):
+    """Código inteiro de cada combinação de códigos (inteiros >= 0), sem colisões"""
+    combinado = np.zeros(len(codigos[0]), dtype=np.int64)
+    for codigo in codigos:
+        combinado, _ = pd.factorize(combinado * (int(codigo.max(initial=0)) + 1) + codigo)
+    return combinado
+
+
+def casar_linhas(antes, depois):
+    """
+    Posição em `antes` de cada linha de `depois` (-1 = linha nova).
+
+    `antes` e `depois` têm "Pedido", "ITEM", "Data / Mês" e o hash do
+    conteúdo (COLUNA_HASH). Par pedido-item único casa com o mesmo par.
+    Quando o par se repete, as linhas de conteúdo idêntico casam primeiro
+    (mesmo par e hash) e só as que sobram casam entre si pela ordem de
+    "Data / Mês", como a numeração de chaves_linhas. Assim uma linha nova,
+    removida ou com a data trocada no meio do par não renumera as outras
+    em alterações falsas.
+
+    Limite: se, no mesmo par, uma linha muda de conteúdo e outra entra ou
+    sai na mesma versão, as que sobram casam pela data e a mudança pode
+    cair na linha vizinha (uma alteração mais uma nova/removida do par em
+    vez da alteração certa).
+    """
+    n = len(antes)
+
+    def comuns(coluna):
+        """Códigos inteiros válidos nas duas versões (mesmo valor, mesmo código)"""
+        valores = np.concatenate([coluna(antes), coluna(depois)])
+        return pd.factorize(valores)[0]
+
+    par = _combinar(
+        comuns(lambda t: _texto_chave(t["Pedido"]).to_numpy(object)),
+        comuns(lambda t: _texto_chave(t["ITEM"]).to_numpy(object)),
+    )
+    conteudo = _combinar(par, comuns(lambda t: t[COLUNA_HASH].to_numpy()))
+
+    # 1) Conteúdo idêntico: mesmo par, mesmo hash (repetições idênticas casam em ordem)
+    chave = _combinar(conteudo, np.r_[_ocorrencias(conteudo[:n]), _ocorrencias(conteudo[n:])])
+    pos = pd.Index(chave[:n]).get_indexer(chave[n:])
+
+    # 2) O que sobrou de cada par casa pela ordem de data (linhas alteradas)
+    livre_a = np.ones(n, dtype=bool)
+    livre_a[pos[pos >= 0]] = False
+    resto_a, resto_d = np.flatnonzero(livre_a), np.flatnonzero(pos < 0)
+    if len(resto_a) and len(resto_d):
+        par_a, par_d = par[:n][resto_a], par[n:][resto_d]
+        chave = _combinar(
+            np.r_[par_a, par_d],
+            np.r_[_ocorrencias(par_a, _datas(antes)[resto_a]), _ocorrencias(par_d, _datas(depois)[resto_d])],
+        )
+        casado = pd.Index(chave[: len(resto_a)]).get_indexer(chave[len(resto_a):])
+        pos[resto_d[casado >= 0]] = resto_a[casado[casado >= 0]]
+    return pos
+
+
+def _campos_alterados(linhas_a, linhas_d, colunas):
+    """Uma linha por (chave, campo) cujo valor mudou entre as duas versões das linhas"""
+    partes = []
+    for col in colunas:
+        diferente = _hash_coluna(linhas_a[col]) != _hash_coluna(linhas_d[col])
+        if diferente.any():
+            partes.append(pd.DataFrame({
+                COLUNA_CHAVE: linhas_d[COLUNA_CHAVE].to_numpy()[diferente],
+                "Campo": col,
+                "Antes": linhas_a[col].to_numpy(object)[diferente],
+                "Depois": linhas_d[col].to_numpy(object)[diferente],
+            }))
+    if not partes:
+        return pd.DataFrame(columns=[COLUNA_CHAVE, "Campo", "Antes", "Depois"])
+    return pd.concat(partes, ignore_index=True)
+
+
+def _mudancas_campo(alteradas, campo, contexto):
+    """Mudanças de um campo, com cliente/representante/UF da versão nova"""
+    return (
+        alteradas[alteradas["Campo"] == campo]
+        .drop(columns="Campo")
+        .join(contexto, on=COLUNA_CHAVE)
+        .reset_index(drop=True)
+    )
+
+
+@instrumentado()
+def diferencas_versoes(antes, depois, pasta=PASTA_VERSOES):
+    """
+    O que mudou da versão `antes` para a versão `depois`.
+
+    As linhas das versões são casadas por casar_linhas (par pedido-item,
+    hash e data) e comparadas pelo hash do conteúdo; as colunas completas só são lidas dos grupos de linhas que
+    contêm linhas novas, removidas ou alteradas. Devolve:
+      "Resumo": dict de contagens e da variação de valor;
+      "Novas" / "Removidas": linhas só em uma das versões;
+      "Alteradas": uma linha por campo alterado (chave, campo, antes, depois);
+      "Status", "Novos Atrasos", "Revisões de Valor": recortes de
+      "Alteradas" acompanhados pelo comitê.
+    """
+    import pyarrow.parquet as pq
+
+    reg_a, reg_d = _registro(pasta, antes), _registro(pasta, depois)
+    caminho_a = os.path.join(pasta, reg_a["arquivo"])
+    caminho_d = os.path.join(pasta, reg_d["arquivo"])
+    colunas = [c for c in reg_d["colunas"] if c in set(reg_a["colunas"])]
+
+    ids = ["Pedido", "ITEM", "Data / Mês", COLUNA_HASH]
+    ids_a = pq.read_table(caminho_a, columns=ids).to_pandas()
+    ids_d = pq.read_table(caminho_d, columns=ids).to_pandas()
+    if sorted(reg_a["colunas"]) != sorted(reg_d["colunas"]):
+        # Planilhas com colunas diferentes: hash refeito só sobre as comuns
+        ids_a[COLUNA_HASH] = hash_linhas(pq.read_table(caminho_a, columns=colunas).to_pandas(), colunas)
+        ids_d[COLUNA_HASH] = hash_linhas(pq.read_table(caminho_d, columns=colunas).to_pandas(), colunas)
+
+    # Posição em `antes` de cada linha de `depois` (-1 = linha nova)
+    pos = casar_linhas(ids_a, ids_d)
+    nova = pos < 0
+    removida = np.ones(len(ids_a), dtype=bool)
+    removida[pos[~nova]] = False
+
+    comum_d = np.flatnonzero(~nova)
+    comum_a = pos[comum_d]
+    hash_a, hash_d = ids_a[COLUNA_HASH].to_numpy(), ids_d[COLUNA_HASH].to_numpy()
+    mudou = hash_a[comum_a] != hash_d[comum_d]
+    alt_a, alt_d = comum_a[mudou], comum_d[mudou]
+
+    # Linhas completas só das que entram no resultado
+    lidas = colunas + [COLUNA_CHAVE]
+    sel_a = np.r_[alt_a, np.flatnonzero(removida)].astype(np.int64)
+    sel_d = np.r_[alt_d, np.flatnonzero(nova)].astype(np.int64)
+    tab_a = _ler_linhas(caminho_a, lidas, sel_a)
+    tab_d = _ler_linhas(caminho_d, lidas, sel_d)
+    linhas_a, removidas = tab_a.iloc[: len(alt_a)], tab_a.iloc[len(alt_a):].reset_index(drop=True)
+    linhas_d, novas = tab_d.iloc[: len(alt_d)], tab_d.iloc[len(alt_d):].reset_index(drop=True)
+
+    alteradas = _campos_alterados(linhas_a, linhas_d, colunas)
+    contexto = linhas_d.set_index(COLUNA_CHAVE)[[c for c in COLUNAS_CONTEXTO if c in linhas_d.columns]]
+
+    status = _mudancas_campo(alteradas, COLUNA_STATUS, contexto)
+
+    atrasos = _mudancas_campo(alteradas, COLUNA_ATRASO, contexto)
+    virou_atraso = (
+        atrasos["Depois"].astype(str).str.contains("Atr", case=False, na=False)
+        & ~atrasos["Antes"].astype(str).str.contains("Atr", case=False, na=False)
+    )
+    atrasos = atrasos[virou_atraso].reset_index(drop=True)
+
+    valores = _mudancas_campo(alteradas, COLUNA_VALOR, contexto)
+    valores.insert(
+        3, "Diferença",
+        pd.to_numeric(valores["Depois"], errors="coerce") - pd.to_numeric(valores["Antes"], errors="coerce"),
+    )
+
+    resumo = {
+        "Linhas Antes": len(ids_a),
+        "Linhas Depois": len(ids_d),
+        "Novas": int(nova.sum()),
+        "Removidas": int(removida.sum()),
+        "Alteradas": int(mudou.sum()),
+        "Mudanças de Status": len(status),
+        "Novos Atrasos": len(atrasos),
+        "Revisões de Valor": len(valores),
+        "Variação de Valor": float(valores["Diferença"].sum()),
+    }
+
+    return {
+        "Resumo": resumo,
+        "Novas": novas,
+        "Removidas": removidas,
+        "Alteradas": alteradas,
+        "Status": status,
+        "Novos Atrasos": atrasos,
+        "Revisões de Valor": valores,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Versões da base Brasforma e diferenças entre elas")
+    parser.add_argument("--pasta", default=PASTA_VERSOES)
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    p_gravar = comandos.add_parser("gravar", help="grava a planilha como nova versão")
+    p_gravar.add_argument("excel")
+    p_gravar.add_argument("--aba", default="BD DASH")
+
+    comandos.add_parser("listar", help="lista as versões gravadas")
+
+    p_diff = comandos.add_parser("diff", help="o que mudou entre duas versões (padrão: as duas últimas)")
+    p_diff.add_argument("versoes", type=int, nargs="*")
+    p_diff.add_argument("--saida", help="Excel com uma aba por tabela de mudanças")
+    args = parser.parse_args()
+
+    if args.comando == "gravar":
+        reg = gravar_versao(load_brasforma(args.excel, args.aba), args.pasta, origem=args.excel)
+        print(f"Versão {reg['numero']} ({reg['linhas']} linhas) em {args.pasta}")
+
+    elif args.comando == "listar":
+        print(listar_versoes(args.pasta).drop(columns="colunas").to_string(index=False))
+
+    else:
+        if len(args.versoes) not in (0, 2):
+            parser.error("informe duas versões (antes depois) ou nenhuma")
+        numeros = listar_versoes(args.pasta)["numero"].tolist()
+        if not args.versoes and len(numeros) < 2:
+            parser.error("são necessárias ao menos duas versões gravadas")
+        antes, depois = args.versoes or numeros[-2:]
+
+        mudancas = diferencas_versoes(antes, depois, args.pasta)
+        for nome, valor in mudancas.pop("Resumo").items():
+            print(f"{nome}: {valor:,.2f}" if isinstance(valor, float) else f"{nome}: {valor}")
+        if args.saida:
+            with pd.ExcelWriter(args.saida) as writer:
+                for nome, tab in mudancas.items():
+                    tab.to_excel(writer, sheet_name=nome[:31], index=False)
+            print(f"Mudanças gravadas em {args.saida}")